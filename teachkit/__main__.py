@@ -1,6 +1,12 @@
 from classes.parser import CommandLineInterface
 from classes.group import Group
 from classes.student import Student
+from classes.session import Session
+from classes.material import Resource
+from classes.history import Log
+from classes.grades import Grade
+from classes.runner import Run
+from classes.pool import Groups
 from sys import argv
 
 
@@ -11,12 +17,17 @@ def main():
     target_class = cmd.target.title()
 
     try:
-        target = globals()[target_class]()
-        action = getattr(target, cmd.action)
-        action()
+        if cmd.get('groups', None):
+            Groups().execute()
+        else:
+            target = globals()[target_class]()
+            action = getattr(target, cmd.action)
+            action()
     except Exception as ex:
         cmd = ' '.join(argv)
         print(f'The execution ended unsatisfactorily.\n{ex}.')
 
 
-main()
+# Worker processes import this module again when they are spawned
+if __name__ == '__main__':
+    main()
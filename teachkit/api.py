@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+Programmatic API
+================
+Drives teachkit from Python without going through the command line. Every
+operation receives an explicit context, so a single process can work on
+many groups, each one with its own configuration, logger and store::
+
+    from teachkit.api import Group
+
+    with Group('/srv/classes/1dam') as group:
+        group.students.add(['Ada Lovelace', 'Alan Turing'])
+        group.resources.distribute()
+        status = group.resources.status('python', 'basics', 'EX001')
+"""
+
+from .classes.context import Context
+from .classes.group import Group as GroupOperations
+from .classes.student import Student
+from .classes.material import Resource
+from .classes.runner import ScriptRunner, TARGET_CLASSES
+
+from os import path
+
+
+class Group(object):
+    """
+    Existing group folder.
+
+    :param group_path: Group folder.
+    :param config: Config instance. A new one is loaded for the group when
+                   omitted.
+    :param logger: Logger instance. A new one logging to the group folder is
+                   created when omitted.
+    """
+
+    def __init__(self, group_path, config=None, logger=None):
+        self._context = Context(group_path, config=config, logger=logger)
+
+        self.students = StudentCollection(self)
+        self.resources = ResourceCollection(self)
+        self.sessions = SessionCollection(self)
+
+    @classmethod
+    def create(cls, group_path, name=None, config=None, logger=None):
+        """
+        Creates the folder structure of a new group.
+
+        :param group_path: Folder of the new group.
+        :param name: Display name of the group, the folder name by default.
+        :return: Group instance.
+        """
+
+        group_path = path.abspath(group_path)
+        arguments = {'directory': group_path, 'name': name}
+        context = Context(group_path, 'group', 'create', arguments, config,
+                          logger)
+        try:
+            GroupOperations(context).create()
+        finally:
+            context.close()
+
+        # The logger of the context has no log file, as the metadata folder
+        # did not exist yet, so a new one is built unless one was given
+        return cls(group_path, context.config, logger)
+
+    # -------------------------------------------------------------------------
+    # Properties
+    # -------------------------------------------------------------------------
+
+    @property
+    def path(self):
+        return self._context.cwd
+
+    @property
+    def context(self):
+        return self._context
+
+    @property
+    def config(self):
+        return self._context.config
+
+    @property
+    def logger(self):
+        return self._context.logger
+
+    # -------------------------------------------------------------------------
+    # Public methods
+    # -------------------------------------------------------------------------
+
+    def run(self, target, action, **arguments):
+        """
+        Runs any operation available in the command line.
+
+        :param target: Kind of object (``group``, ``student``, ...).
+        :param action: Verb (``list``, ``add``...) or method name.
+        :param arguments: Argument values, named as in the command line.
+        :return: Value returned by the operation.
+        """
+
+        if target not in TARGET_CLASSES:
+            raise ValueError(f'Unknown target "{target}".')
+
+        context = self._context.derive(target, action, **arguments)
+        operation = TARGET_CLASSES[target](context)
+
+        method = getattr(operation, context.action, None)
+        if method is None:
+            message = f'Unknown action "{action}" for target "{target}".'
+            raise ValueError(message)
+
+        return method()
+
+    def run_script(self, lines, workers=8):
+        """
+        Runs the lines of a teachkit script, starting in the group folder.
+
+        :param lines: Iterable with the lines of the script.
+        :param workers: Maximum number of operations running at once.
+        :return: List of ScriptLine with the outcome of every command.
+        """
+
+        return ScriptRunner(self.path, workers).run(lines)
+
+    def close(self):
+        """
+        Closes the group store and the log file. A logger given to the
+        constructor is left open because it may be shared with other groups.
+        """
+
+        self._context.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class StudentCollection(object):
+    """
+    Students enrolled in a group.
+    """
+
+    def __init__(self, group):
+        self._group = group
+
+    def names(self):
+        """
+        :return: Sorted list of student folder names.
+        """
+
+        context = self._group.context.derive('student', 'list')
+        return Student(context).student_paths
+
+    def add(self, names):
+        """
+        Enrolls several students.
+
+        :param names: Full names of the students.
+        :return: List with the folder name of each student.
+        """
+
+        return self._group.run('student', 'add', names=list(names))
+
+    def remove(self, names):
+        """
+        Removes several students and their folders.
+
+        :param names: Full names of the students.
+        """
+
+        for name in names:
+            self._group.run('student', 'del', name=name)
+
+    def get(self, property_name, students=None):
+        return self._group.run('student', 'get', property=property_name,
+                               students=students)
+
+    def set(self, property_name, value, students=None):
+        return self._group.run('student', 'set', property=property_name,
+                               value=value, students=students)
+
+    def activity(self, sort=None, reverse=False):
+        return self._group.run('student', 'activity', sort=sort,
+                               reverse=reverse)
+
+
+class ResourceCollection(object):
+    """
+    Resources of a group and their copies in the student folders.
+    """
+
+    def __init__(self, group):
+        self._group = group
+
+    def distribute(self, overwrite=False):
+        """
+        Copies the resources folder into every student folder.
+
+        :param overwrite: Replace files that already exist.
+        """
+
+        return self._group.run('student', 'update', force=overwrite)
+
+    def status(self, topic=None, category=None, exercise=None):
+        """
+        :return: Dictionary mapping each exercise to a dictionary that maps
+                 student folders to ``(status, files)``.
+        """
+
+        context = self._group.context.derive(
+            'resource', 'get', topic=topic, category=category,
+            exercise=exercise)
+        resource = Resource(context)
+
+        return resource.get_status(resource.student_paths)
+
+    def collect(self, topic, category, exercise, archive_format='zip',
+                output=None, incremental=False):
+        """
+        :return: Path of the archive.
+        """
+
+        return self._group.run('resource', 'collect', topic=topic,
+                               category=category, exercise=exercise,
+                               format=archive_format, output=output,
+                               incremental=incremental)
+
+
+class SessionCollection(object):
+    """
+    Dated session folders of a group.
+    """
+
+    def __init__(self, group):
+        self._group = group
+
+    def open(self, session_date=None, seed=None):
+        """
+        :return: Name of the session folder.
+        """
+
+        return self._group.run('session', 'open', date=session_date,
+                               seed=seed)
@@ -10,3 +10,7 @@ from . import config
 from . import logger
 from . import group
 from . import student
+from . import session
+from . import material
+from . import history
+from . import grades
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Archive writer
+==============
+Streams files into zip or tar archives. Small files are read ahead by a
+pool of threads while the archive is being written, keeping at most a fixed
+window of them in memory; large files are streamed straight from disk.
+"""
+
+from os import path, stat, makedirs, replace, remove
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from datetime import datetime
+from io import BytesIO
+from shutil import copyfileobj
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED
+import tarfile
+
+ARCHIVE_FORMATS = {
+    'zip': '.zip',
+    'tar': '.tar',
+    'tgz': '.tar.gz',
+}
+
+INLINE_SIZE = 4 * 1024 * 1024
+READ_AHEAD = 16
+
+
+class ArchiveWriter(object):
+    """
+    Writes an archive atomically: data goes to a temporary file that only
+    replaces the target once the archive is complete.
+
+    :param file_path: Path to the archive.
+    :param archive_format: One of ``zip``, ``tar`` or ``tgz``.
+    :param max_workers: Number of threads reading files ahead.
+    :param inline_size: Files up to this size are read ahead into memory.
+    :param read_ahead: Maximum number of files held in memory at once.
+    """
+
+    def __init__(self, file_path, archive_format='zip', max_workers=4,
+                 inline_size=INLINE_SIZE, read_ahead=READ_AHEAD):
+        if archive_format not in ARCHIVE_FORMATS:
+            message = f'Unsupported archive format "{archive_format}".'
+            raise ValueError(message)
+
+        self._file_path = file_path
+        self._temp_path = file_path + '.tmp'
+        self._format = archive_format
+        self._max_workers = max(int(max_workers or 1), 1)
+        self._inline_size = inline_size
+        self._read_ahead = max(int(read_ahead or 1), 1)
+
+        self._archive = None
+        self.files = 0
+        self.bytes = 0
+
+    # -------------------------------------------------------------------------
+    # Context manager
+    # -------------------------------------------------------------------------
+
+    def __enter__(self):
+        folder = path.dirname(path.abspath(self._file_path))
+        makedirs(folder, exist_ok=True)
+
+        if self._format == 'zip':
+            self._archive = ZipFile(self._temp_path, 'w', ZIP_DEFLATED)
+        elif self._format == 'tar':
+            self._archive = tarfile.open(self._temp_path, 'w')
+        else:
+            self._archive = tarfile.open(self._temp_path, 'w:gz')
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._archive.close()
+        self._archive = None
+
+        if exc_type is None:
+            replace(self._temp_path, self._file_path)
+        elif path.exists(self._temp_path):
+            remove(self._temp_path)
+
+        return False
+
+    # -------------------------------------------------------------------------
+    # Public methods
+    # -------------------------------------------------------------------------
+
+    def add_files(self, items):
+        """
+        Adds files to the archive, preserving the order of ``items``.
+
+        :param items: Iterable of ``(source_path, member_name)`` pairs.
+        :return: Number of files added.
+        """
+
+        added = 0
+        pending = deque()
+
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            for source_path, member_name in items:
+                task = executor.submit(self._read_ahead_file, source_path)
+                pending.append((source_path, member_name, task))
+
+                if len(pending) >= self._read_ahead:
+                    self._write_member(*pending.popleft())
+                    added += 1
+
+            while pending:
+                self._write_member(*pending.popleft())
+                added += 1
+
+        return added
+
+    # -------------------------------------------------------------------------
+    # Auxiliary methods
+    # -------------------------------------------------------------------------
+
+    def _read_ahead_file(self, source_path):
+        file_stat = stat(source_path)
+        if file_stat.st_size > self._inline_size:
+            return file_stat, None
+
+        with open(source_path, 'rb') as stream:
+            return file_stat, stream.read()
+
+    def _write_member(self, source_path, member_name, task):
+        file_stat, content = task.result()
+        member_name = member_name.replace('\\', '/')
+
+        if content is None:
+            with open(source_path, 'rb') as stream:
+                self._write_stream(member_name, file_stat, stream)
+        else:
+            self._write_stream(member_name, file_stat, BytesIO(content))
+
+        self.files += 1
+        self.bytes += file_stat.st_size
+
+    def _write_stream(self, member_name, file_stat, stream):
+        if self._format == 'zip':
+            mtime = datetime.fromtimestamp(file_stat.st_mtime)
+            if mtime.year < 1980:
+                mtime = datetime(1980, 1, 1)
+            info = ZipInfo(member_name, mtime.timetuple()[:6])
+            info.compress_type = ZIP_DEFLATED
+            info.external_attr = (file_stat.st_mode & 0xFFFF) << 16
+            info.file_size = file_stat.st_size
+            with self._archive.open(info, 'w', force_zip64=True) as target:
+                copyfileobj(stream, target, 1024 * 1024)
+        else:
+            info = tarfile.TarInfo(member_name)
+            info.size = file_stat.st_size
+            info.mtime = file_stat.st_mtime
+            info.mode = file_stat.st_mode & 0o7777
+            self._archive.addfile(info, stream)
@@ -1,19 +1,35 @@
-from .config import Config
-from .logger import Logger
-from .parser import CommandLineInterface
-
-from os import path, makedirs, system as exec_cmd, listdir
+from .context import Context
+from .logger import start_operation
+from .parser import METHOD_VERBS
+from .copier import FileCopier
+from .walker import TreeWalker
+from .names import NameIndex
+from .writer import get_writer
+from .engine import IOEngine
+from .scanner import TreeScanner
+
+from os import path, makedirs, system as exec_cmd, scandir, stat
 from shutil import rmtree
 from configparser import ConfigParser
+from io import StringIO
 from platform import system as get_osname
 from pathvalidate import sanitize_filename
 from re import sub as re_sub, match as re_match, IGNORECASE as RE_IGNORECASE
 from unidecode import unidecode
+from humanfriendly import parse_size, format_size
 
 MSG_NO_GROUP = 'The provided folder "%s" does not appear to belong to a group.'
 MSG_MISSING_FOLDER = 'The %s folder does not exist and will be created.'
 MSG_NO_STUDENTS_YET = 'There are no students in this group yet.'
 
+# Windows file attribute flags, as reported by os.stat().st_file_attributes
+FILE_ATTRIBUTES = {
+    'R': 0x01,
+    'H': 0x02,
+    'S': 0x04,
+    'A': 0x20,
+}
+
 
 class Base(object):
 
@@ -21,17 +37,30 @@ class Base(object):
     # Constructor
     # -------------------------------------------------------------------------
 
-    def __init__(self):
+    def __init__(self, context=None):
         self._os_name = get_osname()
 
-        self._cmd = CommandLineInterface()
-        self._cwd = self._cmd.cwd
+        # Without an explicit context the operation comes from sys.argv
+        if context is None:
+            context = Context.from_command_line()
+
+        self._context = context
+        self._cmd = context.arguments
+        self._cwd = context.cwd
 
-        self._config = Config()
-        self._logger = Logger()
+        self._config = context.config
+        self._logger = context.logger
 
-        # Only create group can be executed outside an existing group folder
-        if not(self.target == 'group' and self.action == 'create'):
+        # Records logged by this operation are tagged with its verb, group
+        # and counters
+        verb = METHOD_VERBS.get(self.action, self.action)
+        verb = ' '.join(item for item in (self.target, verb) if item)
+        self._operation = start_operation(verb, path.basename(self._cwd))
+
+        # Only create and restore group can be executed outside an existing
+        # group folder
+        if not(self.target == 'group'
+               and self.action in ('create', 'restore')):
             self.ensure_within_the_group(raise_exception=True)
 
         item_id = self.arguments.get('id', None)
@@ -40,7 +69,11 @@ class Base(object):
         else:
             self._id = None
 
+        self._force = bool(self.arguments.get('force', False))
+
         name = self.arguments.get('name', None)
+        if name is None and self.action in ('create', 'delete'):
+            name = self.arguments.get('directory', None)
         if name and isinstance(name, str) and len(name) > 0:
             self._name = name.strip()
         else:
@@ -60,6 +93,10 @@ class Base(object):
 
         return self._logger
 
+    @property
+    def context(self):
+        return self._context
+
     @property
     def arguments(self):
         return self._cmd
@@ -70,11 +107,11 @@ class Base(object):
 
     @property
     def target(self):
-        return self._cmd.target
+        return self._context.target
 
     @property
     def action(self):
-        return self._cmd.action
+        return self._context.action
 
     @property
     def group_path(self):
@@ -178,20 +215,48 @@ class Base(object):
 
         return folder_path
 
+    @property
+    def store(self):
+        """
+        Returns the group database, opening it on first use.
+
+        :return: Instance of GroupStore.
+        """
+
+        if self._context.store is None:
+            self._context.open_store(self.metadata_path)
+
+        return self._context.store
+
+    @property
+    def engine(self):
+        """
+        Returns the engine used to run file system calls concurrently.
+
+        :return: Instance of IOEngine.
+        """
+
+        if getattr(self, '_engine', None) is None:
+            concurrency = self.get_config_value('parallel', 'concurrency')
+            self._engine = IOEngine(concurrency)
+
+        return self._engine
+
     @property
     def student_paths(self):
         folders = []
 
-        sources = listdir(self.group_path)
-        if not sources:
-            self.info(MSG_NO_STUDENTS_YET, 'log')
-        else:
-            for index, source in enumerate(sorted(sources)):
-                full_path = path.abspath(path.join(self.group_path, source))
-                if path.isdir(full_path) and source[0].isalpha():
-                    folders.append(source)
+        # scandir reports the entry type along with the name, so no extra
+        # round trip per entry is needed on network shares
+        with scandir(self.group_path) as entries:
+            for entry in entries:
+                if entry.name[0].isalpha() and entry.is_dir():
+                    folders.append(entry.name)
+
+        if not folders:
+            self.info(MSG_NO_STUDENTS_YET)
 
-        return folders
+        return sorted(folders)
 
     # -------------------------------------------------------------------------
     # PRIVATE MAIN METHODS
@@ -213,13 +278,20 @@ class Base(object):
         for key, value in (kwargs or {}).items():
             config['.ShellClassInfo'][key] = value
 
+        buffer = StringIO()
+        config.write(buffer)
+
         file_path = path.join(base_path, 'desktop.ini')
         try:
-            self._execute_cmd_attrib(file_path, '-r -h -s')
-            with open(file_path, 'w') as configfile:
-                config.write(configfile)
-            self.info('The desktop.ini file was written to %s', base_path)
-            self._execute_cmd_attrib(file_path, '+h +s')
+            written = get_writer().write(
+                file_path, buffer.getvalue(),
+                before=lambda target: self._execute_cmd_attrib(
+                    target, '-r -h -s'),
+                after=lambda target: self._execute_cmd_attrib(
+                    target, '+h +s')
+            )
+            if written:
+                self.info('The desktop.ini file was written to %s', base_path)
         except OSError as ex:
             message = 'Failed to write %s. %s'
             self.exception(OSError, message, file_path, ex)
@@ -279,6 +351,10 @@ class Base(object):
     # Auxiliary methods
     # -------------------------------------------------------------------------
 
+    @staticmethod
+    def _print(message, *args):
+        print(message.format(*args) if args else message, flush=True)
+
     def _spaces(self, target):
         target = str(target or '')
         target = target.strip()
@@ -335,6 +411,170 @@ class Base(object):
             message = 'Failed to create %s. %s'
             self.exception(OSError, message, target_path, ex)
 
+    def _make_copier(self, progress=None, exclude=()):
+        chunk_size = self.get_config_value('copy', 'chunk_size')
+        chunk_size = parse_size(str(chunk_size))
+
+        verify = self.get_config_value('copy', 'verify')
+        resume = self.get_config_value('copy', 'resume')
+
+        if progress is None and self.get_config_value('copy', 'progress'):
+            progress = self._print_copy_progress
+
+        walker = self._make_walker(follow_symlinks=True, exclude=exclude)
+
+        return FileCopier(chunk_size=chunk_size, verify=verify, resume=resume,
+                          progress=progress, walker=walker)
+
+    def _make_walker(self, follow_symlinks=False, exclude=()):
+        hidden = self.get_config_value('walk', 'hidden')
+        include = self.get_config_value('walk', 'include')
+        excluded = self.get_config_value('walk', 'exclude')
+        excluded = self._split_patterns(excluded) + list(exclude)
+
+        return TreeWalker(hidden=hidden,
+                          include=self._split_patterns(include),
+                          exclude=excluded,
+                          follow_symlinks=follow_symlinks)
+
+    @staticmethod
+    def _split_patterns(value):
+        return [item.strip() for item in str(value or '').split(',')
+                if item.strip()]
+
+    def _get_selected_students(self):
+        folders = self.student_paths
+
+        selected = self.arguments.get('students', None)
+        if not selected:
+            return folders
+
+        unknown = set(selected).difference(folders)
+        if unknown:
+            message = 'Unknown students: %s.'
+            self.exception(ValueError, message, ', '.join(sorted(unknown)))
+
+        return [folder for folder in folders if folder in selected]
+
+    def _get_quotas(self, folders):
+        """
+        Returns the quota of every student in bytes, 0 meaning no quota. The
+        ``quota`` property of a student overrides the group default.
+        """
+
+        default = self._parse_quota(self.get_config_value('quota', 'student'))
+        values = self.store.get_property('quota', folders)
+
+        return {
+            folder: self._parse_quota(values[folder])
+            if values.get(folder) else default
+            for folder in folders
+        }
+
+    def _parse_quota(self, value):
+        try:
+            return parse_size(str(value or 0))
+        except Exception:
+            message = 'Invalid quota "%s" was ignored.'
+            self.warning(message, value)
+            return 0
+
+    def _check_quotas(self, folders, source, target=None, overwrite=False,
+                      exclude=()):
+        """
+        Leaves out the students whose folders would exceed their quota once
+        the contents of ``source`` are copied into them. Every command that
+        copies into the student folders calls it first.
+
+        :param folders: Student folder names.
+        :param source: Folder whose contents are going to be copied.
+        :param target: Folder inside every student folder the contents are
+                       copied to, the student folder itself by default.
+        :param overwrite: Whether the copy replaces existing files.
+        :param exclude: Glob patterns of the files left out of the copy.
+        :return: Student folder names that can receive the copy.
+        """
+
+        quotas = self._get_quotas(folders)
+        limited = [folder for folder in folders if quotas[folder]]
+        if not limited:
+            return folders
+
+        walker = self._make_walker(follow_symlinks=True, exclude=exclude)
+        files = [
+            (entry.relative, entry.stat().st_size)
+            for entry in walker.files(source)
+        ]
+
+        # The scanner stats every file, so files grown in place are counted
+        scanner = TreeScanner(self.group_path, self.store, self.engine,
+                              self._make_walker())
+        roots = [path.join(self.group_path, folder) for folder in limited]
+        summaries = scanner.summarize_many(roots)
+        growths = self.engine.map(
+            lambda root: self._get_growth(
+                path.join(root, target) if target else root, files,
+                overwrite),
+            roots)
+
+        rejected = set()
+        for folder, root, growth in zip(limited, roots, growths):
+            projected = summaries[root].size + growth
+            if projected > quotas[folder]:
+                rejected.add(folder)
+                message = ('Student "%s" would use %s bytes, over its quota '
+                           'of %s bytes. Nothing was copied.')
+                self.error(message, folder, projected, quotas[folder])
+
+        return [folder for folder in folders if folder not in rejected]
+
+    @staticmethod
+    def _get_growth(root, files, overwrite):
+        """
+        Bytes a folder would grow by receiving the given files.
+        """
+
+        growth = 0
+        for relative, size in files:
+            try:
+                current = stat(path.join(root, relative)).st_size
+            except OSError:
+                growth += size
+            else:
+                if overwrite:
+                    growth += size - current
+
+        return growth
+
+    def _get_name_index(self):
+        """
+        Returns the index of student names, up to date with the folders of
+        the group.
+        """
+
+        if getattr(self, '_name_index', None) is None:
+            similarity = self.get_config_value('naming', 'similarity')
+            index = NameIndex(self.store, similarity)
+            index.sync(self.student_paths)
+            self._name_index = index
+
+        return self._name_index
+
+    def _print_copy_progress(self, copied, total, source):
+        if copied == total:
+            self._count('files_copied')
+            self._count('bytes_copied', total)
+
+            message = 'Copied %s (%s)'
+            self.debug(message, source, format_size(total))
+
+    def _count(self, name, amount=1):
+        """
+        Adds to a counter of the operation, written with its log records.
+        """
+
+        self._operation.count(name, amount)
+
     def _rmtree(self, target_path):
         try:
             rmtree(target_path)
@@ -489,6 +729,9 @@ class Base(object):
                 message = 'Invalid attribute  %s.'
                 self.exception(Exception, message, attribute)
 
+        if self._has_attributes(target_path, attributes):
+            return 0
+
         attributes = ' '.join(attributes)
 
         if path.exists(target_path):
@@ -496,3 +739,29 @@ class Base(object):
             exit_code = self._execute_cmd(command, assert_success=True)
 
         return exit_code
+
+    @staticmethod
+    def _has_attributes(target_path, attributes):
+        """
+        Tells whether the target already has the requested attributes, so
+        that no ``attrib`` process needs to be spawned.
+
+        :param target_path: File or folder to check.
+        :param attributes: List of attributes like ``+h`` or ``-r``.
+        :return: True only if every attribute is known and already applied.
+        """
+
+        current = getattr(stat(target_path), 'st_file_attributes', None)
+        if current is None:
+            return False
+
+        for attribute in attributes:
+            flag = FILE_ATTRIBUTES.get(attribute[1].upper())
+            if flag is None:
+                return False
+
+            enabled = bool(current & flag)
+            if enabled != (attribute[0] == '+'):
+                return False
+
+        return True
@@ -1,11 +1,13 @@
 # -*- coding: utf-8 -*-
 from .parser import CommandLineInterface
+from .writer import get_writer
 
 from configparser import ConfigParser, NoOptionError, NoSectionError
 from os import getcwd, path, environ
+from io import StringIO
 
 _LOG_STREAM_FORMAT = '%(levelname)s - %(message)s'
-_LOG_FILE_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+_LOG_FILE_FORMAT = '%(asctime)s - %(verb)s - %(levelname)s - %(message)s'
 
 
 class Config(object):
@@ -17,6 +19,10 @@ class Config(object):
     _instance = None
 
     def __new__(cls, *args, **kwargs):
+        # An explicit group or argument set gets its own configuration
+        if args or kwargs:
+            return super().__new__(cls)
+
         if cls._instance is None:
             cls._instance = super().__new__(cls)
 
@@ -28,16 +34,26 @@ class Config(object):
 
     _app = None
 
-    def __init__(self):
+    def __init__(self, group_path=None, arguments=None):
+        """
+        Loads the configuration. Without arguments, the group folder and the
+        arguments are taken from the command line.
+
+        :param group_path: Group folder whose configuration is loaded.
+        :param arguments: Object with an ``args_dict`` property holding the
+                          argument values.
+        """
+
         if self._app is None:
+            if group_path is None and arguments is None:
+                cmd = CommandLineInterface()
+                group_path, arguments = cmd.cwd, cmd
+
             self._update_appfrom_defaults()
             self._udpate_from_app()
-
-            cmd = CommandLineInterface()
-            self._update_appfrom_group(cmd.cwd)
-
+            self._update_appfrom_group(group_path)
             self._update_appfrom_environment()
-            self._update_appfrom_command_line()
+            self._update_appfrom_command_line(arguments)
 
     # -------------------------------------------------------------------------
     # Properties
@@ -76,7 +92,56 @@ class Config(object):
                 'num_words': 32,
                 'min_word_length': 32,
                 'convert_case': 'lower',
-                'unidecode': True
+                'unidecode': True,
+                'similarity': 0.75,
+            },
+
+            'copy': {
+                'chunk_size': '1M',
+                'verify': False,
+                'resume': True,
+                'progress': False,
+            },
+
+            'quota': {
+                'student': '0',
+            },
+
+            'walk': {
+                'hidden': True,
+                'include': '',
+                'exclude': '',
+            },
+
+            'sync': {
+                'url': '',
+                'token': '',
+                'connections': 4,
+                'batch_size': 100,
+                'retries': 3,
+                'backoff': 0.5,
+                'timeout': 30,
+            },
+
+            'snapshot': {
+                'repository': '',
+                'chunk_size': '64K',
+            },
+
+            'variants': {
+                'seed': '',
+            },
+
+            'grades': {
+                'scale': 10,
+                'missing': 'ignore',
+                'decimals': 2,
+            },
+
+            'parallel': {
+                'workers': 8,
+                'concurrency': 16,
+                'processes': 4,
             },
 
             'stream_logging': {
@@ -90,6 +155,7 @@ class Config(object):
                 'file': 'teachkit.log',
                 'max_size': '10M',
                 'backup_count': '5',
+                'block_size': '256K',
                 'format': _LOG_FILE_FORMAT,
             }
 
@@ -108,7 +174,7 @@ class Config(object):
             self._load_from_ini(ini_path)
 
     def _update_appfrom_group(self, group_path=None):
-        base_path = group_path[:] or getcwd()
+        base_path = group_path or getcwd()
 
         ini_path = path.join(base_path, '.metadata', 'default.ini')
         ini_path = path.abspath(ini_path)
@@ -131,9 +197,8 @@ class Config(object):
                 if env_value is not None:
                     self._app[section][key] = env_value
 
-    def _update_appfrom_command_line(self):
-        cmd = CommandLineInterface()
-        args = cmd.args_dict
+    def _update_appfrom_command_line(self, arguments=None):
+        args = arguments.args_dict if arguments is not None else {}
 
         num_words = args.get('num_words', False)
         if isinstance(num_words, int) and num_words >= 0:
@@ -141,7 +206,7 @@ class Config(object):
 
         min_word_length = args.get('min_word_length', False)
         if isinstance(min_word_length, int) and min_word_length >= 0:
-            self.set_value('naming', 'min_word_length', num_words)
+            self.set_value('naming', 'min_word_length', min_word_length)
 
     # -------------------------------------------------------------------------
     # Access methods
@@ -213,6 +278,15 @@ class Config(object):
 
     @staticmethod
     def write_to_ini_file(ini_path, data):
+        """
+        Writes the given sections to an INI file. Nothing is written if the
+        file already has the same content.
+
+        :param ini_path: Path to the INI file.
+        :param data: Dictionary of sections, each one a dictionary of values.
+        :return: True if the file was written, False if it was unchanged.
+        """
+
         parser = ConfigParser(strict=False, interpolation=None)
 
         for section_name, section_data in (data or {}).items():
@@ -220,5 +294,7 @@ class Config(object):
             for key_name, key_value in (section_data or {}).items():
                 parser[section_name][key_name] = str(key_value)
 
-        with open(ini_path, 'w') as configfile:
-            parser.write(configfile)
+        buffer = StringIO()
+        parser.write(buffer)
+
+        return get_writer().write(ini_path, buffer.getvalue())
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Execution context
+=================
+Everything an operation needs to run: the group folder, the arguments of
+the operation, the configuration and the logger. The command line builds
+one from ``sys.argv``; programs using teachkit as a library build their own
+and can reuse the same configuration and logger for many operations.
+
+Contexts derived from another one share its configuration, logger and
+store, which belong to the first context and are closed along with it.
+"""
+
+from .config import Config
+from .logger import Logger
+from .parser import CommandLineInterface, VERB_METHODS
+from .store import GroupStore
+
+from os import path
+from threading import Lock
+
+
+class Arguments(object):
+    """
+    Operation arguments with the same interface as CommandLineInterface.
+
+    :param values: Dictionary of argument values.
+    """
+
+    def __init__(self, values=None):
+        self._values = dict(values or {})
+
+    @property
+    def args_dict(self):
+        return dict(self._values)
+
+    def get(self, name, default=None, raise_if_missing=False):
+        if raise_if_missing and name not in self._values:
+            raise AttributeError(f"Argument '{name}' does not exist.")
+
+        value = self._values.get(name, default)
+        return default if value is None else value
+
+    def exists(self, name):
+        return name in self._values
+
+
+class Context(object):
+    """
+    Execution context of an operation.
+
+    :param group_path: Group folder the operation works on.
+    :param target: Kind of object (``group``, ``student``, ``resource``...).
+    :param action: Method implementing the operation (``create``, ...).
+    :param arguments: Arguments object or dictionary of argument values.
+    :param config: Config instance. A new one is loaded for the group when
+                   omitted.
+    :param logger: Logger instance. A new one logging to the group folder is
+                   created when omitted.
+    :param store: GroupStore shared by the operations, opened on first use
+                  when omitted.
+    """
+
+    def __init__(self, group_path, target=None, action=None, arguments=None,
+                 config=None, logger=None, store=None):
+        self.cwd = path.abspath(group_path)
+        self.target = target
+        self.action = VERB_METHODS.get(action, action)
+
+        if arguments is None or isinstance(arguments, dict):
+            arguments = Arguments(arguments)
+        self.arguments = arguments
+
+        self.config = config or Config(self.cwd, arguments)
+        self.logger = logger or Logger(self.config, self.cwd)
+        self.store = store
+
+        self._owns_logger = logger is None
+        self._parent = None
+        self._lock = Lock()
+
+    # -------------------------------------------------------------------------
+    # Factories
+    # -------------------------------------------------------------------------
+
+    @classmethod
+    def from_command_line(cls):
+        """
+        Builds the context of the current process from ``sys.argv``, using
+        the process-wide configuration and logger.
+
+        :return: Context instance.
+        """
+
+        cmd = CommandLineInterface()
+        return cls(cmd.cwd, cmd.target, cmd.action, cmd, Config(), Logger())
+
+    def derive(self, target, action, **arguments):
+        """
+        Returns a context for another operation on the same group, sharing
+        the configuration, logger and store of this one.
+
+        :param target: Kind of object of the new operation.
+        :param action: Verb or method of the new operation.
+        :param arguments: Argument values of the new operation.
+        :return: Context instance.
+        """
+
+        context = Context(self.cwd, target, action, arguments, self.config,
+                          self.logger, self.store)
+        context._parent = self._parent or self
+
+        return context
+
+    # -------------------------------------------------------------------------
+    # Resources
+    # -------------------------------------------------------------------------
+
+    def open_store(self, metadata_path):
+        """
+        Returns the group store, opening it on first use. A derived context
+        opens it in the context it comes from, so every operation on the
+        group shares a single store.
+
+        :param metadata_path: Path to the group metadata folder.
+        :return: Instance of GroupStore.
+        """
+
+        root = self._parent or self
+        with root._lock:
+            if root.store is None:
+                root.store = GroupStore(metadata_path)
+
+        self.store = root.store
+        return self.store
+
+    def close(self):
+        """
+        Closes the store and, if this context created it, the logger. The
+        contexts derived from this one must not be used afterwards.
+        """
+
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+
+        if self._owns_logger:
+            self.logger.close()
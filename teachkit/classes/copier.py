@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+File copier
+===========
+Copies large files using the kernel-side primitives available on the
+platform (``copy_file_range``, ``sendfile``), falling back to a chunked
+read/write loop. Files are copied to a ``.part`` companion first, so an
+interrupted copy can be resumed and never leaves a truncated target behind.
+The size and modification time of the source are kept next to the partial
+file, and a copy is only resumed when the source still matches them.
+"""
+
+from os import path, makedirs, mkdir, replace, fstat, remove
+from shutil import copystat
+from hashlib import blake2b
+import os
+
+from .walker import TreeWalker
+
+PART_SUFFIX = '.part'
+PART_STATE_SUFFIX = '.part.src'
+CHUNK_SIZE = 1024 * 1024
+
+
+class FileCopier(object):
+    """
+    Copies files and folder trees reporting byte-level progress.
+
+    :param chunk_size: Maximum number of bytes moved on each system call.
+    :param verify: Compare source and target digests after each copy.
+    :param resume: Continue from an existing ``.part`` file if present.
+    :param progress: Callable receiving ``(copied, total, source_path)``.
+    :param walker: TreeWalker selecting the files copied by ``copy_tree``.
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE, verify=False, resume=True,
+                 progress=None, walker=None):
+        self._chunk_size = max(int(chunk_size or CHUNK_SIZE), 4096)
+        self._verify = verify
+        self._resume = resume
+        self._progress = progress
+        self._walker = walker or TreeWalker(follow_symlinks=True)
+
+        self._use_copy_file_range = hasattr(os, 'copy_file_range')
+        self._use_sendfile = hasattr(os, 'sendfile')
+
+    # -------------------------------------------------------------------------
+    # Public methods
+    # -------------------------------------------------------------------------
+
+    def copy_file(self, source, target):
+        """
+        Copies a single file, preserving its metadata.
+
+        :param source: Path to the source file.
+        :param target: Path to the target file.
+        :return: Number of bytes written in this call (excludes resumed data).
+        :raises OSError: If the copy fails or the verification does not match.
+        """
+
+        part_path = target + PART_SUFFIX
+        state_path = target + PART_STATE_SUFFIX
+
+        with open(source, 'rb') as fsrc:
+            source_stat = fstat(fsrc.fileno())
+            total = source_stat.st_size
+            state = f'{total} {source_stat.st_mtime_ns}'
+
+            offset = self._get_resume_offset(part_path, state_path, state,
+                                             total)
+            if not offset:
+                with open(state_path, 'w', encoding='utf-8') as stream:
+                    stream.write(state)
+
+            mode = 'r+b' if offset else 'wb'
+            with open(part_path, mode) as fdst:
+                fdst.truncate(offset)
+                written = self._transfer(fsrc, fdst, offset, total, source)
+
+        if self._verify and self._digest(source) != self._digest(part_path):
+            self._discard(part_path, state_path)
+            message = f'Verification failed copying "{source}" to "{target}".'
+            raise OSError(message)
+
+        copystat(source, part_path)
+        replace(part_path, target)
+        self._discard(state_path)
+
+        return written
+
+    def copy_tree(self, source, target, overwrite=False):
+        """
+        Copies the contents of ``source`` into ``target``, merging with any
+        existing folders. Only the files selected by the walker are copied,
+        so ``desktop.ini`` files are never copied by default.
+
+        :param source: Source folder.
+        :param target: Target folder, created when missing.
+        :param overwrite: Replace files that already exist in the target.
+        :return: Total number of bytes written.
+        """
+
+        makedirs(target, exist_ok=True)
+
+        # Folder dates are copied once nothing else will be written in them
+        def copy_folder_stat(entry):
+            copystat(entry.path, path.join(target, entry.relative))
+
+        written = 0
+        entries = self._walker.walk(source, on_leave=copy_folder_stat)
+
+        for entry in entries:
+            dst_path = path.join(target, entry.relative)
+
+            if entry.is_dir:
+                if not path.isdir(dst_path):
+                    mkdir(dst_path)
+            elif entry.name.endswith((PART_SUFFIX, PART_STATE_SUFFIX)):
+                continue
+            elif overwrite or not path.exists(dst_path):
+                written += self.copy_file(entry.path, dst_path)
+
+        copystat(source, target)
+
+        return written
+
+    # -------------------------------------------------------------------------
+    # Transfer strategies
+    # -------------------------------------------------------------------------
+
+    def _transfer(self, fsrc, fdst, offset, total, source):
+        start = offset
+        self._notify(offset, total, source)
+
+        if offset < total and self._use_copy_file_range:
+            offset = self._copy_file_range(fsrc, fdst, offset, total, source)
+
+        if offset < total and self._use_sendfile:
+            offset = self._sendfile(fsrc, fdst, offset, total, source)
+
+        if offset < total:
+            offset = self._chunked(fsrc, fdst, offset, total, source)
+
+        return offset - start
+
+    def _copy_file_range(self, fsrc, fdst, offset, total, source):
+        """
+        Copies using ``copy_file_range``. When the primitive is not supported
+        for this pair of files the strategy is disabled and the offset reached
+        so far is returned, so the next strategy can go on from there.
+        """
+
+        src_fd, dst_fd = fsrc.fileno(), fdst.fileno()
+
+        while offset < total:
+            count = min(self._chunk_size, total - offset)
+            try:
+                sent = os.copy_file_range(
+                    src_fd, dst_fd, count, offset, offset)
+            except OSError:
+                self._use_copy_file_range = False
+                return offset
+
+            if sent == 0:
+                break
+
+            offset += sent
+            self._notify(offset, total, source)
+
+        return offset
+
+    def _sendfile(self, fsrc, fdst, offset, total, source):
+        src_fd, dst_fd = fsrc.fileno(), fdst.fileno()
+        fdst.seek(offset)
+
+        while offset < total:
+            count = min(self._chunk_size, total - offset)
+            try:
+                sent = os.sendfile(dst_fd, src_fd, offset, count)
+            except OSError:
+                self._use_sendfile = False
+                return offset
+
+            if sent == 0:
+                break
+
+            offset += sent
+            self._notify(offset, total, source)
+
+        return offset
+
+    def _chunked(self, fsrc, fdst, offset, total, source):
+        fsrc.seek(offset)
+        fdst.seek(offset)
+
+        buffer = bytearray(self._chunk_size)
+        view = memoryview(buffer)
+
+        while True:
+            read = fsrc.readinto(buffer)
+            if not read:
+                break
+
+            fdst.write(view[:read])
+            offset += read
+            self._notify(offset, total, source)
+
+        return offset
+
+    # -------------------------------------------------------------------------
+    # Auxiliary methods
+    # -------------------------------------------------------------------------
+
+    def _get_resume_offset(self, part_path, state_path, state, total):
+        """
+        Returns the size of the partial file when it can be resumed: it was
+        started from a source with the same size and modification time, and
+        it is not longer than the source. Otherwise the partial file is
+        discarded and the copy starts over.
+        """
+
+        if self._resume and path.exists(part_path):
+            try:
+                with open(state_path, 'r', encoding='utf-8') as stream:
+                    saved = stream.read().strip()
+            except OSError:
+                saved = None
+
+            offset = path.getsize(part_path)
+            if saved == state and offset <= total:
+                return offset
+
+        self._discard(part_path, state_path)
+        return 0
+
+    @staticmethod
+    def _discard(*file_paths):
+        for file_path in file_paths:
+            if path.exists(file_path):
+                remove(file_path)
+
+    def _notify(self, copied, total, source):
+        if self._progress:
+            self._progress(copied, total, source)
+
+    def _digest(self, file_path):
+        digest = blake2b()
+
+        with open(file_path, 'rb') as stream:
+            while True:
+                chunk = stream.read(self._chunk_size)
+                if not chunk:
+                    break
+                digest.update(chunk)
+
+        return digest.hexdigest()
@@ -0,0 +1,515 @@
+# -*- coding: utf-8 -*-
+"""
+Cover pages
+===========
+Renders the cover pages of a group and its students as PDF. A template is a
+text file where ``# `` starts a title, ``## `` a subtitle and ``$name``
+placeholders are replaced by the values of each page::
+
+    # $name
+    ## $group
+    Folder: $folder
+
+Templates are compiled once and pages are rendered concurrently. The drawing
+instructions of every page are cached in the group database along with a
+digest of the template and of the values the template actually uses, so
+only the pages whose data changed are rendered again.
+
+Pages use the standard PDF fonts, which only cover Windows-1252. Other
+characters are drawn as ``?`` and reported, so they can be reviewed.
+"""
+
+from .writer import get_writer
+
+from os import path, makedirs
+from collections import namedtuple
+from configparser import ConfigParser
+from datetime import date
+from hashlib import blake2b
+from string import Template
+from zlib import compress
+
+DEFAULT_STUDENT_TEMPLATE = '''
+# $name
+## $group
+
+Folder: $folder
+'''
+
+DEFAULT_GROUP_TEMPLATE = '''
+# $name
+## $code
+
+Students: $students
+'''
+
+# A4 in points
+PAGE_WIDTH = 595
+PAGE_HEIGHT = 842
+PAGE_MARGIN = 72
+
+# Line prefix: (font resource, font size)
+LINE_STYLES = {
+    '# ': ('F2', 28),
+    '## ': ('F2', 18),
+    '': ('F1', 14),
+}
+
+LINE_SPACING = 1.4
+
+# Changing how pages are drawn must change this, so cached pages are dropped
+RENDER_VERSION = 1
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cover_page (
+    page TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    content BLOB NOT NULL
+) WITHOUT ROWID;
+'''
+
+CoverPage = namedtuple('CoverPage', ['key', 'template', 'values'])
+
+
+def read_group_values(config_path, group_path, students):
+    """
+    Returns the values available to the cover templates: the group
+    properties from ``group.ini``, the number of students and the date.
+
+    :param config_path: Configuration folder of the group.
+    :param group_path: Group folder, whose name is the default group name.
+    :param students: Number of students.
+    :return: Dictionary of values.
+    """
+
+    parser = ConfigParser(strict=False, interpolation=None)
+    parser.read(path.join(config_path, 'group.ini'), encoding='utf-8')
+
+    values = {'name': path.basename(group_path), 'code': '', 'id': ''}
+    if parser.has_section('group'):
+        values.update(parser['group'])
+
+    values['students'] = students
+    values['date'] = date.today().isoformat()
+
+    return values
+
+
+def unsupported_characters(text):
+    """
+    :return: Sorted characters of the text the standard PDF fonts cannot
+             draw.
+    """
+
+    try:
+        text.encode('cp1252')
+        return []
+    except UnicodeEncodeError:
+        pass
+
+    characters = []
+    for char in sorted(set(text)):
+        try:
+            char.encode('cp1252')
+        except UnicodeEncodeError:
+            characters.append(char)
+
+    return characters
+
+
+def _escape(text):
+    """
+    Encodes text for the standard PDF fonts, whose WinAnsi encoding is almost
+    Windows-1252, and escapes it as a literal string.
+    """
+
+    data = text.encode('cp1252', errors='replace')
+    text = data.decode('latin-1')
+
+    return text.replace('\\', '\\\\').replace('(', '\\(') \
+        .replace(')', '\\)')
+
+
+class _Values(dict):
+    """
+    Placeholder values. Unknown placeholders are left blank.
+    """
+
+    def __missing__(self, key):
+        return ''
+
+
+class CoverTemplate(object):
+    """
+    Template compiled once and rendered for many pages.
+
+    :param source: Template text.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self._template = Template(source)
+
+        self.identifiers = tuple(sorted({
+            match.group('named') or match.group('braced')
+            for match in self._template.pattern.finditer(source)
+            if match.group('named') or match.group('braced')
+        }))
+
+    def digest(self, values):
+        """
+        Identifies the page rendered with the given values. Values the
+        template does not use are left out, so changing them never renders
+        the page again.
+
+        :param values: Dictionary of placeholder values.
+        :return: Hexadecimal digest.
+        """
+
+        digest = blake2b(self.source.encode('utf-8'), digest_size=16,
+                         salt=b'%d' % RENDER_VERSION)
+        for identifier in self.identifiers:
+            value = str(values.get(identifier, ''))
+            digest.update(b'\0' + identifier.encode('utf-8'))
+            digest.update(b'\0' + value.encode('utf-8'))
+
+        return digest.hexdigest()
+
+    def render(self, values):
+        """
+        :param values: Dictionary of placeholder values.
+        :return: Drawing instructions of the page, compressed.
+        """
+
+        text = self.text(values)
+
+        commands = []
+        top = PAGE_HEIGHT - PAGE_MARGIN
+        for line in text.strip('\n').splitlines():
+            prefix = '# ' if line.startswith('# ') else \
+                '## ' if line.startswith('## ') else ''
+            font, size = LINE_STYLES[prefix]
+
+            top -= size * LINE_SPACING
+            if top < PAGE_MARGIN:
+                break
+
+            content = line[len(prefix):].strip()
+            if content:
+                commands.append(
+                    f'BT /{font} {size} Tf {PAGE_MARGIN} {top:.1f} Td '
+                    f'({_escape(content)}) Tj ET')
+
+        return compress('\n'.join(commands).encode('latin-1'))
+
+    def text(self, values):
+        """
+        :param values: Dictionary of placeholder values.
+        :return: Template text with the placeholders replaced.
+        """
+
+        return self._template.safe_substitute(_Values(
+            (key, str(value)) for key, value in values.items()))
+
+
+class CoverRenderer(object):
+    """
+    Renders cover pages, reusing the pages cached in the group database.
+
+    :param store: GroupStore holding the cache, or None to render every page.
+    :param engine: IOEngine used to render the pages concurrently.
+    """
+
+    def __init__(self, store=None, engine=None):
+        self._store = store
+        self._engine = engine
+
+        self.rendered = 0
+        self.cached = 0
+
+        # Characters drawn as "?", by page key
+        self.unsupported = {}
+
+    # -------------------------------------------------------------------------
+    # Public methods
+    # -------------------------------------------------------------------------
+
+    def render(self, pages):
+        """
+        Returns the drawing instructions of every page, rendering only the
+        pages missing from the cache or whose digest changed.
+
+        :param pages: List of CoverPage.
+        :return: List of ``(digest, content, changed)``, one for each page.
+        """
+
+        digests = [page.template.digest(page.values) for page in pages]
+        cached = self._load([page.key for page in pages])
+
+        misses = [
+            index for index, (page, digest) in enumerate(zip(pages, digests))
+            if cached.get(page.key, (None,))[0] != digest
+        ]
+
+        def render_page(index):
+            page = pages[index]
+            return page.template.render(page.values)
+
+        if self._engine is not None:
+            contents = self._engine.map(render_page, misses)
+        else:
+            contents = [render_page(index) for index in misses]
+
+        rendered = dict(zip(misses, contents))
+        self._save([
+            (pages[index].key, digests[index], content)
+            for index, content in rendered.items()
+        ])
+
+        self.rendered += len(misses)
+        self.cached += len(pages) - len(misses)
+
+        for page in pages:
+            characters = unsupported_characters(page.template.text(page.values))
+            if characters:
+                self.unsupported[page.key] = characters
+
+        return [
+            (digest, rendered[index], True) if index in rendered
+            else (digest, cached[page.key][1], False)
+            for index, (page, digest) in enumerate(zip(pages, digests))
+        ]
+
+    @staticmethod
+    def build_pdf(contents, title=None):
+        """
+        Builds a PDF document with one page for each content stream.
+
+        :param contents: Compressed drawing instructions of each page.
+        :param title: Document title.
+        :return: Bytes of the document.
+        """
+
+        # Objects 1 and 2 are the catalog and the page tree, 3 and 4 the
+        # fonts, 5 the document information, and then a page and its
+        # content stream for every page
+        first_page = 6
+        page_ids = [first_page + 2 * index for index in range(len(contents))]
+
+        objects = [
+            b'<< /Type /Catalog /Pages 2 0 R >>',
+            b'<< /Type /Pages /Kids [' + b' '.join(
+                b'%d 0 R' % page_id for page_id in page_ids
+            ) + b'] /Count %d >>' % len(page_ids),
+            b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica '
+            b'/Encoding /WinAnsiEncoding >>',
+            b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold '
+            b'/Encoding /WinAnsiEncoding >>',
+            b'<< /Producer (teachkit) /Title (' +
+            _escape(title or '').encode('latin-1') + b') >>',
+        ]
+
+        for page_id, content in zip(page_ids, contents):
+            objects.append(
+                b'<< /Type /Page /Parent 2 0 R '
+                b'/MediaBox [0 0 %d %d] ' % (PAGE_WIDTH, PAGE_HEIGHT) +
+                b'/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> '
+                b'/Contents %d 0 R >>' % (page_id + 1)
+            )
+            objects.append(
+                b'<< /Length %d /Filter /FlateDecode >>\nstream\n'
+                % len(content) + content + b'\nendstream'
+            )
+
+        chunks = [b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n']
+        offsets = []
+        position = len(chunks[0])
+        for number, body in enumerate(objects, start=1):
+            chunk = b'%d 0 obj\n' % number + body + b'\nendobj\n'
+            offsets.append(position)
+            chunks.append(chunk)
+            position += len(chunk)
+
+        xref = [b'xref\n0 %d\n' % (len(objects) + 1), b'0000000000 65535 f \n']
+        xref.extend(b'%010d 00000 n \n' % offset for offset in offsets)
+        chunks.extend(xref)
+        chunks.append(
+            b'trailer\n<< /Size %d /Root 1 0 R /Info 5 0 R >>\n'
+            % (len(objects) + 1) + b'startxref\n%d\n%%%%EOF\n' % position
+        )
+
+        return b''.join(chunks)
+
+    # -------------------------------------------------------------------------
+    # Auxiliary methods
+    # -------------------------------------------------------------------------
+
+    def _load(self, keys):
+        if self._store is None or not keys:
+            return {}
+
+        self._store.ensure_schema(_SCHEMA)
+        rows = self._store.connection.execute(
+            'SELECT page, digest, content FROM cover_page')
+
+        wanted = set(keys)
+        return {
+            key: (digest, content) for key, digest, content in rows
+            if key in wanted
+        }
+
+    def _save(self, rows):
+        if self._store is None or not rows:
+            return
+
+        with self._store.transaction() as connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO cover_page (page, digest, content) '
+                'VALUES (?, ?, ?)', rows
+            )
+
+
+class CoverBook(object):
+    """
+    Cover pages of a group: loads its templates, builds the pages of the
+    group and its students and writes them as PDF documents.
+
+    :param config_path: Configuration folder of the group, where
+                        ``cover_group.txt`` and ``cover_student.txt`` replace
+                        the default templates.
+    :param covers_path: Folder the documents are written to by default.
+    :param store: GroupStore holding the cache of rendered pages.
+    :param engine: IOEngine used to render and write the pages concurrently.
+    """
+
+    def __init__(self, config_path, covers_path, store=None, engine=None):
+        self._config_path = config_path
+        self._covers_path = covers_path
+        self._engine = engine
+
+        self.renderer = CoverRenderer(store, engine)
+
+    # -------------------------------------------------------------------------
+    # Pages
+    # -------------------------------------------------------------------------
+
+    def template(self, kind):
+        """
+        Loads the ``cover_<kind>.txt`` template from the group configuration
+        folder, or the default one.
+
+        :param kind: ``group`` or ``student``.
+        :return: Instance of CoverTemplate.
+        """
+
+        file_path = path.join(self._config_path, f'cover_{kind}.txt')
+        if path.exists(file_path):
+            with open(file_path, 'r', encoding='utf-8') as stream:
+                return CoverTemplate(stream.read())
+
+        if kind == 'group':
+            return CoverTemplate(DEFAULT_GROUP_TEMPLATE)
+
+        return CoverTemplate(DEFAULT_STUDENT_TEMPLATE)
+
+    def group_page(self, group_values):
+        """
+        :param group_values: Result of ``read_group_values``.
+        :return: CoverPage of the group.
+        """
+
+        return CoverPage('group', self.template('group'), group_values)
+
+    def student_pages(self, folders, group_values, names, properties):
+        """
+        :param folders: Student folders.
+        :param group_values: Result of ``read_group_values``.
+        :param names: Dictionary mapping folders to student names.
+        :param properties: Dictionary mapping folders to their properties.
+        :return: List of CoverPage, one for each student.
+        """
+
+        template = self.template('student')
+
+        pages = []
+        for folder in folders:
+            values = {
+                'group': group_values['name'],
+                'code': group_values['code'],
+                'date': group_values['date'],
+            }
+            values.update(properties.get(folder, {}))
+            values['folder'] = folder
+            values['name'] = names.get(folder) \
+                or folder.replace('_', ' ').title()
+
+            pages.append(CoverPage(folder, template, values))
+
+        return pages
+
+    # -------------------------------------------------------------------------
+    # Documents
+    # -------------------------------------------------------------------------
+
+    def output_path(self, file_name, output=None, separate=False):
+        """
+        :param file_name: Name of the single document, without extension.
+        :param output: Path given by the user, if any.
+        :param separate: Whether every page goes to a document of its own.
+        :return: Path of the document, or folder of the documents when
+                 ``separate``.
+        """
+
+        if output:
+            return path.abspath(output)
+
+        if separate:
+            return self._covers_path
+
+        return path.join(self._covers_path, f'{file_name}.pdf')
+
+    def write(self, pages, output, separate=False, title=None):
+        """
+        Renders the pages and writes them as a single PDF document, or as
+        one document per page when ``separate``. Only the pages whose data
+        changed are rendered, and only the files that changed are written.
+
+        :param pages: List of CoverPage.
+        :param output: Result of ``output_path``.
+        :param title: Title of the single document.
+        :return: List with the paths of the documents.
+        """
+
+        makedirs(output if separate else path.dirname(output), exist_ok=True)
+
+        renderer = self.renderer
+        results = renderer.render(pages)
+        writer = get_writer()
+
+        if not separate:
+            document = renderer.build_pdf(
+                [content for _, content, _ in results], title=title)
+            writer.write(output, document)
+            return [output]
+
+        file_paths = [path.join(output, f'{page.key}.pdf') for page in pages]
+        jobs = [
+            (file_path, page, content)
+            for file_path, page, (_, content, changed)
+            in zip(file_paths, pages, results)
+            if changed or not path.exists(file_path)
+        ]
+
+        def write_page(job):
+            file_path, page, content = job
+            return writer.write(
+                file_path, renderer.build_pdf([content], title=page.key))
+
+        with writer.batch():
+            if self._engine is not None:
+                self._engine.map(write_page, jobs)
+            else:
+                for job in jobs:
+                    write_page(job)
+
+        return file_paths
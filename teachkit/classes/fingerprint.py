@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""
+Fingerprint cache
+=================
+Keeps a fast checksum (CRC-32) and a strong digest (BLAKE2b) for every file
+hashed in the group, keyed by device and inode and validated by size and
+modification time. Unchanged files are never read again, and the files that
+must be hashed are read through memory maps by a pool of threads. After
+looking up every file of the group, the fingerprints of the files that were
+not seen, deleted or renamed since, can be pruned.
+"""
+
+from os import stat
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import blake2b
+from mmap import mmap, ACCESS_READ
+from threading import Lock
+from zlib import crc32
+
+HASH_BLOCK_SIZE = 8 * 1024 * 1024
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS fingerprint (
+    device INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    fast INTEGER NOT NULL,
+    strong TEXT NOT NULL,
+    PRIMARY KEY (device, inode)
+) WITHOUT ROWID;
+'''
+
+Fingerprint = namedtuple('Fingerprint', ['size', 'mtime_ns', 'fast', 'strong'])
+
+
+class FingerprintCache(object):
+    """
+    Persistent cache of file fingerprints stored in the group database.
+
+    :param store: GroupStore used to persist the fingerprints, or None to
+                  keep them only in memory.
+    :param max_workers: Number of files hashed at the same time.
+    """
+
+    def __init__(self, store=None, max_workers=8):
+        self._store = store
+        self._max_workers = max(int(max_workers or 1), 1)
+
+        self._cache = None
+        self._updates = {}
+        self._seen = set()
+        self._lock = Lock()
+
+    # -------------------------------------------------------------------------
+    # Public methods
+    # -------------------------------------------------------------------------
+
+    def get(self, file_path, file_stat=None):
+        """
+        Returns the fingerprint of a file, hashing it only if it changed.
+
+        :param file_path: Path to the file.
+        :param file_stat: Result of os.stat for the file, if already known.
+        :return: Fingerprint of the file.
+        """
+
+        file_stat = file_stat or stat(file_path)
+
+        fingerprint = self.lookup(file_stat)
+        if fingerprint is None:
+            fingerprint = self._hash(file_path, file_stat)
+
+        return fingerprint
+
+    def get_many(self, items):
+        """
+        Returns the fingerprints of several files. Cached ones are resolved
+        right away and the rest are hashed in the worker pool.
+
+        :param items: Iterable of paths or ``(path, stat_result)`` pairs.
+        :return: Dictionary mapping each path to its Fingerprint.
+        """
+
+        result = {}
+        misses = []
+
+        for item in items:
+            file_path, file_stat = item if isinstance(item, tuple) \
+                else (item, stat(item))
+
+            fingerprint = self.lookup(file_stat)
+            if fingerprint is None:
+                misses.append((file_path, file_stat))
+            else:
+                result[file_path] = fingerprint
+
+        if len(misses) == 1:
+            file_path, file_stat = misses[0]
+            result[file_path] = self._hash(file_path, file_stat)
+        elif misses:
+            with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+                hashed = executor.map(lambda miss: self._hash(*miss), misses)
+                for (file_path, file_stat), fingerprint in zip(misses, hashed):
+                    result[file_path] = fingerprint
+
+        return result
+
+    def lookup(self, file_stat):
+        """
+        Returns the cached fingerprint for a stat result, without hashing.
+
+        :param file_stat: Result of os.stat for the file.
+        :return: Fingerprint, or None if unknown or stale.
+        """
+
+        self._load()
+
+        # Some network file systems report no inode numbers at all
+        if not file_stat.st_ino:
+            return None
+
+        key = (file_stat.st_dev, file_stat.st_ino)
+        self._seen.add(key)
+        fingerprint = self._cache.get(key)
+
+        if fingerprint is None \
+                or fingerprint.size != file_stat.st_size \
+                or fingerprint.mtime_ns != file_stat.st_mtime_ns:
+            return None
+
+        return fingerprint
+
+    def save(self):
+        """
+        Persists the fingerprints computed since the last call in a single
+        transaction.
+        """
+
+        with self._lock:
+            updates, self._updates = self._updates, {}
+
+        if not updates or self._store is None:
+            return
+
+        rows = [
+            (device, inode, item.size, item.mtime_ns, item.fast, item.strong)
+            for (device, inode), item in updates.items()
+        ]
+
+        with self._store.transaction() as connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO fingerprint '
+                '(device, inode, size, mtime_ns, fast, strong) '
+                'VALUES (?, ?, ?, ?, ?, ?)', rows
+            )
+
+    def prune(self):
+        """
+        Removes the fingerprints of every file not looked up since the cache
+        was created. Only call it after looking up every file of the group,
+        so the ones removed belong to files deleted, renamed or no longer
+        compared.
+
+        :return: Number of fingerprints removed.
+        """
+
+        self._load()
+
+        with self._lock:
+            stale = [key for key in self._cache if key not in self._seen]
+            for key in stale:
+                del self._cache[key]
+                self._updates.pop(key, None)
+
+        if stale and self._store is not None:
+            with self._store.transaction() as connection:
+                connection.executemany(
+                    'DELETE FROM fingerprint WHERE device = ? AND inode = ?',
+                    stale
+                )
+
+        return len(stale)
+
+    # -------------------------------------------------------------------------
+    # Auxiliary methods
+    # -------------------------------------------------------------------------
+
+    def _hash(self, file_path, file_stat):
+        fast, strong = self.hash_file(file_path, file_stat.st_size)
+        fingerprint = Fingerprint(
+            file_stat.st_size, file_stat.st_mtime_ns, fast, strong)
+
+        if not file_stat.st_ino:
+            return fingerprint
+
+        key = (file_stat.st_dev, file_stat.st_ino)
+        with self._lock:
+            self._cache[key] = fingerprint
+            self._updates[key] = fingerprint
+
+        return fingerprint
+
+    @staticmethod
+    def hash_file(file_path, size=None):
+        """
+        Computes the fast and strong hashes of a file in a single pass over
+        a read-only memory map.
+
+        :param file_path: Path to the file.
+        :param size: Expected size, used to skip mapping empty files.
+        :return: Tuple ``(crc32, blake2b hexdigest)``.
+        """
+
+        fast = 0
+        strong = blake2b()
+
+        with open(file_path, 'rb') as stream:
+            if size is None:
+                size = stat(stream.fileno()).st_size
+
+            if size:
+                with mmap(stream.fileno(), 0, access=ACCESS_READ) as data:
+                    view = memoryview(data)
+                    try:
+                        for offset in range(0, len(view), HASH_BLOCK_SIZE):
+                            with view[offset:offset + HASH_BLOCK_SIZE] as block:
+                                fast = crc32(block, fast)
+                                strong.update(block)
+                    finally:
+                        view.release()
+
+        return fast, strong.hexdigest()
+
+    @staticmethod
+    def hash_content(content):
+        """
+        Computes the strong hash of some bytes, as ``hash_file`` would for a
+        file holding them.
+
+        :return: BLAKE2b hexdigest.
+        """
+
+        return blake2b(content).hexdigest()
+
+    def _load(self):
+        if self._cache is not None:
+            return
+
+        with self._lock:
+            if self._cache is not None:
+                return
+
+            cache = {}
+            if self._store is not None:
+                self._store.ensure_schema(_SCHEMA)
+                rows = self._store.connection.execute(
+                    'SELECT device, inode, size, mtime_ns, fast, strong '
+                    'FROM fingerprint'
+                )
+                for device, inode, size, mtime_ns, fast, strong in rows:
+                    cache[(device, inode)] = Fingerprint(
+                        size, mtime_ns, fast, strong)
+
+            self._cache = cache
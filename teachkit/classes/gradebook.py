@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+Grade book
+==========
+Scores of a group kept as a dense students × exercises matrix, where a
+missing score is NaN. Every exercise belongs to a category (the category of
+the resources it comes from), and the final grade is the weighted average of
+the category averages. All of them, along with rankings and statistics, are
+computed at once with NumPy matrix operations, so changing a weight and
+grading the whole group again takes a few milliseconds.
+
+The book is saved as a compressed ``.npz`` archive with these arrays:
+
+- ``students``: student folders, one row each.
+- ``exercises``: exercise folders, one column each.
+- ``categories``: category of every exercise.
+- ``scores``: float matrix of scores.
+- ``weight_names`` and ``weight_values``: weight of every category. Those
+  without a weight count as 1.
+"""
+
+from io import BytesIO
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+GRADES_FILE = 'grades.npz'
+
+DEFAULT_WEIGHT = 1.0
+
+STATISTICS = ('count', 'mean', 'std', 'min', 'median', 'max')
+
+# How the exercises a student was not graded on count
+MISSING_POLICIES = ('ignore', 'zero')
+
+
+def _require_numpy():
+    if numpy is None:
+        raise ImportError('The grade book needs NumPy. '
+                          'Install it with "pip install numpy"')
+
+
+class GradeBook(object):
+    """
+    Students × exercises matrix of scores.
+
+    :param students: Student folders.
+    :param exercises: Exercise folders.
+    :param categories: Category of every exercise.
+    :param scores: Matrix of scores, NaN where there is none.
+    :param weights: Dictionary mapping categories to their weights.
+    """
+
+    def __init__(self, students=(), exercises=(), categories=(), scores=None,
+                 weights=None):
+        _require_numpy()
+
+        self.students = [str(student) for student in students]
+        self.exercises = [str(exercise) for exercise in exercises]
+        self.categories = [str(category) for category in categories]
+        self.weights = dict(weights or {})
+
+        shape = (len(self.students), len(self.exercises))
+        if scores is None:
+            scores = numpy.full(shape, numpy.nan)
+        self.scores = numpy.asarray(scores, dtype=float).reshape(shape)
+
+        self._rows = {name: row for row, name in enumerate(self.students)}
+        self._columns = {
+            name: column for column, name in enumerate(self.exercises)
+        }
+
+    @classmethod
+    def load(cls, file_path):
+        """
+        Reads a grade book saved with ``to_bytes``.
+
+        :return: GradeBook instance.
+        """
+
+        _require_numpy()
+
+        with numpy.load(file_path, allow_pickle=False) as data:
+            weights = dict(zip(data['weight_names'].tolist(),
+                               data['weight_values'].tolist()))
+            return cls(data['students'].tolist(), data['exercises'].tolist(),
+                       data['categories'].tolist(), data['scores'], weights)
+
+    def to_bytes(self):
+        """
+        :return: Content of the ``.npz`` archive of the book.
+        """
+
+        buffer = BytesIO()
+        numpy.savez_compressed(
+            buffer,
+            students=numpy.array(self.students, dtype=str),
+            exercises=numpy.array(self.exercises, dtype=str),
+            categories=numpy.array(self.categories, dtype=str),
+            scores=self.scores,
+            weight_names=numpy.array(list(self.weights), dtype=str),
+            weight_values=numpy.array(list(self.weights.values()),
+                                      dtype=float),
+        )
+
+        return buffer.getvalue()
+
+    # -------------------------------------------------------------------------
+    # Changes
+    # -------------------------------------------------------------------------
+
+    def add_students(self, students):
+        """
+        Adds a row for every student the book does not have yet. Rows of
+        students that left the group are kept, along with their scores.
+        """
+
+        new = sorted(set(students).difference(self._rows))
+        if not new:
+            return
+
+        rows = numpy.full((len(new), len(self.exercises)), numpy.nan)
+        self.scores = numpy.vstack([self.scores, rows])
+        for student in new:
+            self._rows[student] = len(self.students)
+            self.students.append(student)
+
+    def add_exercise(self, exercise, category):
+        """
+        Adds a column for an exercise, or updates its category.
+
+        :return: Column of the exercise.
+        """
+
+        column = self._columns.get(exercise)
+        if column is not None:
+            self.categories[column] = category
+            return column
+
+        column = len(self.exercises)
+        self.scores = numpy.hstack(
+            [self.scores, numpy.full((len(self.students), 1), numpy.nan)])
+        self.exercises.append(exercise)
+        self.categories.append(category)
+        self._columns[exercise] = column
+
+        return column
+
+    def update(self, students, exercises, scores):
+        """
+        Writes a block of scores at once. NaN values leave the current
+        score untouched.
+
+        :param students: Student of every row of ``scores``.
+        :param exercises: Exercise of every column of ``scores``, already
+                          added with ``add_exercise``.
+        :param scores: Matrix of scores.
+        :return: Number of scores written.
+        """
+
+        self.add_students(students)
+
+        rows = numpy.array([self._rows[name] for name in students], dtype=int)
+        columns = numpy.array(
+            [self._columns[name] for name in exercises], dtype=int)
+        scores = numpy.asarray(scores, dtype=float)
+
+        block = self.scores[numpy.ix_(rows, columns)]
+        given = ~numpy.isnan(scores)
+        block[given] = scores[given]
+        self.scores[numpy.ix_(rows, columns)] = block
+
+        return int(given.sum())
+
+    def set_score(self, student, exercise, score):
+        """
+        Sets or clears (with None) the score of a student in an exercise
+        already added with ``add_exercise``.
+        """
+
+        self.add_students([student])
+        self.scores[self._rows[student], self._columns[exercise]] = \
+            numpy.nan if score is None else float(score)
+
+    # -------------------------------------------------------------------------
+    # Grades
+    # -------------------------------------------------------------------------
+
+    def category_names(self):
+        """
+        :return: Sorted names of the categories with exercises.
+        """
+
+        return sorted(set(self.categories))
+
+    def category_averages(self, missing='ignore'):
+        """
+        Averages the scores of every student in every category with a
+        single matrix product.
+
+        :param missing: ``ignore`` leaves out the exercises a student has no
+                        score for, ``zero`` counts them as 0.
+        :return: Matrix with a row per student and a column per category
+                 (as in ``category_names``), NaN where there are no scores.
+        """
+
+        names = self.category_names()
+        positions = {name: index for index, name in enumerate(names)}
+
+        membership = numpy.zeros((len(self.exercises), len(names)))
+        membership[numpy.arange(len(self.exercises)),
+                   [positions[name] for name in self.categories]] = 1.0
+
+        graded = ~numpy.isnan(self.scores)
+        if missing == 'zero':
+            graded = numpy.ones_like(graded)
+
+        totals = numpy.where(graded, numpy.nan_to_num(self.scores), 0.0) \
+            @ membership
+        counts = graded.astype(float) @ membership
+
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            return numpy.where(counts > 0, totals / counts, numpy.nan)
+
+    def final_grades(self, averages=None, missing='ignore'):
+        """
+        Weighted average of the category averages of every student. The
+        categories a student has no average in are left out.
+
+        :param averages: Result of ``category_averages``, computed if None.
+        :return: Vector with a grade per student, NaN if there is none.
+        """
+
+        if averages is None:
+            averages = self.category_averages(missing)
+
+        weights = numpy.array([
+            float(self.weights.get(name, DEFAULT_WEIGHT))
+            for name in self.category_names()
+        ])
+
+        present = ~numpy.isnan(averages)
+        totals = numpy.where(present, averages, 0.0) @ weights
+        weight_sums = present.astype(float) @ weights
+
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            return numpy.where(weight_sums > 0, totals / weight_sums,
+                               numpy.nan)
+
+    @staticmethod
+    def ranks(grades):
+        """
+        Ranks grades from the highest, sharing the rank on ties (1, 2, 2,
+        4...).
+
+        :return: Vector of ranks, 0 for the students with no grade.
+        """
+
+        grades = numpy.asarray(grades, dtype=float)
+        graded = ~numpy.isnan(grades)
+
+        ordered = numpy.sort(-grades[graded])
+        ranks = numpy.zeros(len(grades), dtype=int)
+        ranks[graded] = numpy.searchsorted(ordered, -grades[graded]) + 1
+
+        return ranks
+
+    @staticmethod
+    def statistics(matrix):
+        """
+        Statistics of every column of a matrix, ignoring NaN values.
+
+        :return: Dictionary mapping ``count``, ``mean``, ``std``, ``min``,
+                 ``median`` and ``max`` to a vector with a value per column.
+        """
+
+        matrix = numpy.asarray(matrix, dtype=float)
+        if matrix.ndim == 1:
+            matrix = matrix.reshape(-1, 1)
+
+        count = (~numpy.isnan(matrix)).sum(axis=0)
+        result = {'count': count}
+        if not matrix.shape[0]:
+            empty = numpy.full(matrix.shape[1], numpy.nan)
+            result.update((name, empty) for name in STATISTICS[1:])
+            return result
+
+        # Columns with no values at all give NaN without warnings
+        filled = numpy.where(count > 0, 0.0, numpy.nan)
+        safe = numpy.where(numpy.isnan(matrix) & (count == 0), 0.0, matrix)
+        for name, function in (('mean', numpy.nanmean),
+                               ('std', numpy.nanstd),
+                               ('min', numpy.nanmin),
+                               ('median', numpy.nanmedian),
+                               ('max', numpy.nanmax)):
+            result[name] = function(safe, axis=0) + filled
+
+        return result
@@ -0,0 +1,383 @@
+from .base import Base
+from .gradebook import GradeBook, GRADES_FILE, MISSING_POLICIES, STATISTICS
+from .registry import ExerciseRegistry
+from .writer import get_writer
+
+from os import path
+from csv import reader as csv_reader, writer as csv_writer
+from io import StringIO
+from math import isnan
+
+
+class Grade(Base):
+
+    def __init__(self, context=None):
+        super(Grade, self).__init__(context)
+
+    # -------------------------------------------------------------------------
+    # Properties
+    # -------------------------------------------------------------------------
+
+    @property
+    def grades_path(self):
+        return path.join(self.metadata_path, GRADES_FILE)
+
+    # -------------------------------------------------------------------------
+    # List
+    # -------------------------------------------------------------------------
+
+    def read(self):
+        """
+        Prints the category averages, final grade and rank of every student,
+        or writes them along with every score to a CSV file with
+        ``--output``.
+
+        :return: List of rows, one per student.
+        """
+
+        self.ensure_within_the_group(raise_exception=True)
+
+        book = self._load_book()
+        if not book.exercises:
+            self._print('There are no grades in this group yet.')
+            return []
+
+        names = book.category_names()
+        averages = book.category_averages(self._get_missing_policy())
+        finals = book.final_grades(averages)
+        ranks = book.ranks(finals)
+
+        rows = [
+            {
+                'student': student,
+                'categories': averages[index].tolist(),
+                'final': float(finals[index]),
+                'rank': int(ranks[index]),
+                'scores': book.scores[index].tolist(),
+            }
+            for index, student in enumerate(book.students)
+        ]
+
+        if self.arguments.get('sort', None) == 'final':
+            rows.sort(key=lambda row: (not row['rank'], row['rank'],
+                                       row['student']))
+
+        output = self.arguments.get('output', None)
+        if output:
+            self._export(output, book, names, rows)
+            return rows
+
+        decimals = self._get_decimals()
+        width = max(len(student) for student in book.students)
+        sizes = [max(len(name), decimals + 4) for name in names]
+
+        headers = [name.rjust(size) for name, size in zip(names, sizes)]
+        self._print('{}  {}  {:>7}  {:>4}', 'Student'.ljust(width),
+                    '  '.join(headers), 'Final', 'Rank')
+
+        for row in rows:
+            values = [
+                self._format(value, decimals).rjust(size)
+                for value, size in zip(row['categories'], sizes)
+            ]
+            self._print('{}  {}  {:>7}  {:>4}', row['student'].ljust(width),
+                        '  '.join(values),
+                        self._format(row['final'], decimals),
+                        row['rank'] or '-')
+
+        return rows
+
+    def _export(self, output, book, names, rows):
+        decimals = self._get_decimals()
+
+        buffer = StringIO()
+        writer = csv_writer(buffer, lineterminator='\n')
+        writer.writerow(['student'] + book.exercises + names
+                        + ['final', 'rank'])
+        for row in rows:
+            values = row['scores'] + row['categories'] + [row['final']]
+            writer.writerow(
+                [row['student']]
+                + [self._format(value, decimals, '') for value in values]
+                + [row['rank'] or ''])
+
+        output = path.abspath(output)
+        self._mkdir(path.dirname(output))
+        get_writer().write(output, buffer.getvalue())
+
+        message = 'Grades of {} students written to {}'
+        self._print(message, len(rows), output)
+
+    # -------------------------------------------------------------------------
+    # Statistics
+    # -------------------------------------------------------------------------
+
+    def get(self):
+        """
+        Prints the statistics of every exercise, every category and the final
+        grades of the group.
+
+        :return: Dictionary mapping each row label to its statistics.
+        """
+
+        self.ensure_within_the_group(raise_exception=True)
+
+        book = self._load_book()
+        if not book.exercises:
+            self._print('There are no grades in this group yet.')
+            return {}
+
+        averages = book.category_averages(self._get_missing_policy())
+        finals = book.final_grades(averages)
+
+        labels = book.exercises + book.category_names() + ['Final']
+        statistics = [
+            book.statistics(book.scores),
+            book.statistics(averages),
+            book.statistics(finals),
+        ]
+
+        columns = {
+            name: [value for part in statistics for value in part[name]]
+            for name in STATISTICS
+        }
+
+        decimals = self._get_decimals()
+        width = max(len(label) for label in labels)
+        self._print('{}  ' + '  '.join(['{:>8}'] * len(STATISTICS)),
+                    ''.ljust(width), *[name.title() for name in STATISTICS])
+
+        result = {}
+        for index, label in enumerate(labels):
+            values = {name: columns[name][index] for name in STATISTICS}
+            result[label] = values
+            self._print(
+                '{}  ' + '  '.join(['{:>8}'] * len(STATISTICS)),
+                label.ljust(width), int(values['count']),
+                *[self._format(values[name], decimals)
+                  for name in STATISTICS[1:]])
+
+        return result
+
+    # -------------------------------------------------------------------------
+    # Set
+    # -------------------------------------------------------------------------
+
+    def set(self):
+        """
+        Records the score of a student in an exercise. A score of ``-``
+        clears it.
+        """
+
+        self.ensure_within_the_group(raise_exception=True)
+
+        student = self.arguments.get('student', None)
+        if student not in self.student_paths:
+            message = 'Unknown student "%s"'
+            self.exception(ValueError, message, student)
+
+        value = str(self.arguments.get('score', '')).strip()
+        score = None if value == '-' else self._parse_score(value)
+        if score is not None:
+            value = f'{score:g}'
+
+        book = self._load_book()
+        exercise, category = self._resolve_exercise(
+            self.arguments.get('exercise', None))
+
+        book.add_exercise(exercise, category)
+        book.set_score(student, exercise, score)
+        self._save_book(book)
+
+        self._count('scores', 1)
+        self.info('Score of %s in %s set to %s', student, exercise, value)
+
+        message = 'Score of {} in {} set to {}.'
+        self._print(message, student, exercise, value)
+
+    # -------------------------------------------------------------------------
+    # Add
+    # -------------------------------------------------------------------------
+
+    def create(self):
+        """
+        Imports the scores of a CSV file whose first column holds the student
+        folders and whose header names an exercise for every other column,
+        by number, ``EX###`` prefix or folder. Empty cells are skipped.
+
+        :return: Number of scores imported.
+        """
+
+        self.ensure_within_the_group(raise_exception=True)
+
+        file_path = self.arguments.get('file', None)
+        if not file_path or not path.isfile(file_path):
+            message = 'The file "%s" does not exist'
+            self.exception(FileNotFoundError, message, file_path)
+
+        with open(file_path, 'r', encoding='utf-8-sig', newline='') as stream:
+            lines = [line for line in csv_reader(stream) if any(line)]
+
+        if len(lines) < 2 or len(lines[0]) < 2:
+            message = 'The file "%s" has no scores'
+            self.exception(ValueError, message, file_path)
+
+        book = self._load_book()
+
+        exercises = []
+        for header in lines[0][1:]:
+            exercise, category = self._resolve_exercise(header)
+            book.add_exercise(exercise, category)
+            exercises.append(exercise)
+
+        folders = set(self.student_paths)
+        students, scores = [], []
+        for line in lines[1:]:
+            student = line[0].strip()
+            if student not in folders:
+                message = 'Unknown student "%s" in %s'
+                self.exception(ValueError, message, student, file_path)
+
+            cells = (line[1:] + [''] * len(exercises))[:len(exercises)]
+            students.append(student)
+            scores.append([
+                self._parse_score(cell) if cell.strip() else float('nan')
+                for cell in cells
+            ])
+
+        count = book.update(students, exercises, scores)
+        self._save_book(book)
+
+        self._count('scores', count)
+        self.info('%s scores imported from %s', count, file_path)
+
+        message = '{} scores of {} students imported.'
+        self._print(message, count, len(students))
+
+        return count
+
+    # -------------------------------------------------------------------------
+    # Weights
+    # -------------------------------------------------------------------------
+
+    def weight(self):
+        """
+        Sets the weight of a category in the final grade, or prints every
+        weight when no value is given. A category without a weight counts
+        as 1, and 0 leaves it out.
+        """
+
+        self.ensure_within_the_group(raise_exception=True)
+
+        book = self._load_book()
+        category = self.arguments.get('category', None)
+        value = self.arguments.get('value', None)
+
+        if category and value is not None:
+            try:
+                weight = float(value)
+            except ValueError:
+                weight = -1.0
+
+            if isnan(weight) or weight < 0:
+                message = 'Invalid weight "%s", use a number of zero or more'
+                self.exception(ValueError, message, value)
+
+            book.weights[category] = weight
+            self._save_book(book)
+            self.info('Weight of %s set to %s', category, weight)
+
+        names = sorted(set(book.category_names()).union(book.weights))
+        if category:
+            names = [category]
+
+        if not names:
+            self._print('There are no grades in this group yet.')
+            return {}
+
+        weights = {name: book.weights.get(name, 1.0) for name in names}
+        width = max(len(name) for name in names)
+        for name, weight in weights.items():
+            self._print('{}  {:g}', name.ljust(width), weight)
+
+        return weights
+
+    # -------------------------------------------------------------------------
+    # Auxiliary methods
+    # -------------------------------------------------------------------------
+
+    def _load_book(self):
+        try:
+            if path.exists(self.grades_path):
+                book = GradeBook.load(self.grades_path)
+            else:
+                book = GradeBook()
+        except ImportError as ex:
+            self.exception(ImportError, '%s', ex)
+
+        book.add_students(self.student_paths)
+
+        return book
+
+    def _save_book(self, book):
+        self._mkdir(self.metadata_path)
+        get_writer().write(self.grades_path, book.to_bytes())
+
+    def _resolve_exercise(self, value):
+        """
+        Finds an exercise of the resources by number, ``EX###`` prefix,
+        folder or ``topic/category/folder`` path.
+
+        :return: Tuple with the exercise folder and its category.
+        """
+
+        registry = ExerciseRegistry(self.store, self.resources_path)
+        found = registry.resolve(str(value or '').strip())
+
+        if not found:
+            message = 'Exercise "%s" does not exist in the resources'
+            self.exception(FileNotFoundError, message, value)
+
+        if len(found) > 1:
+            message = 'Several exercises match "%s": %s'
+            self.exception(ValueError, message, value, ', '.join(
+                '/'.join(exercise[:3]) for exercise in found))
+
+        return found[0].folder, found[0].category
+
+    def _parse_score(self, value):
+        scale = self._safe_cast(self.get_config_value('grades', 'scale'),
+                                float, 10.0)
+
+        try:
+            score = float(str(value).strip().replace(',', '.'))
+        except ValueError:
+            score = None
+
+        if score is None or isnan(score) or not 0 <= score <= scale:
+            message = 'Invalid score "%s", use a number from 0 to %s'
+            self.exception(ValueError, message, value, f'{scale:g}')
+
+        return score
+
+    def _get_missing_policy(self):
+        missing = str(self.get_config_value('grades', 'missing') or '')
+        missing = missing.strip().lower() or MISSING_POLICIES[0]
+        if missing not in MISSING_POLICIES:
+            message = 'Invalid [grades] missing "%s", use one of %s'
+            self.exception(ValueError, message, missing,
+                           ', '.join(MISSING_POLICIES))
+
+        return missing
+
+    def _get_decimals(self):
+        decimals = self._safe_cast(self.get_config_value('grades', 'decimals'),
+                                   int, 2)
+        return max(decimals, 0)
+
+    @staticmethod
+    def _format(value, decimals, empty='-'):
+        if value is None or isnan(value):
+            return empty
+
+        return f'{value:.{decimals}f}'
@@ -1,12 +1,25 @@
 from .base import Base
+from .scanner import TreeScanner
+from .material import Resource, EXERCISE_PATTERN
+from .cover import CoverBook, read_group_values
+from .sync import SyncClient, SyncState, SYNC_KINDS
+from .snapshot import SnapshotRepository
+from .store import STORE_FILE_NAME
+from .walker import TreeWalker
 
-from os import getcwd, path
+from os import getcwd, path, makedirs, remove, stat
+from re import match as re_match
+from time import perf_counter
+from humanfriendly import format_size, parse_size
+import sqlite3
+
+DEFAULT_TOP_EXERCISES = 10
 
 
 class Group(Base):
 
-    def __init__(self):
-        super(Group, self).__init__()
+    def __init__(self, context=None):
+        super(Group, self).__init__(context)
 
         self._code = self.arguments.get('code', None)
 
@@ -74,6 +87,283 @@ class Group(Base):
 
         print(f'{"Folders".ljust(10, ".")}: {len(self.student_paths)}')
 
+    # -------------------------------------------------------------------------
+    # Print
+    # -------------------------------------------------------------------------
+
+    def print(self):
+        """
+        Writes the cover page of the group followed by the cover page of
+        every student.
+
+        :return: List with the paths of the written documents.
+        """
+
+        self.ensure_within_the_group(raise_exception=True)
+
+        folders = self.student_paths
+        values = read_group_values(self.config_path, self.group_path,
+                                   len(folders))
+
+        book = CoverBook(self.config_path,
+                         path.join(self.metadata_path, 'covers'),
+                         self.store, self.engine)
+        pages = [book.group_page(values)]
+        pages.extend(book.student_pages(
+            folders, values, self._get_name_index(),
+            self.store.get_all_properties(folders)))
+
+        return self._write_covers(book, pages, 'group')
+
+    def _write_covers(self, book, pages, file_name):
+        """
+        Writes the pages to ``--output``, or to the covers folder of the
+        group metadata, and reports the characters drawn as ``?``.
+
+        :return: List with the paths of the documents.
+        """
+
+        separate = bool(self.arguments.get('separate', False))
+        output = book.output_path(
+            file_name, self.arguments.get('output', None), separate)
+
+        try:
+            file_paths = book.write(pages, output, separate, title=file_name)
+        except OSError as ex:
+            message = 'Failed to write the cover pages to %s. %s'
+            self.exception(OSError, message, output, ex)
+
+        renderer = book.renderer
+        for key, characters in sorted(renderer.unsupported.items()):
+            message = 'The cover page of %s cannot show %s, drawn as "?"'
+            self.warning(message, key, ' '.join(characters))
+
+        self._count('pages_rendered', renderer.rendered)
+        self._count('pages_cached', renderer.cached)
+
+        message = '{} pages ({} rendered, {} cached) written to {}'
+        self._print(message, len(pages), renderer.rendered, renderer.cached,
+                    output)
+        self.info('%s cover pages written to %s', len(pages), output)
+
+        return file_paths
+
+    # -------------------------------------------------------------------------
+    # Disk usage
+    # -------------------------------------------------------------------------
+
+    def du(self):
+        """
+        Shows the disk space used by the students, the resources and the
+        metadata of the group, and the exercises taking the most space
+        across all the students.
+        """
+
+        self.ensure_within_the_group(raise_exception=True)
+
+        folders = self.student_paths
+        scanner = TreeScanner(self.group_path, self.store, self.engine,
+                              self._make_walker())
+
+        student_roots = [
+            path.join(self.group_path, folder) for folder in folders
+        ]
+        other_roots = {
+            self.get_config_value('resources', 'folder'): self.resources_path,
+            self.get_config_value('metadata', 'folder'): self.metadata_path,
+        }
+        summaries = scanner.summarize_many(
+            student_roots + list(other_roots.values()))
+
+        def is_exercise(name):
+            return re_match(EXERCISE_PATTERN, name) is not None
+
+        exercises = {}
+        for root in student_roots:
+            for exercise_path in scanner.find(root, is_exercise):
+                summary = scanner.summarize(exercise_path, forget=False)
+                name = path.basename(exercise_path)
+                copies, size = exercises.get(name, (0, 0))
+                exercises[name] = (copies + 1, size + summary.size)
+        scanner.save()
+
+        students_size = sum(summaries[root].size for root in student_roots)
+        total = students_size
+
+        self._print('{}  {:>12}  ({} folders)', 'Students'.ljust(16, '.'),
+                    format_size(students_size), len(folders))
+        for name, root in other_roots.items():
+            size = summaries[root].size
+            total += size
+            self._print('{}  {:>12}', name.ljust(16, '.'), format_size(size))
+        self._print('{}  {:>12}', 'Total'.ljust(16, '.'), format_size(total))
+
+        top = self._safe_cast(self.arguments.get('top', None), int,
+                              DEFAULT_TOP_EXERCISES)
+        ranking = sorted(exercises.items(), key=lambda item: -item[1][1])
+        if ranking[:top]:
+            self._print('')
+            self._print('Largest exercises')
+        for name, (copies, size) in ranking[:top]:
+            self._print('  {:>12}  {:>4} copies  {}', format_size(size),
+                        copies, name)
+
+        return {
+            'students': {
+                folder: summaries[root].size
+                for folder, root in zip(folders, student_roots)
+            },
+            'folders': {
+                name: summaries[root].size
+                for name, root in other_roots.items()
+            },
+            'exercises': exercises,
+        }
+
+    # -------------------------------------------------------------------------
+    # Sync
+    # -------------------------------------------------------------------------
+
+    def sync(self):
+        """
+        Uploads the roster, the resources and the exercise states that
+        changed since the last sync to the learning platform.
+
+        :return: Dictionary mapping each kind to ``(changed, deleted)``
+                 counts.
+        """
+
+        self.ensure_within_the_group(raise_exception=True)
+
+        url = self.arguments.get('url', None) \
+            or self.get_config_value('sync', 'url')
+        if not url:
+            message = 'No platform URL. Set it in [sync] url or with --url.'
+            self.exception(ValueError, message)
+
+        kinds = self.arguments.get('only', None) or SYNC_KINDS
+        dry_run = bool(self.arguments.get('dry_run', False))
+
+        state = SyncState(self.store)
+        if self.arguments.get('full', False) and not dry_run:
+            for kind in kinds:
+                state.forget(kind)
+
+        values = read_group_values(self.config_path, self.group_path,
+                                   len(self.student_paths))
+        group_id = values['code'] or values['name']
+
+        client = SyncClient(
+            url, self.get_config_value('sync', 'token'),
+            connections=self.get_config_value('sync', 'connections'),
+            batch_size=self.get_config_value('sync', 'batch_size'),
+            retries=self.get_config_value('sync', 'retries'),
+            backoff=self.get_config_value('sync', 'backoff'),
+            timeout=self.get_config_value('sync', 'timeout'),
+        )
+
+        counts = {}
+        failures = []
+        try:
+            for kind in kinds:
+                items = getattr(self, f'_make_sync_{kind}')()
+                changed, deleted = state.changes(kind, items)
+                counts[kind] = (len(changed), len(deleted))
+
+                if dry_run or not (changed or deleted):
+                    self._print('{}: {} changed, {} deleted', kind.ljust(9),
+                                len(changed), len(deleted))
+                    continue
+
+                def commit(result, kind=kind):
+                    if result.error is None:
+                        state.commit(kind, result.items, result.deleted)
+
+                requests = client.requests
+                results = client.push(kind, group_id, changed, deleted,
+                                      on_batch=commit)
+                errors = [result.error for result in results if result.error]
+                failures.extend(errors)
+
+                self._count('items_sent', len(changed) + len(deleted))
+                self._count('requests', client.requests - requests)
+                self._count('failed_batches', len(errors))
+
+                self._print('{}: {} changed, {} deleted, {} requests{}',
+                            kind.ljust(9), len(changed), len(deleted),
+                            client.requests - requests,
+                            f', {len(errors)} failed' if errors else '')
+        finally:
+            client.close()
+
+        if failures:
+            message = '%s batches were not accepted. %s'
+            self.exception(Exception, message, len(failures), failures[0])
+
+        return counts
+
+    def _make_sync_roster(self):
+        folders = self.student_paths
+        index = self._get_name_index()
+        properties = self.store.get_all_properties(folders)
+
+        return [
+            {
+                'id': folder,
+                'name': index.get(folder) or folder.replace('_', ' ').title(),
+                'properties': properties.get(folder, {}),
+            }
+            for folder in folders
+        ]
+
+    def _make_sync_resources(self):
+        registry = self._make_resource().registry
+        exercises = registry.exercises()
+
+        scanner = TreeScanner(self.group_path, self.store, self.engine,
+                              self._make_walker())
+        roots = [registry.path_of(exercise) for exercise in exercises]
+        summaries = scanner.summarize_many(roots)
+
+        return [
+            {
+                'id': '/'.join(exercise[:3]),
+                'topic': exercise.topic,
+                'category': exercise.category,
+                'number': exercise.number,
+                'title': exercise.folder.split('_-_', 1)[-1],
+                'files': summaries[root].files,
+                'size': summaries[root].size,
+            }
+            for exercise, root in zip(exercises, roots)
+        ]
+
+    def _make_sync_exercises(self):
+        folders = self.student_paths
+        if not folders:
+            return []
+
+        statuses = self._make_resource().get_status(folders)
+
+        return [
+            {
+                'id': f'{folder}/{exercise}',
+                'student': folder,
+                'exercise': exercise,
+                'status': result[folder][0],
+            }
+            for exercise, result in statuses.items()
+            for folder in folders
+        ]
+
+    def _make_resource(self):
+        if getattr(self, '_resource', None) is None:
+            context = self.context.derive('resource', 'get')
+            context.store = self.store
+            self._resource = Resource(context)
+
+        return self._resource
+
     # -------------------------------------------------------------------------
     # Update
     # -------------------------------------------------------------------------
@@ -104,6 +394,179 @@ class Group(Base):
                        'System says: %s.')
             self.error(message, repr(ex))
 
+    # -------------------------------------------------------------------------
+    # Snapshots
+    # -------------------------------------------------------------------------
+
+    def snapshot(self):
+        """
+        Saves the group in the snapshot repository. Only the chunks that are
+        not in the repository yet are stored, and only the files changed
+        since the previous snapshot of the group are read.
+
+        :return: Id of the new snapshot.
+        """
+
+        self.ensure_within_the_group(raise_exception=True)
+
+        repository = self._make_snapshot_repository()
+        group = path.basename(self.group_path)
+
+        if self.arguments.get('list', False):
+            self._print_snapshots(repository, group)
+            return None
+
+        start = perf_counter()
+        entries, folders = self._list_snapshot_files()
+
+        # The database is saved through the backup API, so the copy is
+        # consistent even while other operations write to it
+        makedirs(repository.repository_path, exist_ok=True)
+        backup_path = path.join(repository.repository_path,
+                                f'{group}.{STORE_FILE_NAME}.tmp')
+        backup = sqlite3.connect(backup_path)
+        try:
+            self.store.connection.backup(backup)
+        finally:
+            backup.close()
+
+        try:
+            metadata_folder = self.get_config_value('metadata', 'folder')
+            entries.append((f'{metadata_folder}/{STORE_FILE_NAME}',
+                            backup_path, stat(backup_path)))
+
+            manifest = repository.create(group, entries, folders,
+                                         self.arguments.get('message', None))
+        finally:
+            remove(backup_path)
+
+        self._count('files_read', repository.read_files)
+        self._count('chunks_stored', repository.new_chunks)
+
+        message = ('Snapshot {} of {}: {} files ({}), {} read, {} new chunks '
+                   '({} stored) in {:.1f}s')
+        self._print(message, manifest['id'], group, len(manifest['files']),
+                    format_size(manifest['size']), repository.read_files,
+                    repository.new_chunks, format_size(repository.new_bytes),
+                    perf_counter() - start)
+        self.info('Snapshot %s of %s taken', manifest['id'], group)
+
+        return manifest['id']
+
+    def restore(self):
+        """
+        Writes back the files of a snapshot, the latest one by default. Only
+        the files that differ from the snapshot are written. A deleted group
+        is restored with ``--directory``.
+
+        :return: Number of files written.
+        """
+
+        target_path = self._cwd
+        group = path.basename(target_path)
+
+        repository = self._make_snapshot_repository()
+        snapshot_id = self.arguments.get('snapshot', None)
+
+        manifest = repository.load(group, snapshot_id)
+        if manifest is None:
+            message = 'There is no snapshot %s of the group "%s"'
+            self.exception(FileNotFoundError, message, snapshot_id or '',
+                           group)
+
+        # The database file is replaced, so it must be closed and must not
+        # leave a journal that would be applied to the restored copy
+        if self._context.store is not None:
+            self._context.store.close()
+
+        metadata_folder = self.get_config_value('metadata', 'folder')
+        store_path = path.join(target_path, metadata_folder, STORE_FILE_NAME)
+        for suffix in ('-wal', '-shm'):
+            if path.exists(store_path + suffix):
+                remove(store_path + suffix)
+
+        written = repository.restore(manifest, target_path)
+
+        removed = 0
+        if self.arguments.get('clean', False):
+            kept = {item[0] for item in manifest['files']}
+            entries, _ = self._list_snapshot_files(target_path)
+            for relative, file_path, _ in entries:
+                if relative not in kept:
+                    remove(file_path)
+                    removed += 1
+
+        self._count('files_written', written)
+        self._count('files_removed', removed)
+
+        message = 'Snapshot {} restored: {} files written, {} removed'
+        self._print(message, manifest['id'], written, removed)
+        self.info('Snapshot %s of %s restored', manifest['id'], group)
+
+        return written
+
+    def _make_snapshot_repository(self):
+        repository_path = self.arguments.get('repository', None) \
+            or self.get_config_value('snapshot', 'repository')
+
+        # Next to the group by default, so deleting it keeps its snapshots
+        parent_path = path.dirname(path.abspath(self._cwd))
+        if repository_path:
+            repository_path = path.join(parent_path,
+                                        path.expanduser(repository_path))
+        else:
+            repository_path = path.join(parent_path, '.snapshots')
+
+        chunk_size = self.get_config_value('snapshot', 'chunk_size')
+        workers = self.get_config_value('parallel', 'workers')
+
+        return SnapshotRepository(repository_path,
+                                  parse_size(str(chunk_size)), workers)
+
+    def _list_snapshot_files(self, base_path=None):
+        """
+        Lists the files and folders saved in a snapshot: everything in the
+        group except logs, cover pages and the database, which is saved
+        apart.
+
+        :return: Tuple ``(entries, folders)``, with an entry
+                 ``(relative_path, path, stat_result)`` for every file.
+        """
+
+        base_path = base_path or self.group_path
+
+        metadata_folder = self.get_config_value('metadata', 'folder')
+        exclude = [
+            f'{metadata_folder}/logs',
+            f'{metadata_folder}/covers',
+            f'{metadata_folder}/{STORE_FILE_NAME}*',
+        ]
+
+        walker = TreeWalker(skip_names=(), exclude=exclude)
+
+        entries = []
+        folders = []
+        for entry in walker.walk(base_path):
+            if entry.is_dir:
+                folders.append(entry.relative)
+            elif not entry.name.endswith('.tmp'):
+                entries.append((entry.relative, entry.path, entry.stat()))
+
+        return entries, folders
+
+    @staticmethod
+    def _print_snapshots(repository, group):
+        ids = repository.snapshots(group)
+        if not ids:
+            print(f'There are no snapshots of the group "{group}" yet.')
+            return
+
+        for snapshot_id in ids:
+            manifest = repository.load(group, snapshot_id)
+            print(f'{snapshot_id}  {len(manifest["files"]):>6} files  '
+                  f'{format_size(manifest["size"]):>10}  '
+                  f'{manifest["message"]}')
+
     # -------------------------------------------------------------------------
     # Delete
     # -------------------------------------------------------------------------
@@ -0,0 +1,103 @@
+from .base import Base
+from .logfiles import LogArchive, LEVEL_ORDER
+
+from os import path
+from datetime import datetime, timedelta
+from re import match as re_match
+
+# Units accepted in relative times such as 90m or 2d
+TIME_UNITS = {
+    's': 'seconds',
+    'm': 'minutes',
+    'h': 'hours',
+    'd': 'days',
+    'w': 'weeks',
+}
+
+
+class Log(Base):
+
+    def __init__(self, context=None):
+        super(Log, self).__init__(context)
+
+    # -------------------------------------------------------------------------
+    # Query
+    # -------------------------------------------------------------------------
+
+    def query(self):
+        """
+        Prints the records of the group log matching the time range, minimum
+        level, verb and text given, oldest first. Only the compressed blocks
+        whose index entry can match are read.
+
+        :return: Number of records printed.
+        """
+
+        self.ensure_within_the_group(raise_exception=True)
+
+        since = self._parse_time(self.arguments.get('since', None), 'since')
+        until = self._parse_time(self.arguments.get('until', None), 'until')
+
+        level = self.arguments.get('level', None)
+        if level and level.upper() not in LEVEL_ORDER:
+            message = 'Unknown level "%s", use one of %s'
+            self.exception(ValueError, message, level, ', '.join(LEVEL_ORDER))
+
+        verb = self.arguments.get('verb', None)
+        text = self.arguments.get('grep', None)
+
+        archive = self._get_archive()
+
+        count = 0
+        for entry in archive.query(since, until, level, verb, text):
+            self._print(entry.text)
+            count += 1
+
+        if not count:
+            self._print('No log records match.')
+
+        return count
+
+    # -------------------------------------------------------------------------
+    # Auxiliary methods
+    # -------------------------------------------------------------------------
+
+    def _get_archive(self):
+        file_name = self.get_config_value('file_logging', 'file')
+        log_format = self.get_config_value('file_logging', 'format')
+        backup_count = self.get_config_value('file_logging', 'backup_count')
+
+        file_path = path.join(self.logging_path, file_name)
+        return LogArchive(file_path, log_format, backup_count)
+
+    def _parse_time(self, value, name):
+        """
+        Reads a time given as an ISO date or date and time, or relative to
+        now as a number and a unit (``30m``, ``2h``, ``1d``, ``1w``).
+
+        :return: POSIX timestamp, or None if no value is given.
+        """
+
+        if not value:
+            return None
+
+        value = value.strip()
+
+        found = re_match(r'^(\d+)\s*([smhdw])$', value.lower())
+        if found:
+            amount, unit = int(found.group(1)), found.group(2)
+            moment = datetime.now() - timedelta(**{TIME_UNITS[unit]: amount})
+            return moment.timestamp()
+
+        try:
+            moment = datetime.fromisoformat(value)
+        except ValueError:
+            message = 'Invalid --%s value "%s", use a date, a date and time ' \
+                      'or a relative time such as 2h'
+            self.exception(ValueError, message, name, value)
+
+        # A bare date given as the end of the range includes the whole day
+        if name == 'until' and len(value) == 10:
+            moment += timedelta(days=1, microseconds=-1)
+
+        return moment.timestamp()
@@ -0,0 +1,646 @@
+# -*- coding: utf-8 -*-
+"""
+Log files
+=========
+Rotates the group log into compressed segments and searches them without
+decompressing everything.
+
+When the log reaches its maximum size it is renamed to a pending segment
+and a background thread compresses it. Every segment is written as a chain
+of gzip members of about ``block_size`` bytes of text each, and a sidecar
+index (``teachkit.log.idx``, one JSON line per member) records where every
+member starts and the time span, levels and verbs of its records. A query
+reads the index, seeks to the members that may hold matching records and
+decompresses only those.
+
+Records are parsed back with the format they were written with, so the
+``%(asctime)s``, ``%(levelname)s`` and ``%(verb)s`` fields of any text
+format can be searched.
+
+The ``json`` format writes a JSON document per line instead, with the
+correlation id of the invocation, the group, the verb, the milliseconds
+since the operation started and its counters::
+
+    {"time": "2024-10-01T09:30:12.345", "level": "INFO",
+     "cid": "4f1c2a9be07d3356", "group": "1dam", "verb": "student add",
+     "elapsed_ms": 12.8, "counters": {"students": 3}, "msg": "..."}
+
+The fields that stay the same during an operation are serialized once and
+reused for all of its records.
+"""
+
+from os import path, replace, remove, stat, utime
+from datetime import datetime
+from glob import escape as glob_escape, glob
+from json import dumps as json_dumps, loads as json_loads
+from json.encoder import encode_basestring
+from logging import Formatter
+from logging.handlers import RotatingFileHandler
+from re import compile as re_compile, escape as re_escape
+from threading import Lock, Thread
+from time import localtime, strftime, time as now
+from zlib import compressobj, decompress, MAX_WBITS
+
+LEVEL_ORDER = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+
+# Value of [file_logging] format that selects JSON lines
+JSON_FORMAT = 'json'
+
+NO_VERB = '-'
+
+DEFAULT_BLOCK_SIZE = 256 * 1024
+
+INDEX_SUFFIX = '.idx'
+PENDING_SUFFIX = '.pending'
+WORK_SUFFIX = '.work'
+SEGMENT_SUFFIX = '.gz'
+SEGMENT_STAMP = '%Y%m%dT%H%M%S%f'
+
+# Seconds after which a file claimed for compression is considered left
+# behind by a process that failed or ended, and is compressed again
+STALE_WORK_SECONDS = 600
+
+# Default logging.Formatter date format, as written by %(asctime)s
+ASCTIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+_FIELD_PATTERN = re_compile(r'%\((\w+)\)[-#0 +]*\d*(?:\.\d+)?[sdfr]')
+
+
+class LogEntry(object):
+    """
+    Record read back from a log file, with its continuation lines.
+    """
+
+    __slots__ = ('time', 'level', 'verb', 'lines')
+
+    def __init__(self, time, level, verb, line):
+        self.time = time
+        self.level = level
+        self.verb = verb
+        self.lines = [line]
+
+    @property
+    def text(self):
+        return '\n'.join(self.lines)
+
+
+class LogOperation(object):
+    """
+    Operation whose records are being logged.
+
+    :param correlation_id: Id shared by every operation of an invocation.
+    :param verb: Target and verb, such as ``student add``.
+    :param group: Name of the group folder.
+    """
+
+    __slots__ = ('correlation_id', 'verb', 'group', 'started', 'counters',
+                 '_header', '_counters')
+
+    def __init__(self, correlation_id, verb=None, group=None):
+        self.correlation_id = correlation_id
+        self.verb = verb or NO_VERB
+        self.group = group or ''
+        self.started = now()
+        self.counters = {}
+
+        self._header = None
+        self._counters = None
+
+    def count(self, name, amount=1):
+        """
+        Adds to a counter written with the next records.
+        """
+
+        self.counters[name] = self.counters.get(name, 0) + amount
+        self._counters = None
+
+    @property
+    def header(self):
+        """
+        Serialized fields that never change during the operation.
+        """
+
+        if self._header is None:
+            self._header = (
+                f'"cid": {encode_basestring(self.correlation_id)}, '
+                f'"group": {encode_basestring(self.group)}, '
+                f'"verb": {encode_basestring(self.verb)}'
+            )
+
+        return self._header
+
+    @property
+    def serialized_counters(self):
+        """
+        Serialized counters, kept until one of them changes.
+        """
+
+        if self._counters is None:
+            self._counters = json_dumps(self.counters, sort_keys=True)
+
+        return self._counters
+
+
+class JsonLinesFormatter(Formatter):
+    """
+    Writes every record as a JSON document in a single line.
+    """
+
+    def __init__(self):
+        super(JsonLinesFormatter, self).__init__()
+
+        self._default = LogOperation('')
+        self._second = None
+        self._second_text = ''
+
+    def format(self, record):
+        operation = getattr(record, 'operation', None) or self._default
+
+        second = int(record.created)
+        if second != self._second:
+            # Only the milliseconds change between records of a second
+            self._second_text = strftime('%Y-%m-%dT%H:%M:%S',
+                                         localtime(second))
+            self._second = second
+
+        elapsed = (record.created - operation.started) * 1000
+        parts = [
+            '{"time": "', self._second_text, '.%03d' % record.msecs,
+            '", "level": "', record.levelname, '", ', operation.header,
+            ', "elapsed_ms": %.1f' % max(elapsed, 0.0),
+            ', "counters": ', operation.serialized_counters,
+            ', "msg": ', encode_basestring(record.getMessage()),
+        ]
+
+        if record.exc_info and record.exc_info[0] is not None:
+            exception = self.formatException(record.exc_info)
+            parts.append(', "exc": ' + encode_basestring(exception))
+        if record.stack_info:
+            stack = self.formatStack(record.stack_info)
+            parts.append(', "stack": ' + encode_basestring(stack))
+
+        parts.append('}')
+
+        return ''.join(parts)
+
+
+class LogLineParser(object):
+    """
+    Reads the time, level and verb of the lines written with a format.
+
+    :param log_format: Format string of the file handler.
+    """
+
+    def __init__(self, log_format):
+        pattern = []
+        position = 0
+        for match in _FIELD_PATTERN.finditer(log_format):
+            pattern.append(re_escape(log_format[position:match.start()]))
+            pattern.append(f'(?P<{match.group(1)}>.*?)')
+            position = match.end()
+        pattern.append(re_escape(log_format[position:]))
+
+        self._regex = re_compile('^' + ''.join(pattern) + '$')
+
+    def parse(self, line):
+        """
+        :param line: Line of a log file, without its line break.
+        :return: Tuple ``(time, level, verb)`` with the time as a POSIX
+                 timestamp, or None for continuation lines such as the ones
+                 of a traceback.
+        """
+
+        if line.startswith('{'):
+            try:
+                record = json_loads(line)
+            except ValueError:
+                record = None
+            if isinstance(record, dict) and 'time' in record:
+                return (self._parse_time(record.get('time')),
+                        record.get('level'), record.get('verb'))
+
+        match = self._regex.match(line)
+        if match is None:
+            return None
+
+        fields = match.groupdict()
+        time = self._parse_time(fields.get('asctime'))
+        if time is None:
+            return None
+
+        return time, fields.get('levelname'), fields.get('verb')
+
+    def entries(self, lines):
+        """
+        Groups lines into entries.
+
+        :param lines: Iterable of lines without line breaks.
+        :return: Generator of LogEntry.
+        """
+
+        entry = None
+        for line in lines:
+            parsed = self.parse(line)
+            if parsed is None:
+                if entry is not None:
+                    entry.lines.append(line)
+                continue
+
+            if entry is not None:
+                yield entry
+            entry = LogEntry(*parsed, line)
+
+        if entry is not None:
+            yield entry
+
+    @staticmethod
+    def _parse_time(value):
+        if isinstance(value, (int, float)):
+            return float(value)
+
+        try:
+            text = str(value or '')
+            if 'T' in text:
+                return datetime.fromisoformat(text).timestamp()
+            return datetime.strptime(text[:19], ASCTIME_FORMAT).timestamp() \
+                + int(text[20:23] or 0) / 1000
+        except ValueError:
+            return None
+
+
+class LogArchive(object):
+    """
+    Compressed segments of a log file and their index.
+
+    :param file_path: Path of the active log file.
+    :param log_format: Format the records are written with.
+    :param backup_count: Number of segments kept.
+    :param block_size: Bytes of text per independently readable member.
+    """
+
+    def __init__(self, file_path, log_format, backup_count=5,
+                 block_size=DEFAULT_BLOCK_SIZE):
+        self.file_path = file_path
+        self.index_path = file_path + INDEX_SUFFIX
+
+        self._parser = LogLineParser(log_format)
+        self._backup_count = max(int(backup_count or 0), 0)
+        self._block_size = max(int(block_size or DEFAULT_BLOCK_SIZE), 1024)
+        self._lock = Lock()
+
+    # -------------------------------------------------------------------------
+    # Rotation
+    # -------------------------------------------------------------------------
+
+    def reserve(self):
+        """
+        :return: Path where the active file must be moved before it is
+                 compressed.
+        """
+
+        stamp = datetime.now().strftime(SEGMENT_STAMP)
+        return f'{self.file_path}.{stamp}{PENDING_SUFFIX}'
+
+    def pending(self):
+        """
+        Returns the rotated files waiting to be compressed. Files claimed
+        for compression long ago are put back first, since the compression
+        failed or its process ended, unless their segment was published.
+
+        :return: Sorted paths of the rotated files not compressed yet.
+        """
+
+        limit = now() - STALE_WORK_SECONDS
+        for work_path in self._work_files():
+            base_path = work_path[:-len(WORK_SUFFIX)]
+            try:
+                if stat(work_path).st_mtime >= limit:
+                    continue
+                if path.exists(base_path + SEGMENT_SUFFIX):
+                    remove(work_path)
+                else:
+                    replace(work_path, base_path + PENDING_SUFFIX)
+            except OSError:
+                pass
+
+        pattern = glob_escape(self.file_path) + '.*' + PENDING_SUFFIX
+        return sorted(glob(pattern))
+
+    def segments(self):
+        """
+        :return: Sorted paths of the compressed segments, oldest first.
+        """
+
+        pattern = glob_escape(self.file_path) + '.*' + SEGMENT_SUFFIX
+        return sorted(glob(pattern))
+
+    def compress_pending(self):
+        """
+        Compresses every pending file, oldest first, and removes the oldest
+        segments over the limit. A file that fails stays pending and the
+        first error is raised once the rest are compressed.
+        """
+
+        errors = []
+        with self._lock:
+            for pending_path in self.pending():
+                try:
+                    self._compress(pending_path)
+                except Exception as ex:
+                    errors.append(ex)
+            self._prune()
+
+        if errors:
+            raise errors[0]
+
+    def _compress(self, pending_path):
+        # Claiming the file with a rename keeps two processes from
+        # compressing the same file. Its time marks when it was claimed
+        work_path = pending_path[:-len(PENDING_SUFFIX)] + WORK_SUFFIX
+        try:
+            replace(pending_path, work_path)
+            utime(work_path)
+        except OSError:
+            return
+
+        segment_path = work_path[:-len(WORK_SUFFIX)] + SEGMENT_SUFFIX
+        temp_path = segment_path + '.tmp'
+        name = path.basename(segment_path)
+
+        try:
+            blocks = self._write_segment(work_path, temp_path, name)
+
+            # The index goes first, so a published segment is always indexed
+            self._write_index(name, blocks)
+            replace(temp_path, segment_path)
+        except BaseException:
+            try:
+                replace(work_path, pending_path)
+            except OSError:
+                pass
+            raise
+        finally:
+            if path.exists(temp_path):
+                remove(temp_path)
+
+        remove(work_path)
+
+    def _write_segment(self, work_path, temp_path, name):
+        blocks = []
+        source = open(work_path, 'r', encoding='utf-8', errors='replace')
+        with source, open(temp_path, 'wb') as target:
+            lines = (line.rstrip('\n') for line in source)
+
+            block = []
+            size = 0
+            for entry in self._parser.entries(lines):
+                block.append(entry)
+                size += sum(len(line) + 1 for line in entry.lines)
+                if size >= self._block_size:
+                    blocks.append(self._write_block(target, name, block))
+                    block, size = [], 0
+
+            if block:
+                blocks.append(self._write_block(target, name, block))
+
+        return blocks
+
+    def _write_index(self, name, blocks):
+        """
+        Appends the members of a segment to the index, replacing the ones
+        of a previous attempt to compress the same file.
+        """
+
+        current = self._read_index()
+        if not any(block['segment'] == name for block in current):
+            with open(self.index_path, 'a', encoding='utf-8') as stream:
+                stream.write(''.join(json_dumps(item) + '\n'
+                                     for item in blocks))
+            return
+
+        blocks = [
+            block for block in current if block['segment'] != name
+        ] + blocks
+
+        temp_path = self.index_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as stream:
+            stream.write(''.join(json_dumps(block) + '\n' for block in blocks))
+        replace(temp_path, self.index_path)
+
+    def _work_files(self):
+        pattern = glob_escape(self.file_path) + '.*' + WORK_SUFFIX
+        return sorted(glob(pattern))
+
+    @staticmethod
+    def _write_block(target, name, entries):
+        text = ''.join(entry.text + '\n' for entry in entries)
+
+        compressor = compressobj(6, wbits=MAX_WBITS | 16)
+        data = compressor.compress(text.encode('utf-8')) + compressor.flush()
+
+        offset = target.tell()
+        target.write(data)
+
+        times = [entry.time for entry in entries]
+        return {
+            'segment': name,
+            'offset': offset,
+            'length': len(data),
+            'first': min(times),
+            'last': max(times),
+            'levels': sorted({entry.level for entry in entries
+                              if entry.level}),
+            'verbs': sorted({entry.verb for entry in entries if entry.verb}),
+        }
+
+    def _prune(self):
+        segments = self.segments()
+        excess = len(segments) - self._backup_count
+        if excess <= 0:
+            return
+
+        dropped = {path.basename(segment) for segment in segments[:excess]}
+        blocks = [
+            block for block in self._read_index()
+            if block['segment'] not in dropped
+        ]
+
+        temp_path = self.index_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as stream:
+            stream.write(''.join(json_dumps(block) + '\n' for block in blocks))
+        replace(temp_path, self.index_path)
+
+        for segment in segments[:excess]:
+            remove(segment)
+
+    # -------------------------------------------------------------------------
+    # Query
+    # -------------------------------------------------------------------------
+
+    def query(self, since=None, until=None, level=None, verb=None, text=None):
+        """
+        Finds the records matching every given condition, oldest first.
+
+        :param since: POSIX timestamp of the oldest record wanted.
+        :param until: POSIX timestamp of the newest record wanted.
+        :param level: Minimum level name.
+        :param verb: Verb, or its first words (``student``).
+        :param text: Text the record must contain.
+        :return: Generator of LogEntry.
+        """
+
+        levels = set(LEVEL_ORDER[LEVEL_ORDER.index(level.upper()):]) \
+            if level else None
+
+        def accepts(entry):
+            return (since is None or entry.time >= since) \
+                and (until is None or entry.time <= until) \
+                and (levels is None or entry.level in levels) \
+                and (verb is None or self._verb_matches(entry.verb, verb)) \
+                and (text is None or text in entry.text)
+
+        for block in self.blocks(since, until, levels, verb):
+            segment_path = path.join(path.dirname(self.file_path),
+                                     block['segment'])
+            try:
+                with open(segment_path, 'rb') as stream:
+                    stream.seek(block['offset'])
+                    data = stream.read(block['length'])
+            except OSError:
+                continue
+
+            lines = decompress(data, MAX_WBITS | 16).decode('utf-8')
+            for entry in self._parser.entries(lines.splitlines()):
+                if accepts(entry):
+                    yield entry
+
+        # Files being compressed, the ones not compressed yet and the active
+        # one are read in full
+        working = [
+            work_path for work_path in self._work_files()
+            if not path.exists(work_path[:-len(WORK_SUFFIX)] + SEGMENT_SUFFIX)
+        ]
+        for file_path in working + self.pending() + [self.file_path]:
+            if not path.exists(file_path):
+                continue
+
+            with open(file_path, 'r', encoding='utf-8',
+                      errors='replace') as stream:
+                lines = (line.rstrip('\n') for line in stream)
+                for entry in self._parser.entries(lines):
+                    if accepts(entry):
+                        yield entry
+
+    def blocks(self, since=None, until=None, levels=None, verb=None):
+        """
+        Returns the indexed members that may hold matching records.
+        """
+
+        selected = []
+        for block in self._read_index():
+            if since is not None and block['last'] < since:
+                continue
+            if until is not None and block['first'] > until:
+                continue
+            if levels is not None and levels.isdisjoint(block['levels']):
+                continue
+            if verb is not None and not any(
+                    self._verb_matches(item, verb) for item in block['verbs']):
+                continue
+            selected.append(block)
+
+        return selected
+
+    def _read_index(self):
+        if not path.exists(self.index_path):
+            return []
+
+        with open(self.index_path, 'r', encoding='utf-8') as stream:
+            return [json_loads(line) for line in stream if line.strip()]
+
+    @staticmethod
+    def _verb_matches(value, verb):
+        value = (value or '').split()
+        wanted = verb.split()
+
+        return value[:len(wanted)] == wanted
+
+
+class CompressingRotatingFileHandler(RotatingFileHandler):
+    """
+    Rotating file handler that compresses the rotated files in a background
+    thread, keeping ``backup_count`` compressed segments.
+
+    :param file_path: Path of the active log file.
+    :param log_format: Format the records are written with.
+    :param max_bytes: Size that triggers a rotation, 0 to never rotate.
+    :param backup_count: Number of compressed segments kept.
+    :param block_size: Bytes of text per independently readable member.
+    """
+
+    def __init__(self, file_path, log_format, max_bytes=0, backup_count=5,
+                 block_size=DEFAULT_BLOCK_SIZE):
+        backup_count = max(int(backup_count or 0), 0)
+        super(CompressingRotatingFileHandler, self).__init__(
+            file_path, maxBytes=max_bytes, backupCount=backup_count,
+            encoding='utf-8', delay=True)
+
+        self.archive = LogArchive(file_path, log_format, backup_count,
+                                  block_size)
+        self._thread = None
+        self._requested = False
+        self._thread_lock = Lock()
+
+        # Files rotated by a process that ended before compressing them
+        if self.archive.pending():
+            self._compress_in_background()
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+
+        if path.exists(self.baseFilename):
+            replace(self.baseFilename, self.archive.reserve())
+
+        self._compress_in_background()
+
+    def close(self):
+        super(CompressingRotatingFileHandler, self).close()
+
+        with self._thread_lock:
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def _compress_in_background(self):
+        """
+        Asks the compressor thread to compress the pending files, starting
+        it if it is not running. A rotation never waits for it.
+        """
+
+        with self._thread_lock:
+            self._requested = True
+            if self._thread is not None:
+                # The running thread makes another pass before it ends
+                return
+
+            # Not a daemon, so the process waits for the compression to end
+            self._thread = Thread(target=self._compress_while_requested,
+                                  name='log-compressor')
+            self._thread.start()
+
+    def _compress_while_requested(self):
+        while True:
+            with self._thread_lock:
+                if not self._requested:
+                    self._thread = None
+                    return
+                self._requested = False
+
+            try:
+                self.archive.compress_pending()
+            except Exception:
+                # The files stay pending and are retried on the next
+                # rotation, or by the next process
+                pass
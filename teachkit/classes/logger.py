@@ -1,13 +1,76 @@
-from .base import Config
+from .config import Config
+from .logfiles import CompressingRotatingFileHandler, JsonLinesFormatter, \
+    LogOperation, JSON_FORMAT
 
 from logging import getLogger, Formatter, StreamHandler, Filter
-from logging.handlers import RotatingFileHandler
 # from logging import DEBUG, INFO, WARNING, ERROR, CRITICAL
 
-from os import path, makedirs
+from os import path, makedirs, environ
+from itertools import count
 from sys import stdout, stderr
+from threading import local
+from uuid import uuid4
 from humanfriendly import parse_size
 
+# Environment variable sharing the correlation id with worker processes
+CORRELATION_ID_VARIABLE = 'TEACHKIT_CORRELATION_ID'
+
+# Operation running in each thread, whose details tag every record
+_operation = local()
+
+# Operation started last, for records logged from helper threads
+_last_operation = None
+
+# Suffixes of the loggers of each group. Unlike id(), never reused
+_logger_numbers = count(1)
+
+
+def get_correlation_id():
+    """
+    Returns the id shared by every record of this invocation of teachkit,
+    including the records of the worker processes it starts.
+
+    :return: Hexadecimal string.
+    """
+
+    correlation_id = environ.get(CORRELATION_ID_VARIABLE)
+    if not correlation_id:
+        correlation_id = uuid4().hex[:16]
+        environ[CORRELATION_ID_VARIABLE] = correlation_id
+
+    return correlation_id
+
+
+def start_operation(verb, group=None):
+    """
+    Tags the records logged from the current thread with an operation, such
+    as ``student add`` on a group, until another one is started.
+
+    :param verb: Target and verb of the operation.
+    :param group: Name of the group folder.
+    :return: LogOperation, whose counters are written with every record.
+    """
+
+    global _last_operation
+
+    operation = LogOperation(get_correlation_id(), verb, group)
+    _operation.current = operation
+    _last_operation = operation
+
+    return operation
+
+
+def get_operation():
+    """
+    :return: LogOperation running in the current thread.
+    """
+
+    operation = getattr(_operation, 'current', None) or _last_operation
+    if operation is None:
+        operation = start_operation(None)
+
+    return operation
+
 
 class ExcludeExceptionsFilter(Filter):
 
@@ -15,6 +78,22 @@ class ExcludeExceptionsFilter(Filter):
         return not record.exc_info
 
 
+class OperationFilter(Filter):
+    """
+    Adds the running operation to the records, so formats can use
+    ``%(verb)s``, ``%(group)s`` and ``%(correlation_id)s``.
+    """
+
+    def filter(self, record):
+        if not hasattr(record, 'operation'):
+            operation = get_operation()
+            record.operation = operation
+            record.verb = operation.verb
+            record.group = operation.group
+            record.correlation_id = operation.correlation_id
+        return True
+
+
 class Logger(object):
     """
     A Singleton class that configures and provides a centralized logger for the
@@ -36,13 +115,17 @@ class Logger(object):
         """
         Ensures the class follows the Singleton pattern.
         Creates a single instance of the class and reuses it in subsequent
-        calls.
+        calls. Instances created for an explicit configuration or group are
+        independent of the singleton.
 
         :param args: Positional arguments for initialization.
         :param kwargs: Keyword arguments for initialization.
         :return: The single instance of the Logger class.
         """
 
+        if args or kwargs:
+            return super().__new__(cls)
+
         if cls._instance is None:
             cls._instance = super().__new__(cls)
 
@@ -54,18 +137,28 @@ class Logger(object):
 
     _config = None
 
-    def __init__(self):
+    def __init__(self, config=None, group_path=None):
         """
         Initializes the logger and configures handlers based on the provided
         configuration.
         - Sets the logging level to the most permissive level.
         - Configures a handler for console output (verbose).
         - Configures a handler for log rotation in a file.
+
+        :param config: Config instance, the process-wide one by default.
+        :param group_path: Group folder whose metadata folder keeps the log
+                           files, the current folder by default.
         """
 
         if not getattr(self, '_logger', None):
-            self._logger = getLogger(__name__)
-            self._config = Config()
+            if config is None and group_path is None:
+                self._logger = getLogger(__name__)
+            else:
+                number = next(_logger_numbers)
+                self._logger = getLogger(f'{__name__}.group{number}')
+                self._logger.propagate = False
+
+            self._config = config or Config()
 
             log_level = self._get_most_permissive_level()
             self._logger.setLevel(log_level)
@@ -73,6 +166,8 @@ class Logger(object):
             self._configure_verbose_handler()
 
             metadata_path = self._get_config_value('metadata', 'folder')
+            if group_path:
+                metadata_path = path.join(group_path, metadata_path)
             if path.exists(metadata_path):
                 self._configure_logrotate_handler(metadata_path)
 
@@ -96,14 +191,18 @@ class Logger(object):
 
     def close(self):
         """
-        Close all handlers associated with the logger.
-        :param logger: Instance of logging.Logger.
+        Close all handlers associated with the logger. The logger of a group
+        is also dropped from the logging registry, which would keep it
+        forever otherwise.
         """
         handlers = self.logger.handlers[:]
         for handler in handlers:
             handler.close()
             self.logger.removeHandler(handler)
 
+        if self.logger.name != __name__:
+            self.logger.manager.loggerDict.pop(self.logger.name, None)
+
     # -------------------------------------------------------------------------
     # Configuration
     # -------------------------------------------------------------------------
@@ -136,9 +235,12 @@ class Logger(object):
 
     def _configure_logrotate_handler(self, metadata_path):
         """
-        Configures the RotatingFileHandler for log file rotation.
+        Configures the CompressingRotatingFileHandler for log file rotation.
         - Retrieves the file path, logging level, maximum file size, and backup
         count from the configuration.
+        - Rotated files are compressed in the background and indexed, so
+        ``teachkit log`` can search them.
+        - The ``json`` format writes a JSON document per record instead.
         - Adds the handler to the main logger.
 
         :param metadata_path: Path to the group metadata folder.
@@ -152,16 +254,24 @@ class Logger(object):
         backup_count = self._get_config_value('file_logging', 'backup_count')
 
         log_format = self._get_config_value('file_logging', 'format')
-        log_formater = Formatter(log_format)
+        if log_format.strip().lower() == JSON_FORMAT:
+            log_formater = JsonLinesFormatter()
+        else:
+            log_formater = Formatter(log_format)
 
         max_size = self._get_config_value('file_logging', 'max_size')
         max_size = self._safe_parse_humanfriendly_size(max_size, 0)
 
-        file_handler = RotatingFileHandler(
-            file_path, maxBytes=max_size, backupCount=backup_count
+        block_size = self._get_config_value('file_logging', 'block_size')
+        block_size = self._safe_parse_humanfriendly_size(block_size, 0)
+
+        file_handler = CompressingRotatingFileHandler(
+            file_path, log_format, max_bytes=max_size,
+            backup_count=backup_count, block_size=block_size
         )
         file_handler.setLevel(log_level)
         file_handler.setFormatter(log_formater)
+        file_handler.addFilter(OperationFilter())
 
         self._logger.addHandler(file_handler)
 
@@ -0,0 +1,686 @@
+from .base import Base
+from .archive import ArchiveWriter, ARCHIVE_FORMATS
+from .fingerprint import FingerprintCache
+from .status import StatusEngine, UNTOUCHED
+from .registry import ExerciseRegistry, EXERCISE_PATTERN, \
+    EXERCISE_FOLDER_FORMAT, parse_exercise_number
+from .publisher import SitePublisher
+from .cover import read_group_values
+from .variants import VariantTemplate, VARIANTS_FILE, get_group_seed
+from .writer import get_writer
+
+from os import path, listdir, makedirs
+from csv import writer as csv_writer
+from datetime import datetime
+from io import StringIO
+from re import match as re_match
+from pathvalidate import sanitize_filename
+
+_COLLECTION_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS collection_state (
+    exercise TEXT NOT NULL,
+    member TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    PRIMARY KEY (exercise, member)
+) WITHOUT ROWID;
+'''
+
+
+class Resource(Base):
+
+    def __init__(self, context=None):
+        super(Resource, self).__init__(context)
+
+        self._topic = self.arguments.get('topic', None)
+        self._category = self.arguments.get('category', None)
+        self._exercise = self.arguments.get('exercise', None)
+
+    # -------------------------------------------------------------------------
+    # Properties
+    # -------------------------------------------------------------------------
+
+    @property
+    def registry(self):
+        """
+        Returns the registry of the exercises in the group resources.
+
+        :return: Instance of ExerciseRegistry.
+        """
+
+        if getattr(self, '_registry', None) is None:
+            self._registry = ExerciseRegistry(self.store, self.resources_path)
+
+        return self._registry
+
+    # -------------------------------------------------------------------------
+    # Add
+    # -------------------------------------------------------------------------
+
+    def create(self):
+        """
+        Copies an exercise of the resources into the student folders. When
+        the exercise does not exist yet, a new folder is created for it in
+        the resources with the next number of the group.
+
+        :return: Path of the exercise relative to the resources folder.
+        """
+
+        self.ensure_within_the_group(raise_exception=True)
+
+        if not (self._topic and self._category and self._exercise):
+            message = 'Topic, category and exercise are required.'
+            self.exception(ValueError, message)
+
+        found = self.registry.resolve(
+            self._exercise, self._topic, self._category)
+        if len(found) > 1:
+            self._raise_ambiguous(found)
+
+        if not found:
+            return self._create_exercise()
+
+        return self._assign(found[0])
+
+    def _create_exercise(self):
+        if parse_exercise_number(self._exercise) is not None:
+            message = 'Exercise "%s" does not exist in "%s/%s".'
+            self.exception(FileNotFoundError, message, self._exercise,
+                           self._topic, self._category)
+
+        title = sanitize_filename(self._exercise.strip(), platform='auto')
+        if not title:
+            message = 'Invalid exercise name "%s".'
+            self.exception(ValueError, message, self._exercise)
+
+        number = self.registry.allocate()
+        folder = EXERCISE_FOLDER_FORMAT.format(number, title)
+        relative_path = path.join(self._topic, self._category, folder)
+
+        self._mkdir(path.join(self.resources_path, relative_path))
+        self.registry.register(self._topic, self._category, folder)
+
+        message = 'Exercise "{}" was created in the resources.'
+        self._print(message, relative_path.replace(path.sep, '/'))
+
+        return relative_path
+
+    def _assign(self, exercise):
+        """
+        Copies an exercise into the selected student folders and personalises
+        the copies when the exercise has a ``variants.ini`` file.
+
+        :param exercise: Exercise found in the registry.
+        :return: Path of the exercise relative to the resources folder.
+        """
+
+        relative_path = self.registry.relative_path(exercise)
+        source_path = self.registry.path_of(exercise)
+        folders = self._check_quotas(
+            self._get_selected_students(), source_path, relative_path,
+            overwrite=self._force, exclude=(VARIANTS_FILE,))
+        pairs = [
+            (source_path, path.join(self.group_path, folder, relative_path))
+            for folder in folders
+        ]
+
+        copier = self._make_copier(exclude=(VARIANTS_FILE,))
+        results = self.engine.copy_many(copier, pairs, overwrite=self._force)
+        for (_, target), result in zip(pairs, results):
+            if isinstance(result, Exception):
+                message = 'Failed to copy the exercise to %s. %s'
+                self.exception(OSError, message, target, result)
+
+        self._count('students', len(pairs))
+
+        personalised = self._personalise(source_path, relative_path, folders)
+
+        message = 'Exercise "{}" was added to {} students.'
+        self._print(message, relative_path.replace(path.sep, '/'),
+                    len(pairs))
+        if personalised:
+            message = '{} files were personalised.'
+            self._print(message, personalised)
+
+        self.info('Exercise %s added to %s students, %s files personalised',
+                  relative_path, len(pairs), personalised)
+
+        return relative_path
+
+    # -------------------------------------------------------------------------
+    # Set
+    # -------------------------------------------------------------------------
+
+    def set(self):
+        """
+        Assigns an existing exercise to the students. When the exercise has
+        a ``variants.ini`` file, every student gets their own variant,
+        reproducible from the group seed.
+
+        :return: Path of the exercise relative to the resources folder.
+        """
+
+        self.ensure_within_the_group(raise_exception=True)
+
+        if not (self._topic and self._category and self._exercise):
+            message = 'Topic, category and exercise are required.'
+            self.exception(ValueError, message)
+
+        found = self.registry.resolve(
+            self._exercise, self._topic, self._category)
+        if len(found) > 1:
+            self._raise_ambiguous(found)
+
+        if not found:
+            message = 'Exercise "%s" does not exist in "%s/%s".'
+            self.exception(FileNotFoundError, message, self._exercise,
+                           self._topic, self._category)
+
+        return self._assign(found[0])
+
+    def _personalise(self, source_path, relative_path, folders):
+        """
+        Renders the template files of an exercise for the given students. The
+        values of the whole group are generated at once, so the answer key
+        always lists every student. Copies a student already changed are
+        only rendered again with ``--force``.
+
+        :return: Number of files written.
+        """
+
+        variants = self._load_variants(source_path, relative_path)
+        if variants is None:
+            return 0
+
+        template, values, students, sources = variants
+        positions = {folder: index for index, folder in enumerate(students)}
+        writer = get_writer()
+
+        def render(folder):
+            text = self._format_variant(template, values, positions, folder)
+
+            written = 0
+            target_path = path.join(self.group_path, folder, relative_path)
+            for relative, content in sources.items():
+                file_path = path.join(target_path, *relative.split('/'))
+                if not self._force and path.exists(file_path):
+                    with open(file_path, 'r', encoding='utf-8') as stream:
+                        if stream.read() != content:
+                            continue
+
+                makedirs(path.dirname(file_path), exist_ok=True)
+                written += writer.write(
+                    file_path, template.render(content, text))
+
+            return written
+
+        with writer.batch():
+            written = sum(self.engine.map(render, folders))
+
+        exercise = path.basename(relative_path)
+        self._write_variant_key(exercise, template, values, students)
+        self._count('variants', len(folders))
+
+        return written
+
+    def _load_variants(self, source_path, relative_path):
+        """
+        Loads the template of an exercise and generates the values of every
+        student of the group.
+
+        :return: Tuple ``(template, values, students, sources)``, where
+                 ``sources`` maps the relative path of every template file to
+                 its content, or None if the exercise is not a template.
+        """
+
+        spec_path = path.join(source_path, VARIANTS_FILE)
+        if not path.isfile(spec_path):
+            return None
+
+        exercise = path.basename(relative_path)
+        number = parse_exercise_number(exercise)
+        students = self.student_paths
+
+        try:
+            template = VariantTemplate.load(spec_path)
+            seed = self.get_config_value('variants', 'seed') \
+                or get_group_seed(self.store)
+            values = template.generate(seed, number or exercise, students)
+        except (ImportError, ValueError) as ex:
+            message = 'Cannot personalise exercise "%s". %s'
+            self.exception(type(ex), message, exercise, ex)
+
+        sources = {}
+        for entry in self._make_walker().files(source_path):
+            if template.matches(entry.relative):
+                with open(entry.path, 'r', encoding='utf-8') as stream:
+                    sources[entry.relative] = stream.read()
+
+        return template, values, students, sources
+
+    @staticmethod
+    def _format_variant(template, values, positions, folder):
+        text = template.format(values, positions[folder])
+        text['folder'] = folder
+
+        return text
+
+    def _get_variant_digests(self, source_path, relative_path, folders):
+        """
+        Renders the template files of an exercise for the given students, so
+        their copies are compared with their own variant and not with the
+        template.
+
+        :return: Dictionary mapping student folders to dictionaries that map
+                 relative paths to the digest of the rendered content.
+        """
+
+        variants = self._load_variants(source_path, relative_path)
+        if variants is None:
+            return {}
+
+        template, values, students, sources = variants
+        positions = {folder: index for index, folder in enumerate(students)}
+
+        digests = {}
+        for folder in folders:
+            if folder not in positions:
+                continue
+
+            text = self._format_variant(template, values, positions, folder)
+            digests[folder] = {
+                relative: FingerprintCache.hash_content(
+                    template.render(content, text).encode('utf-8'))
+                for relative, content in sources.items()
+            }
+
+        return digests
+
+    def _write_variant_key(self, exercise, template, values, students):
+        """
+        Writes the values of every student to
+        ``.metadata/variants/<exercise>.csv``, to grade the answers.
+        """
+
+        names = [parameter.name for parameter in template.parameters]
+
+        buffer = StringIO()
+        rows = csv_writer(buffer, lineterminator='\n')
+        rows.writerow(['student'] + names)
+        for index, folder in enumerate(students):
+            text = template.format(values, index)
+            rows.writerow([folder] + [text[name] for name in names])
+
+        folder = path.join(self.metadata_path, 'variants')
+        self._mkdir(folder)
+        get_writer().write(path.join(folder, f'{exercise}.csv'),
+                           buffer.getvalue())
+
+    # -------------------------------------------------------------------------
+    # Delete
+    # -------------------------------------------------------------------------
+
+    def delete(self):
+        """
+        Removes the student copies of an exercise and, with ``--resources``,
+        the exercise itself.
+
+        :return: Number of student copies removed.
+        """
+
+        self.ensure_within_the_group(raise_exception=True)
+
+        found = self.registry.resolve(self._exercise)
+        if not found:
+            message = 'Exercise "%s" does not exist.'
+            self.exception(FileNotFoundError, message, self._exercise)
+        if len(found) > 1:
+            self._raise_ambiguous(found)
+
+        exercise = found[0]
+        relative_path = self.registry.relative_path(exercise)
+
+        copies = [
+            self._find_student_copy(
+                path.join(self.group_path, folder), relative_path)
+            for folder in self._get_selected_students()
+        ]
+        copies = [copy for copy in copies if copy]
+        self.engine.map(self._rmtree, copies)
+
+        if self.arguments.get('resources', False):
+            self._rmtree(self.registry.path_of(exercise))
+            self.registry.unregister(exercise)
+
+        message = 'Exercise "{}" was removed from {} students.'
+        self._print(message, relative_path.replace(path.sep, '/'),
+                    len(copies))
+
+        return len(copies)
+
+    # -------------------------------------------------------------------------
+    # Get
+    # -------------------------------------------------------------------------
+
+    def get(self):
+        """
+        Shows whether each student's copy of the selected exercises is
+        untouched, modified or missing compared with the resources.
+        """
+
+        self.ensure_within_the_group(raise_exception=True)
+
+        folders = self.student_paths
+        if not folders:
+            self._print('There are no students in this group yet.')
+            return
+
+        show_files = bool(self.arguments.get('files', False))
+        statuses = self.get_status(folders)
+
+        for exercise, result in statuses.items():
+            for folder in folders:
+                status, files = result[folder]
+                self._print('{}  {}  {}', status.ljust(9), folder, exercise)
+
+                if not show_files:
+                    continue
+
+                for relative, file_status in sorted(files.items()):
+                    if file_status != UNTOUCHED:
+                        self._print('    {}  {}', file_status.ljust(9),
+                                    relative)
+
+        return statuses
+
+    def get_status(self, folders):
+        """
+        Computes the status of the selected exercises for several students.
+
+        :param folders: Student folder names.
+        :return: Dictionary mapping each exercise path to a dictionary that
+                 maps student folders to ``(status, files)``.
+        """
+
+        workers = self.get_config_value('parallel', 'workers')
+        fingerprints = FingerprintCache(self.store, workers)
+        walker = self._make_walker(exclude=(VARIANTS_FILE,))
+        engine = StatusEngine(fingerprints, self.engine, walker)
+
+        exercises = self._list_exercises(
+            self._topic, self._category, self._exercise)
+
+        statuses = {}
+        for relative_path in exercises:
+            source_path = path.join(self.resources_path, relative_path)
+            targets = {
+                folder: self._find_student_copy(
+                    path.join(self.group_path, folder), relative_path)
+                for folder in folders
+            }
+
+            rendered = self._get_variant_digests(
+                source_path, relative_path, folders)
+
+            exercise = relative_path.replace(path.sep, '/')
+            statuses[exercise] = engine.compare_many(
+                source_path, targets, rendered)
+
+        # Every exercise of every student was compared, so the fingerprints
+        # not looked up belong to files that are gone
+        whole_group = set(folders) == set(self.student_paths)
+        if whole_group and not (self._topic or self._category
+                                or self._exercise):
+            removed = fingerprints.prune()
+            if removed:
+                self.info('%s stale fingerprints removed', removed)
+
+        return statuses
+
+    # -------------------------------------------------------------------------
+    # Collect
+    # -------------------------------------------------------------------------
+
+    def collect(self):
+        """
+        Gathers every student's copy of an exercise into a single archive,
+        each one under a folder named after the student. With
+        ``--incremental``, nothing is written when no file changed.
+
+        :return: Path of the archive, or None if none was written.
+        """
+
+        self.ensure_within_the_group(raise_exception=True)
+
+        relative_path = self._resolve_exercise(
+            self._topic, self._category, self._exercise)
+        exercise_name = path.basename(relative_path)
+
+        archive_format = self.arguments.get('format', None) or 'zip'
+        incremental = bool(self.arguments.get('incremental', False))
+
+        self.store.ensure_schema(_COLLECTION_SCHEMA)
+        key = relative_path.replace(path.sep, '/')
+        previous = self._load_collection_state(key) if incremental else {}
+
+        current = {}
+        members = self._iter_submissions(relative_path, previous, current)
+
+        # An empty archive would only clutter the collections, and the
+        # baseline is kept as it is
+        if incremental:
+            members = list(members)
+            if not members:
+                self.info('Nothing changed in %s since the last collection',
+                          key)
+                self._print('No files changed since the last collection.')
+                return None
+
+        file_path = self._get_collection_path(
+            exercise_name, archive_format, incremental)
+
+        workers = self.get_config_value('parallel', 'workers')
+        with ArchiveWriter(file_path, archive_format, workers) as archive:
+            archive.add_files(members)
+
+        self._save_collection_state(key, current)
+
+        message = 'Collected {} files ({} bytes) into "{}".'
+        self._print(message, archive.files, archive.bytes, file_path)
+
+        return file_path
+
+    def _iter_submissions(self, relative_path, previous, current):
+        """
+        Yields ``(source_path, member_name)`` for every file found in the
+        student copies of the exercise. Files whose size and modification
+        time match ``previous`` are skipped. ``current`` is filled with the
+        state of every file found.
+        """
+
+        walker = self._make_walker()
+        for folder in self.student_paths:
+            student_path = path.join(self.group_path, folder)
+            exercise_path = self._find_student_copy(student_path, relative_path)
+            if not exercise_path:
+                continue
+
+            exercise_name = path.basename(exercise_path)
+            for entry in walker.files(exercise_path):
+                member = '/'.join((folder, exercise_name, entry.relative))
+
+                file_stat = entry.stat()
+                state = (file_stat.st_size, file_stat.st_mtime_ns)
+                current[member] = state
+
+                if previous.get(member) != state:
+                    yield entry.path, member
+
+    def _get_collection_path(self, exercise_name, archive_format, incremental):
+        output = self.arguments.get('output', None)
+        if output:
+            return path.abspath(output)
+
+        folder = path.join(self.metadata_path, 'collections')
+        self._mkdir(folder)
+
+        file_name = exercise_name
+        if incremental:
+            stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            file_name = f'{exercise_name}_{stamp}'
+
+        return path.join(folder, file_name + ARCHIVE_FORMATS[archive_format])
+
+    def _load_collection_state(self, key):
+        rows = self.store.connection.execute(
+            'SELECT member, size, mtime_ns FROM collection_state '
+            'WHERE exercise = ?', (key,)
+        )
+
+        return {member: (size, mtime_ns) for member, size, mtime_ns in rows}
+
+    def _save_collection_state(self, key, state):
+        rows = [
+            (key, member, size, mtime_ns)
+            for member, (size, mtime_ns) in state.items()
+        ]
+
+        with self.store.transaction() as connection:
+            connection.execute(
+                'DELETE FROM collection_state WHERE exercise = ?', (key,))
+            connection.executemany(
+                'INSERT INTO collection_state '
+                '(exercise, member, size, mtime_ns) VALUES (?, ?, ?, ?)', rows
+            )
+
+    # -------------------------------------------------------------------------
+    # Publish
+    # -------------------------------------------------------------------------
+
+    def publish(self):
+        """
+        Writes a static HTML site with the topics, categories and exercises
+        of the resources. Only the pages whose files changed since the last
+        publication are rendered again.
+
+        :return: Path of the site index.
+        """
+
+        self.ensure_within_the_group(raise_exception=True)
+
+        output = self.arguments.get('output', None)
+        if output:
+            output = path.abspath(output)
+        else:
+            output = path.join(self.metadata_path, 'site')
+
+        values = read_group_values(self.config_path, self.group_path,
+                                   len(self.student_paths))
+        publisher = SitePublisher(self.resources_path, output,
+                                  self._make_walker(), self.engine,
+                                  title=values['name'] or None)
+        index_path = publisher.publish(force=self._force)
+
+        self._count('pages_rendered', publisher.rendered)
+        self._count('pages_removed', publisher.removed)
+
+        message = '{} pages ({} rendered, {} written, {} removed) in "{}".'
+        self._print(message, publisher.pages, publisher.rendered,
+                    publisher.written, publisher.removed, index_path)
+        self.info('Resources published to %s', output)
+
+        return index_path
+
+    # -------------------------------------------------------------------------
+    # Auxiliary methods
+    # -------------------------------------------------------------------------
+
+    def _resolve_exercise(self, topic, category, exercise):
+        """
+        Finds an exercise folder in the group resources. The exercise can be
+        given by its full folder name, by its ``EX###`` prefix or by number.
+
+        :return: Path of the exercise relative to the resources folder.
+        """
+
+        if not (topic and category and exercise):
+            message = 'Topic, category and exercise are required.'
+            self.exception(ValueError, message)
+
+        category_path = path.join(self.resources_path, topic, category)
+        if not path.isdir(category_path):
+            message = 'Category "%s/%s" does not exist in the resources.'
+            self.exception(FileNotFoundError, message, topic, category)
+
+        found = self.registry.resolve(exercise, topic, category)
+        if len(found) > 1:
+            self._raise_ambiguous(found)
+        if found:
+            return self.registry.relative_path(found[0])
+
+        message = 'Exercise "%s" does not exist in "%s/%s".'
+        self.exception(FileNotFoundError, message, exercise, topic, category)
+
+    def _raise_ambiguous(self, exercises):
+        message = 'Several exercises match "%s": %s.'
+        self.exception(ValueError, message, self._exercise, ', '.join(
+            '/'.join(exercise[:3]) for exercise in exercises))
+
+    def _list_exercises(self, topic=None, category=None, exercise=None):
+        """
+        Lists the exercises selected by the given topic, category and
+        exercise. Missing arguments select every folder at that level.
+
+        :return: Paths of the exercises relative to the resources folder.
+        """
+
+        if exercise:
+            return [self._resolve_exercise(topic, category, exercise)]
+
+        resources_path = self.resources_path
+        topics = [topic] if topic else self._list_folders(resources_path)
+
+        exercises = []
+        for topic_name in topics:
+            topic_path = path.join(resources_path, topic_name)
+            if category:
+                categories = [category]
+            else:
+                categories = self._list_folders(topic_path)
+
+            for category_name in categories:
+                category_path = path.join(topic_path, category_name)
+                for folder in self._list_folders(category_path):
+                    if re_match(EXERCISE_PATTERN, folder):
+                        exercises.append(
+                            path.join(topic_name, category_name, folder))
+
+        return exercises
+
+    @staticmethod
+    def _list_folders(base_path):
+        if not path.isdir(base_path):
+            return []
+
+        return [
+            folder for folder in sorted(listdir(base_path))
+            if path.isdir(path.join(base_path, folder))
+        ]
+
+    @staticmethod
+    def _find_student_copy(student_path, relative_path):
+        """
+        Locates the student copy of an exercise, either keeping the topic and
+        category folders of the resources or directly in the student folder.
+        """
+
+        candidates = (
+            path.join(student_path, relative_path),
+            path.join(student_path, path.basename(relative_path)),
+        )
+
+        for candidate in candidates:
+            if path.isdir(candidate):
+                return candidate
+
+        return None
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+Name index
+==========
+Keeps the full name of every student of the group, keyed by the folder name
+it was sanitized into, in the group database. Two names that end up in the
+same folder are caught with a single key lookup before the folder is
+created, and names that are merely alike (``Jose Perez``, ``José Peres``)
+are found through an inverted index of their trigrams, so only the students
+sharing some trigram with the new name are ever compared with it.
+"""
+
+from collections import Counter
+from re import sub as re_sub
+from threading import Lock
+from unidecode import unidecode
+
+DEFAULT_SIMILARITY = 0.75
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS student_name (
+    folder TEXT PRIMARY KEY,
+    name TEXT NOT NULL
+) WITHOUT ROWID;
+'''
+
+
+class NameIndex(object):
+    """
+    Index of student names stored in the group database.
+
+    :param store: GroupStore holding the index.
+    :param similarity: Minimum similarity, from 0 to 1, for two names to be
+                       reported as alike.
+    """
+
+    def __init__(self, store, similarity=DEFAULT_SIMILARITY):
+        self._store = store
+        self._similarity = float(similarity)
+
+        self._names = None
+        self._trigrams = {}
+        self._lock = Lock()
+
+    # -------------------------------------------------------------------------
+    # Public methods
+    # -------------------------------------------------------------------------
+
+    def sync(self, folders):
+        """
+        Brings the index in line with the student folders on disk. Folders
+        created before the index existed are added with a name guessed from
+        the folder, and folders removed by hand are forgotten.
+
+        :param folders: Student folder names found in the group.
+        """
+
+        self._load()
+
+        folders = set(folders)
+        missing = [
+            (folder, folder.replace('_', ' '))
+            for folder in folders if folder not in self._names
+        ]
+        stale = [(folder,) for folder in self._names if folder not in folders]
+
+        if not missing and not stale:
+            return
+
+        with self._store.transaction() as connection:
+            connection.executemany(
+                'INSERT OR IGNORE INTO student_name (folder, name) '
+                'VALUES (?, ?)', missing
+            )
+            connection.executemany(
+                'DELETE FROM student_name WHERE folder = ?', stale
+            )
+
+        with self._lock:
+            for folder, name in missing:
+                self._index(folder, name)
+            for (folder,) in stale:
+                self._forget(folder)
+
+    def get(self, folder):
+        """
+        :param folder: Student folder name.
+        :return: Full name of the student using that folder, or None.
+        """
+
+        self._load()
+
+        return self._names.get(folder)
+
+    def claim(self, folder, name):
+        """
+        Registers a new student. The database decides which name keeps the
+        folder, so two processes adding students at once cannot both get it.
+
+        :param folder: Folder name the student name was sanitized into.
+        :param name: Full name of the student.
+        :return: None if the folder was free, or the name already using it.
+        """
+
+        self._load()
+
+        with self._store.transaction() as connection:
+            cursor = connection.execute(
+                'INSERT OR IGNORE INTO student_name (folder, name) '
+                'VALUES (?, ?)', (folder, name)
+            )
+            if not cursor.rowcount:
+                row = connection.execute(
+                    'SELECT name FROM student_name WHERE folder = ?',
+                    (folder,)
+                ).fetchone()
+                return row[0]
+
+        with self._lock:
+            self._index(folder, name)
+
+        return None
+
+    def remove(self, folder):
+        """
+        :param folder: Student folder name to forget.
+        """
+
+        self._load()
+
+        with self._store.transaction() as connection:
+            connection.execute(
+                'DELETE FROM student_name WHERE folder = ?', (folder,))
+
+        with self._lock:
+            self._forget(folder)
+
+    def similar(self, name, exclude=None):
+        """
+        Finds the students whose names look like the given one.
+
+        :param name: Full name to compare.
+        :param exclude: Folder name left out of the results.
+        :return: List of ``(similarity, folder, name)``, most alike first.
+        """
+
+        self._load()
+
+        trigrams = self.trigrams(name)
+        if not trigrams:
+            return []
+
+        shared = Counter()
+        with self._lock:
+            for trigram in trigrams:
+                shared.update(self._trigrams.get(trigram, ()))
+
+            matches = []
+            for folder, count in shared.items():
+                if folder == exclude:
+                    continue
+
+                other = self.trigrams(self._names[folder])
+                score = 2 * count / (len(trigrams) + len(other))
+                if score >= self._similarity:
+                    matches.append((score, folder, self._names[folder]))
+
+        matches.sort(key=lambda match: (-match[0], match[1]))
+
+        return matches
+
+    @staticmethod
+    def normalize(name):
+        """
+        Reduces a name to lowercase ASCII words separated by single spaces.
+        """
+
+        name = unidecode(name or '').lower()
+        return re_sub(r'[^a-z0-9]+', ' ', name).strip()
+
+    @classmethod
+    def trigrams(cls, name):
+        """
+        Returns the trigrams of every word of a name, padded with spaces, so
+        the order of the words does not matter.
+
+        :param name: Full name.
+        :return: Set of three character strings.
+        """
+
+        result = set()
+        for word in cls.normalize(name).split():
+            padded = f' {word} '
+            result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+
+        return result
+
+    # -------------------------------------------------------------------------
+    # Auxiliary methods
+    # -------------------------------------------------------------------------
+
+    def _index(self, folder, name):
+        self._forget(folder)
+
+        self._names[folder] = name
+        for trigram in self.trigrams(name):
+            self._trigrams.setdefault(trigram, set()).add(folder)
+
+    def _forget(self, folder):
+        name = self._names.pop(folder, None)
+        if name is None:
+            return
+
+        for trigram in self.trigrams(name):
+            folders = self._trigrams.get(trigram)
+            if folders is not None:
+                folders.discard(folder)
+                if not folders:
+                    del self._trigrams[trigram]
+
+    def _load(self):
+        if self._names is not None:
+            return
+
+        self._store.ensure_schema(_SCHEMA)
+        rows = self._store.connection.execute(
+            'SELECT folder, name FROM student_name')
+
+        with self._lock:
+            if self._names is not None:
+                return
+
+            self._names = {}
+            for folder, name in rows:
+                self._index(folder, name)
@@ -1,6 +1,16 @@
 from argparse import ArgumentParser, ArgumentTypeError
 from os import getcwd, path
 
+# Verbs implemented by a method with a different name
+VERB_METHODS = {
+    'list': 'read',
+    'add': 'create',
+    'del': 'delete',
+}
+
+# Verb typed for each of those methods
+METHOD_VERBS = {method: verb for verb, method in VERB_METHODS.items()}
+
 
 class CommandLineInterface(object):
 
@@ -12,7 +22,11 @@ class CommandLineInterface(object):
 
     _instance = None
 
-    def __new__(cls, *args, **kwargs):
+    def __new__(cls, argv=None):
+        # Parsing an explicit list of arguments never touches the singleton
+        if argv is not None:
+            return super().__new__(cls)
+
         if cls._instance is None:
             cls._instance = super().__new__(cls)
 
@@ -22,14 +36,59 @@ class CommandLineInterface(object):
     # Constructor
     # -------------------------------------------------------------------------
 
-    def __init__(self):
+    def __init__(self, argv=None):
         """
         Initialize the CommandLineInterface instance and configure the argument parser.
+
+        Args:
+            argv (list): Arguments to parse instead of ``sys.argv``.
         """
-        self.parser = argparse.ArgumentParser(description=self._title)
+        if getattr(self, '_args', None) is not None:
+            return
+
+        self.parser = ArgumentParser(description=self._title)
 
         self._configure_parser()
-        self._args = self.parser.parse_args()
+        self._args = self.parser.parse_args(argv)
+
+    # -------------------------------------------------------------------------
+    # Properties
+    # -------------------------------------------------------------------------
+
+    @property
+    def target(self):
+        """
+        Kind of object the command operates on (group, student, ...).
+        """
+        return self._args.command
+
+    @property
+    def action(self):
+        """
+        Name of the method that implements the requested verb.
+        """
+        verb = getattr(self._args, 'action', None)
+        return VERB_METHODS.get(verb, verb)
+
+    @property
+    def cwd(self):
+        """
+        Group folder the command operates on. ``group add`` receives it as
+        its argument, every other command runs from within the group.
+        """
+        if self.target == 'group' and self.action == 'create':
+            return path.abspath(self._args.directory)
+
+        # A deleted group is restored into the folder it had
+        directory = getattr(self._args, 'directory', None)
+        if self.target == 'group' and self.action == 'restore' and directory:
+            return path.abspath(directory)
+
+        return getcwd()
+
+    @property
+    def args_dict(self):
+        return dict(vars(self._args))
 
     # -------------------------------------------------------------------------
     # Configure parser
@@ -48,6 +107,10 @@ class CommandLineInterface(object):
         self._add_group_parser(subparsers)
         self._add_student_parser(subparsers)
         self._add_resource_parser(subparsers)
+        self._add_session_parser(subparsers)
+        self._add_run_parser(subparsers)
+        self._add_log_parser(subparsers)
+        self._add_grade_parser(subparsers)
 
     def _add_group_parser(self, subparsers):
         """
@@ -88,8 +151,61 @@ class CommandLineInterface(object):
         del_help = "Directory of the group to delete"
         del_parser.add_argument("directory", help=del_help, type=str)
 
-        print_help = "Print detailed information about the group"
-        group_subparsers.add_parser("print", help=print_help)
+        print_help = "Write the cover pages of the group and its students"
+        print_parser = group_subparsers.add_parser("print", help=print_help)
+        self._add_cover_options(print_parser)
+
+        du_help = "Show the disk space used by students, resources and metadata"
+        du_parser = group_subparsers.add_parser("du", help=du_help)
+        du_help = "Number of largest exercises to show"
+        du_parser.add_argument("--top", default=10, help=du_help, type=int)
+
+        sync_help = "Upload the changes of the group to the learning platform"
+        sync_parser = group_subparsers.add_parser("sync", help=sync_help)
+        sync_help = "Kinds of data to upload (all by default)"
+        sync_parser.add_argument(
+            "--only", nargs="+", help=sync_help,
+            choices=("roster", "resources", "exercises")
+        )
+        sync_help = "Upload everything, not only what changed"
+        sync_parser.add_argument("--full", action="store_true", help=sync_help)
+        sync_help = "Show what would be uploaded without uploading it"
+        sync_parser.add_argument(
+            "--dry-run", dest="dry_run", action="store_true", help=sync_help
+        )
+        sync_help = "Base URL of the platform API ([sync] url by default)"
+        sync_parser.add_argument("--url", help=sync_help, type=str)
+
+        snapshot_help = "Save the group in the snapshot repository"
+        snapshot_parser = group_subparsers.add_parser(
+            "snapshot", help=snapshot_help
+        )
+        snapshot_help = "Description of the snapshot"
+        snapshot_parser.add_argument("--message", help=snapshot_help, type=str)
+        snapshot_help = "List the snapshots of the group instead"
+        snapshot_parser.add_argument(
+            "--list", action="store_true", help=snapshot_help
+        )
+        self._add_repository_option(snapshot_parser)
+
+        restore_help = "Bring the group back to the state of a snapshot"
+        restore_parser = group_subparsers.add_parser(
+            "restore", help=restore_help
+        )
+        restore_help = "Snapshot to restore (the latest one by default)"
+        restore_parser.add_argument(
+            "snapshot", nargs="?", help=restore_help, type=str
+        )
+        restore_help = "Group folder, needed if the group was deleted"
+        restore_parser.add_argument("--directory", help=restore_help, type=str)
+        restore_help = "Remove the files that are not in the snapshot"
+        restore_parser.add_argument(
+            "--clean", action="store_true", help=restore_help
+        )
+        self._add_repository_option(restore_parser)
+
+        self._add_groups_option(group_subparsers,
+                                exclude=("add", "restore"))
 
     def _add_student_parser(self, subparsers):
         """
@@ -106,14 +222,85 @@ class CommandLineInterface(object):
             dest="action", required=True, help=action_help
         )
 
-        student_subparsers.add_parser(
-            "list", help="List all students in the current group"
+        list_help = "List all students in the current group"
+        list_parser = student_subparsers.add_parser("list", help=list_help)
+        list_help = "Output format"
+        list_parser.add_argument(
+            "--format", choices=("table", "csv", "json", "jsonl"),
+            default="table", help=list_help
+        )
+        list_help = "Field used to sort the students"
+        list_parser.add_argument(
+            "--sort", default="name", help=list_help,
+            choices=("position", "created", "days", "accessed", "time", "name")
+        )
+        list_help = "Sort in descending order"
+        list_parser.add_argument("--reverse", action="store_true", help=list_help)
+        list_help = "Comma separated list of fields to show"
+        list_parser.add_argument("--fields", help=list_help, type=str)
+        list_help = "Page number to show, starting at 1"
+        list_parser.add_argument("--page", help=list_help, type=int)
+        list_help = "Number of students per page"
+        list_parser.add_argument(
+            "--page-size", dest="page_size", default=50, help=list_help,
+            type=int
+        )
+
+        activity_help = "Show recent work, file count and size per student"
+        activity_parser = student_subparsers.add_parser(
+            "activity", help=activity_help
+        )
+        activity_help = "Output format"
+        activity_parser.add_argument(
+            "--format", choices=("table", "csv", "json", "jsonl"),
+            default="table", help=activity_help
+        )
+        activity_help = "Field used to sort the students"
+        activity_parser.add_argument(
+            "--sort", default="name", help=activity_help,
+            choices=("modified", "days", "files", "size", "name")
+        )
+        activity_help = "Sort in descending order"
+        activity_parser.add_argument(
+            "--reverse", action="store_true", help=activity_help
+        )
+
+        du_help = "Show the disk space used by each student"
+        du_parser = student_subparsers.add_parser("du", help=du_help)
+        du_help = "Output format"
+        du_parser.add_argument(
+            "--format", choices=("table", "csv", "json", "jsonl"),
+            default="table", help=du_help
+        )
+        du_help = "Field used to sort the rows (size by default)"
+        du_parser.add_argument(
+            "--sort", help=du_help,
+            choices=("files", "size", "quota", "usage", "name", "exercise")
+        )
+        du_help = "Reverse the sort order"
+        du_parser.add_argument("--reverse", action="store_true", help=du_help)
+        du_help = "Show one row per exercise of each student"
+        du_parser.add_argument(
+            "--exercises", action="store_true", help=du_help
+        )
+
+        update_help = "Copy the group resources into the student folders"
+        update_parser = student_subparsers.add_parser(
+            "update", help=update_help
+        )
+        update_help = "Replace the files that already exist"
+        update_parser.add_argument(
+            "--force", action="store_true", help=update_help
         )
 
         add_help = "Add a new student and its folder to the current group"
         add_parser = student_subparsers.add_parser("add", help=add_help)
         add_help = "Directory for the new student"
-        add_parser.add_argument("directory", help=add_help, type=str)
+        add_parser.add_argument(
+            "directory", nargs="?", help=add_help, type=str
+        )
+        add_help = "Text file with the full name of a student per line"
+        add_parser.add_argument("--file", help=add_help, type=str)
 
         get_help = (
             "Retrieve a property of one or several students in the current group"
@@ -129,17 +316,26 @@ class CommandLineInterface(object):
         set_help = "Value to assign to the property"
         set_parser.add_argument("value", help=set_help, type=str)
 
+        students_help = "Student folders to act on (all students by default)"
+        for sub_parser in (get_parser, set_parser, update_parser, du_parser):
+            sub_parser.add_argument(
+                "--students", nargs="+", help=students_help, type=str
+            )
+
         del_help = "Delete a student"
         del_parser = student_subparsers.add_parser("del", help=del_help)
         del_help = "Directory of the student to delete"
         del_parser.add_argument("directory", help=del_help, type=str)
 
-        print_help = "Print student information"
+        print_help = "Write the cover page of one or every student"
         print_parser = student_subparsers.add_parser("print", help=print_help)
         print_help = "Directory of the student to print"
         print_parser.add_argument(
             "directory", nargs="?", help=print_help, type=str
         )
+        self._add_cover_options(print_parser)
+
+        self._add_groups_option(student_subparsers)
 
     def _add_resource_parser(self, subparsers):
         """
@@ -169,8 +365,10 @@ class CommandLineInterface(object):
         add_parser.add_argument("topic", nargs="?", help=add_help, type=str)
         add_help = "Category within the topic"
         add_parser.add_argument("category", nargs="?", help=add_help, type=str)
-        add_help = "Specific exercise"
+        add_help = "Exercise folder, EX### prefix or number, or a new name"
         add_parser.add_argument("exercise", nargs="?", help=add_help, type=str)
+        add_help = "Replace the files that already exist"
+        add_parser.add_argument("--force", action="store_true", help=add_help)
 
         get_help = "Get resources"
         get_parser = resource_subparsers.add_parser("get", help=get_help)
@@ -180,8 +378,10 @@ class CommandLineInterface(object):
         get_parser.add_argument("category", nargs="?", help=get_help, type=str)
         get_help = "Specific exercise"
         get_parser.add_argument("exercise", nargs="?", help=get_help, type=str)
+        get_help = "Show the status of every changed file"
+        get_parser.add_argument("--files", action="store_true", help=get_help)
 
-        set_help = "Set resource properties"
+        set_help = "Assign an exercise, personalised for every student"
         set_parser = resource_subparsers.add_parser("set", help=set_help)
         set_help = "Topic of the resource"
         set_parser.add_argument("topic", nargs="?", help=set_help, type=str)
@@ -189,11 +389,45 @@ class CommandLineInterface(object):
         set_parser.add_argument("category", nargs="?", help=set_help, type=str)
         set_help = "Specific exercise"
         set_parser.add_argument("exercise", nargs="?", help=set_help, type=str)
+        set_help = "Overwrite the copies the students already have"
+        set_parser.add_argument("--force", action="store_true", help=set_help)
+
+        collect_help = "Gather every student's copy of an exercise in an archive"
+        collect_parser = resource_subparsers.add_parser(
+            "collect", help=collect_help
+        )
+        collect_help = "Topic of the resource"
+        collect_parser.add_argument("topic", help=collect_help, type=str)
+        collect_help = "Category within the topic"
+        collect_parser.add_argument("category", help=collect_help, type=str)
+        collect_help = "Exercise folder, EX### prefix or number"
+        collect_parser.add_argument("exercise", help=collect_help, type=str)
+        collect_help = "Archive format"
+        collect_parser.add_argument(
+            "--format", choices=("zip", "tar", "tgz"), default="zip",
+            help=collect_help
+        )
+        collect_help = "Archive path (.metadata/collections by default)"
+        collect_parser.add_argument("--output", help=collect_help, type=str)
+        collect_help = "Only add the files changed since the last collection"
+        collect_parser.add_argument(
+            "--incremental", action="store_true", help=collect_help
+        )
 
         del_help = "Delete a resource"
         del_parser = resource_subparsers.add_parser("del", help=del_help)
-        del_help = "Exercise to delete"
+        del_help = "Exercise number, folder or topic/category/folder path"
         del_parser.add_argument("exercise", help=del_help, type=str)
+        del_help = "Remove the exercise from the resources as well"
+        del_parser.add_argument(
+            "--resources", action="store_true", help=del_help
+        )
+
+        students_help = "Student folders to act on (all students by default)"
+        for sub_parser in (add_parser, set_parser, del_parser):
+            sub_parser.add_argument(
+                "--students", nargs="+", help=students_help, type=str
+            )
 
         print_help = "Print resource information"
         print_parser = resource_subparsers.add_parser("print", help=print_help)
@@ -202,6 +436,182 @@ class CommandLineInterface(object):
             "directory", nargs="?", help=print_help, type=str
         )
 
+        publish_help = "Publish the resources as a static HTML site"
+        publish_parser = resource_subparsers.add_parser(
+            "publish", help=publish_help
+        )
+        publish_help = "Site folder (.metadata/site by default)"
+        publish_parser.add_argument("--output", help=publish_help, type=str)
+        publish_help = "Render every page, not only those that changed"
+        publish_parser.add_argument(
+            "--force", action="store_true", help=publish_help
+        )
+
+        self._add_groups_option(resource_subparsers)
+
+    def _add_session_parser(self, subparsers):
+        """
+        Define subcommands and arguments related to class sessions.
+
+        Args:
+            subparsers (argparse._SubParsersAction): The subparsers object from the main parser.
+        """
+        session_help = "Manage class sessions"
+        parser = subparsers.add_parser("session", help=session_help)
+
+        action_help = "Session actions"
+        session_subparsers = parser.add_subparsers(
+            dest="action", required=True, help=action_help
+        )
+
+        session_subparsers.add_parser("list", help="List the opened sessions")
+
+        open_help = "Create the dated session folder for every student"
+        open_parser = session_subparsers.add_parser("open", help=open_help)
+        open_help = "Session date as YYYY-MM-DD (today by default)"
+        open_parser.add_argument("date", nargs="?", help=open_help, type=str)
+        open_help = "Resource subfolder copied into every session folder"
+        open_parser.add_argument("--seed", help=open_help, type=str)
+
+    @staticmethod
+    def _add_cover_options(parser):
+        """
+        Add the options shared by the verbs that write cover pages.
+
+        Args:
+            parser (argparse.ArgumentParser): The parser of the verb.
+        """
+        cover_help = "PDF file, or folder with --separate (.metadata/covers)"
+        parser.add_argument("--output", help=cover_help, type=str)
+        cover_help = "Write one PDF file per page"
+        parser.add_argument("--separate", action="store_true", help=cover_help)
+
+    @staticmethod
+    def _add_repository_option(parser):
+        """
+        Add the option shared by the verbs that use the snapshot repository.
+
+        Args:
+            parser (argparse.ArgumentParser): The parser of the verb.
+        """
+        repository_help = "Snapshot repository ([snapshot] repository by " \
+                          "default, .snapshots next to the group otherwise)"
+        parser.add_argument("--repository", help=repository_help, type=str)
+
+    @staticmethod
+    def _add_groups_option(subparsers, exclude=()):
+        """
+        Allow the verbs of a command to run on several groups at once.
+
+        Args:
+            subparsers (argparse._SubParsersAction): The verbs of the command.
+            exclude (tuple): Verbs that only make sense on a single group.
+        """
+        groups_help = "Run on every group folder matching this glob pattern"
+        processes_help = "Number of groups processed at the same time"
+        for name, sub_parser in subparsers.choices.items():
+            if name in exclude:
+                continue
+
+            sub_parser.add_argument("--groups", help=groups_help, type=str)
+            sub_parser.add_argument(
+                "--processes", help=processes_help, type=int
+            )
+
+    def _add_run_parser(self, subparsers):
+        """
+        Define the command that runs a script of teachkit commands.
+
+        Args:
+            subparsers (argparse._SubParsersAction): The subparsers object from the main parser.
+        """
+        run_help = "Run the commands listed in a script file"
+        parser = subparsers.add_parser("run", help=run_help)
+        run_help = "Script with one teachkit command per line"
+        parser.add_argument("script", help=run_help, type=str)
+        run_help = "Maximum number of commands running at the same time"
+        parser.add_argument("--jobs", help=run_help, type=int)
+        parser.set_defaults(action="execute")
+
+    def _add_log_parser(self, subparsers):
+        """
+        Define the command that searches the group log.
+
+        Args:
+            subparsers (argparse._SubParsersAction): The subparsers object from the main parser.
+        """
+        log_help = "Search the group log, including the rotated files"
+        parser = subparsers.add_parser("log", help=log_help)
+        log_help = "Oldest record, as a date, a date and time or 2h, 1d..."
+        parser.add_argument("--since", help=log_help, type=str)
+        log_help = "Newest record, as a date, a date and time or 2h, 1d..."
+        parser.add_argument("--until", help=log_help, type=str)
+        log_help = "Minimum level of the records"
+        parser.add_argument(
+            "--level", type=str.upper, help=log_help,
+            choices=("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+        )
+        log_help = "Verb of the records, such as 'student add' or 'student'"
+        parser.add_argument("--verb", help=log_help, type=str)
+        log_help = "Text the records must contain"
+        parser.add_argument("--grep", help=log_help, type=str)
+        parser.set_defaults(action="query")
+
+    def _add_grade_parser(self, subparsers):
+        """
+        Define subcommands and arguments related to the grade book.
+
+        Args:
+            subparsers (argparse._SubParsersAction): The subparsers object from the main parser.
+        """
+        grade_help = "Manage the grade book of the group"
+        parser = subparsers.add_parser("grade", help=grade_help)
+
+        action_help = "Grade actions"
+        grade_subparsers = parser.add_subparsers(
+            dest="action", required=True, help=action_help
+        )
+
+        list_help = "List the category averages, final grade and rank"
+        list_parser = grade_subparsers.add_parser("list", help=list_help)
+        list_help = "Order of the students"
+        list_parser.add_argument(
+            "--sort", choices=("name", "final"), default="name",
+            help=list_help
+        )
+        list_help = "CSV file to export every score and grade to"
+        list_parser.add_argument("--output", help=list_help, type=str)
+
+        get_help = "Show statistics of the exercises, categories and grades"
+        grade_subparsers.add_parser("get", help=get_help)
+
+        set_help = "Record the score of a student in an exercise"
+        set_parser = grade_subparsers.add_parser("set", help=set_help)
+        set_help = "Exercise number, folder or topic/category/folder path"
+        set_parser.add_argument("exercise", help=set_help, type=str)
+        set_help = "Student folder"
+        set_parser.add_argument("student", help=set_help, type=str)
+        set_help = "Score, or - to clear it"
+        set_parser.add_argument("score", help=set_help, type=str)
+
+        add_help = "Import scores from a CSV file with an exercise per column"
+        add_parser = grade_subparsers.add_parser("add", help=add_help)
+        add_help = "CSV file whose first column holds the student folders"
+        add_parser.add_argument("file", help=add_help, type=str)
+
+        weight_help = "Show or set the weight of a category in the final grade"
+        weight_parser = grade_subparsers.add_parser("weight", help=weight_help)
+        weight_help = "Category of the resources"
+        weight_parser.add_argument(
+            "category", nargs="?", help=weight_help, type=str
+        )
+        weight_help = "New weight of the category"
+        weight_parser.add_argument(
+            "value", nargs="?", help=weight_help, type=str
+        )
+
+        self._add_groups_option(grade_subparsers, exclude=("set", "add"))
+
     # -------------------------------------------------------------------------
     # Access to the argument values
     # -------------------------------------------------------------------------
@@ -230,4 +640,4 @@ class CommandLineInterface(object):
         return getattr(self._args, name, default)
 
     def exists(self, name):
-        return hasattr(self._args, name )
+        return hasattr(self._args, name)
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Group pool
+==========
+Runs the same operation on many groups at once. Every group is handled in a
+worker process with a context of its own, so each one loads its own
+configuration and writes to its own ``.metadata/logs`` file, and the output
+of each group is gathered and shown together at the end.
+"""
+
+from .context import Context
+from .runner import TARGET_CLASSES
+
+from os import path, getcwd
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from glob import glob
+from io import StringIO
+from time import perf_counter
+
+# Arguments that select the operation rather than being part of it
+POOL_ARGUMENTS = ('command', 'action', 'groups', 'processes')
+
+
+class GroupResult(object):
+    """
+    Outcome of an operation in one group.
+
+    :param group_path: Group folder.
+    """
+
+    def __init__(self, group_path):
+        self.group_path = group_path
+        self.success = False
+        self.output = ''
+        self.message = ''
+        self.elapsed = 0.0
+
+
+class GroupPool(object):
+    """
+    Process pool running an operation on several groups.
+
+    :param processes: Number of worker processes.
+    :param metadata_folder: Name of the folder that identifies a group.
+    """
+
+    def __init__(self, processes=4, metadata_folder='.metadata'):
+        self._processes = max(int(processes or 1), 1)
+        self._metadata_folder = metadata_folder
+
+    # -------------------------------------------------------------------------
+    # Public methods
+    # -------------------------------------------------------------------------
+
+    def find(self, pattern, base_path=None):
+        """
+        Lists the group folders matching a glob pattern.
+
+        :param pattern: Glob pattern, relative to ``base_path``.
+        :param base_path: Folder relative patterns start from.
+        :return: Sorted list of absolute group paths.
+        """
+
+        base_path = base_path or getcwd()
+        pattern = path.join(base_path, path.expanduser(pattern))
+
+        return sorted(
+            path.abspath(folder) for folder in glob(pattern)
+            if path.isdir(path.join(folder, self._metadata_folder))
+        )
+
+    def map(self, group_paths, target, action, arguments=None):
+        """
+        Runs an operation on every group.
+
+        :param group_paths: Group folders.
+        :param target: Kind of object (``group``, ``student``...).
+        :param action: Verb or method name.
+        :param arguments: Dictionary of argument values.
+        :return: List of GroupResult, in the same order as ``group_paths``.
+        """
+
+        arguments = {
+            key: value for key, value in (arguments or {}).items()
+            if key not in POOL_ARGUMENTS
+        }
+        jobs = [
+            (group_path, target, action, arguments)
+            for group_path in group_paths
+        ]
+
+        if len(jobs) < 2 or self._processes == 1:
+            return [_run_in_group(*job) for job in jobs]
+
+        workers = min(self._processes, len(jobs))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(_run_in_group, *zip(*jobs)))
+
+
+def _run_in_group(group_path, target, action, arguments):
+    """
+    Runs an operation on one group with a context of its own, keeping what
+    the operation prints.
+    """
+
+    result = GroupResult(group_path)
+    start = perf_counter()
+    buffer = StringIO()
+
+    context = None
+    try:
+        with redirect_stdout(buffer):
+            context = Context(group_path, target, action, arguments)
+            operation = TARGET_CLASSES[target](context)
+            getattr(operation, context.action)()
+    except Exception as ex:
+        result.message = str(ex)
+    else:
+        result.success = True
+    finally:
+        if context is not None:
+            context.close()
+
+    result.output = buffer.getvalue()
+    result.elapsed = perf_counter() - start
+
+    return result
+
+
+class Groups(object):
+    """
+    Command line entry for any verb given with ``--groups``.
+
+    :param context: Context of the command, built from ``sys.argv`` when
+                    omitted.
+    """
+
+    def __init__(self, context=None):
+        self._context = context or Context.from_command_line()
+
+    def execute(self):
+        context = self._context
+        config = context.config
+        arguments = context.arguments
+
+        processes = arguments.get('processes', None) \
+            or config.get_value('parallel', 'processes')
+        metadata_folder = config.get_value('metadata', 'folder')
+
+        pool = GroupPool(processes, metadata_folder)
+        group_paths = pool.find(arguments.get('groups'), context.cwd)
+        if not group_paths:
+            message = 'No group matches "{}".'
+            raise Exception(message.format(arguments.get('groups')))
+
+        start = perf_counter()
+        results = pool.map(group_paths, context.target, context.action,
+                           arguments.args_dict)
+        elapsed = perf_counter() - start
+
+        for result in results:
+            status = 'ok' if result.success else 'failed'
+            print(f'== {result.group_path} ({status}, '
+                  f'{result.elapsed:.2f} s)', flush=True)
+            if result.output:
+                print(result.output.rstrip('\n'), flush=True)
+            if result.message:
+                print(result.message, flush=True)
+
+        failed = sum(1 for result in results if not result.success)
+        print(f'{len(results)} groups in {elapsed:.2f} s: '
+              f'{len(results) - failed} ok, {failed} failed', flush=True)
+
+        if failed:
+            message = '{} of {} groups did not succeed'
+            raise Exception(message.format(failed, len(results)))
+
+        return results
@@ -0,0 +1,418 @@
+# -*- coding: utf-8 -*-
+"""
+Resource publisher
+==================
+Builds a static HTML site with the group resources: an index of topics, a
+page for every topic and category, and a page for every exercise listing
+its files with their sizes and a preview of the text files and images::
+
+    index.html
+    <topic>/index.html
+    <topic>/<category>/index.html
+    <topic>/<category>/<exercise>/index.html
+
+Every page is rendered from a small set of values: the listing of the
+exercise files (path, size and modification time) or the totals of the
+folders below. A digest of those values is kept for every page in a
+dependency manifest, ``.publish.json``, in the output folder. Publishing
+again walks the resources, which only costs a stat per file, and renders
+just the pages whose digest changed. The files themselves are only read to
+build the previews of the exercises that changed.
+
+Pages are written atomically and only when their content changes, and the
+pages of the folders that no longer exist are removed.
+"""
+
+from os import path, makedirs, remove, rmdir
+from hashlib import blake2b
+from html import escape
+from json import dumps as json_dumps, loads as json_loads
+from datetime import datetime
+from pathlib import PurePath
+from urllib.parse import quote
+from humanfriendly import format_size
+
+from .writer import get_writer
+
+MANIFEST_NAME = '.publish.json'
+PAGE_NAME = 'index.html'
+
+# Changing how pages are rendered must change this, so they are rebuilt
+RENDER_VERSION = 1
+
+PREVIEW_LINES = 15
+PREVIEW_BYTES = 4096
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.svg', '.webp')
+
+_STYLE = '''
+body { font-family: sans-serif; margin: 2em auto; max-width: 60em;
+       color: #222; }
+nav { margin-bottom: 1em; color: #666; }
+table { border-collapse: collapse; width: 100%; }
+th, td { text-align: left; padding: .3em .6em;
+         border-bottom: 1px solid #ddd; }
+td.size { text-align: right; white-space: nowrap; }
+pre { background: #f6f6f6; padding: .6em; overflow: auto;
+      font-size: .85em; }
+img { max-width: 100%; max-height: 20em; }
+'''
+
+
+def _format_time(mtime_ns):
+    if not mtime_ns:
+        return ''
+
+    moment = datetime.fromtimestamp(mtime_ns / 1e9)
+    return moment.strftime('%Y-%m-%d %H:%M')
+
+
+class _Folder(object):
+    """
+    Folder of the resources tree with the files it holds, directly or
+    below it.
+    """
+
+    __slots__ = ('name', 'children', 'files')
+
+    def __init__(self, name):
+        self.name = name
+        self.children = {}
+        self.files = []
+
+    def child(self, name):
+        folder = self.children.get(name)
+        if folder is None:
+            folder = self.children[name] = _Folder(name)
+        return folder
+
+    def totals(self):
+        """
+        :return: Tuple ``(files, size, newest modification time)``.
+        """
+
+        files, size, newest = len(self.files), 0, 0
+        for _, file_size, mtime_ns in self.files:
+            size += file_size
+            newest = max(newest, mtime_ns)
+
+        for child in self.children.values():
+            child_files, child_size, child_newest = child.totals()
+            files += child_files
+            size += child_size
+            newest = max(newest, child_newest)
+
+        return files, size, newest
+
+
+class SitePublisher(object):
+    """
+    Publishes the resources folder as a static HTML site.
+
+    :param resources_path: Group resources folder.
+    :param output_path: Folder the site is written to.
+    :param walker: TreeWalker selecting the files published.
+    :param engine: IOEngine used to render the exercise pages concurrently.
+    :param title: Title of the site.
+    """
+
+    def __init__(self, resources_path, output_path, walker, engine=None,
+                 title=None):
+        self._resources_path = path.abspath(resources_path)
+        self._output_path = path.abspath(output_path)
+        self._walker = walker
+        self._engine = engine
+        self._title = title or path.basename(self._resources_path)
+
+        self.pages = 0
+        self.rendered = 0
+        self.written = 0
+        self.removed = 0
+
+    # -------------------------------------------------------------------------
+    # Public methods
+    # -------------------------------------------------------------------------
+
+    def publish(self, force=False):
+        """
+        Renders the pages whose inputs changed since the last publication.
+
+        :param force: Render every page again.
+        :return: Path of the site index.
+        """
+
+        root = self._scan()
+        manifest = {} if force else self._load_manifest()
+        known = manifest.get('pages', {})
+
+        # Every page as (relative folder, kind, folder node, trail of names)
+        pages = [('', 'index', root, ())]
+        for topic in self._sorted(root):
+            pages.append((topic.name, 'topic', topic, (topic.name,)))
+            for category in self._sorted(topic):
+                trail = (topic.name, category.name)
+                pages.append(('/'.join(trail), 'category', category, trail))
+                for exercise in self._sorted(category):
+                    trail = (topic.name, category.name, exercise.name)
+                    pages.append(
+                        ('/'.join(trail), 'exercise', exercise, trail))
+
+        digests = {}
+        changed = []
+        for page in pages:
+            page_path = self._page_path(page[0])
+            digest = self._digest(page)
+            digests[page[0]] = digest
+            if known.get(page[0]) != digest or not path.exists(page_path):
+                changed.append(page)
+
+        def render(page):
+            relative, kind, folder, trail = page
+            content = getattr(self, f'_render_{kind}')(folder, trail)
+            return self._page_path(relative), content
+
+        if self._engine is not None and len(changed) > 1:
+            results = self._engine.map(render, changed)
+        else:
+            results = [render(page) for page in changed]
+
+        makedirs(self._output_path, exist_ok=True)
+
+        writer = get_writer()
+        with writer.batch():
+            for page_path, content in results:
+                makedirs(path.dirname(page_path), exist_ok=True)
+                if writer.write(page_path, content):
+                    self.written += 1
+
+        for relative in set(known) - set(digests):
+            self._remove_page(relative)
+
+        writer.write(path.join(self._output_path, MANIFEST_NAME), json_dumps({
+            'version': RENDER_VERSION,
+            'resources': self._resources_path,
+            'output': self._output_path,
+            'pages': digests,
+        }, indent=1, sort_keys=True))
+
+        self.pages = len(pages)
+        self.rendered = len(changed)
+
+        return self._page_path('')
+
+    # -------------------------------------------------------------------------
+    # Dependencies
+    # -------------------------------------------------------------------------
+
+    def _scan(self):
+        """
+        Walks the resources once, keeping the size and modification time of
+        every file of the exercise folders.
+
+        :return: Root _Folder, with topics, categories and exercises below.
+        """
+
+        root = _Folder('')
+        for entry in self._walker.walk(self._resources_path):
+            parts = entry.relative.split('/')
+
+            if entry.is_dir:
+                # Topics, categories and exercises, even the empty ones
+                if len(parts) <= 3:
+                    folder = root
+                    for part in parts:
+                        folder = folder.child(part)
+                continue
+
+            # Files outside an exercise folder are not published
+            if len(parts) < 4:
+                continue
+
+            file_stat = entry.stat()
+            exercise = root.child(parts[0]).child(parts[1]).child(parts[2])
+            exercise.files.append(('/'.join(parts[3:]), file_stat.st_size,
+                                   file_stat.st_mtime_ns))
+
+        return root
+
+    def _digest(self, page):
+        """
+        Digest of the values a page is rendered from. Exercise pages depend
+        on their file listing, the other pages on the totals they show.
+        """
+
+        relative, kind, folder, trail = page
+
+        if kind == 'exercise':
+            values = sorted(folder.files)
+        else:
+            values = [
+                (child.name, len(child.children)) + child.totals()
+                for child in self._sorted(folder)
+            ]
+
+        text = json_dumps([RENDER_VERSION, self._title, kind, trail, values])
+        return blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+    def _load_manifest(self):
+        file_path = path.join(self._output_path, MANIFEST_NAME)
+        if not path.exists(file_path):
+            return {}
+
+        try:
+            with open(file_path, 'r', encoding='utf-8') as stream:
+                manifest = json_loads(stream.read())
+        except ValueError:
+            return {}
+
+        # Pages link to the resources, so moving either rebuilds everything
+        if manifest.get('version') != RENDER_VERSION \
+                or manifest.get('resources') != self._resources_path \
+                or manifest.get('output') != self._output_path:
+            return {'pages': dict.fromkeys(manifest.get('pages', {}))}
+
+        return manifest
+
+    # -------------------------------------------------------------------------
+    # Rendering
+    # -------------------------------------------------------------------------
+
+    def _render_index(self, folder, trail):
+        return self._render_listing(folder, trail, 'Topic', 'Categories')
+
+    def _render_topic(self, folder, trail):
+        return self._render_listing(folder, trail, 'Category', 'Exercises')
+
+    def _render_category(self, folder, trail):
+        return self._render_listing(folder, trail, 'Exercise')
+
+    def _render_listing(self, folder, trail, name_header, count_header=None):
+        rows = []
+        for child in self._sorted(folder):
+            files, size, newest = child.totals()
+            count = f'<td class="size">{len(child.children)}</td>' \
+                if count_header else ''
+            rows.append(
+                f'<tr><td><a href="{quote(child.name)}/{PAGE_NAME}">'
+                f'{escape(child.name)}</a></td>{count}'
+                f'<td class="size">{files}</td>'
+                f'<td class="size">{format_size(size)}</td>'
+                f'<td>{_format_time(newest)}</td></tr>'
+            )
+
+        count = f'<th>{count_header}</th>' if count_header else ''
+        body = (
+            f'<table><tr><th>{name_header}</th>{count}'
+            f'<th>Files</th><th>Size</th><th>Modified</th></tr>\n' +
+            '\n'.join(rows) + '\n</table>'
+        ) if rows else '<p>Nothing published yet.</p>'
+
+        return self._render_page(trail, body)
+
+    def _render_exercise(self, folder, trail):
+        page_folder = path.dirname(self._page_path('/'.join(trail)))
+        source_folder = path.join(self._resources_path, *trail)
+
+        rows = []
+        previews = []
+        for relative, size, mtime_ns in sorted(folder.files):
+            source = path.join(source_folder, *relative.split('/'))
+            link = self._make_link(source, page_folder)
+
+            rows.append(
+                f'<tr><td><a href="{link}">{escape(relative)}</a></td>'
+                f'<td class="size">{format_size(size)}</td>'
+                f'<td>{_format_time(mtime_ns)}</td></tr>'
+            )
+
+            preview = self._render_preview(source, link)
+            if preview:
+                previews.append(f'<h3>{escape(relative)}</h3>\n{preview}')
+
+        body = (
+            '<table><tr><th>File</th><th>Size</th><th>Modified</th></tr>\n' +
+            '\n'.join(rows) + '\n</table>'
+        ) if rows else '<p>This exercise has no files.</p>'
+
+        return self._render_page(trail, '\n'.join([body] + previews))
+
+    @staticmethod
+    def _render_preview(source, link):
+        if source.lower().endswith(IMAGE_EXTENSIONS):
+            return f'<img src="{link}" alt="" loading="lazy">'
+
+        try:
+            with open(source, 'rb') as stream:
+                data = stream.read(PREVIEW_BYTES)
+        except OSError:
+            return None
+
+        # Binary files have no preview
+        if b'\0' in data:
+            return None
+        try:
+            text = data.decode('utf-8')
+        except UnicodeDecodeError as ex:
+            # A character cut at the end of the preview is not an error
+            if ex.start < len(data) - 4:
+                return None
+            text = data[:ex.start].decode('utf-8')
+
+        lines = text.splitlines()[:PREVIEW_LINES]
+        if not any(line.strip() for line in lines):
+            return None
+
+        return f'<pre>{escape(chr(10).join(lines))}</pre>'
+
+    def _render_page(self, trail, body):
+        crumbs = [f'<a href="{"../" * len(trail)}{PAGE_NAME}">'
+                  f'{escape(self._title)}</a>']
+        for depth, name in enumerate(trail, 1):
+            up = '../' * (len(trail) - depth)
+            crumbs.append(f'<a href="{up}{PAGE_NAME}">{escape(name)}</a>')
+
+        title = escape(trail[-1] if trail else self._title)
+
+        return (
+            '<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n'
+            f'<title>{title}</title>\n<style>{_STYLE}</style>\n</head>\n'
+            f'<body>\n<nav>{" / ".join(crumbs)}</nav>\n<h1>{title}</h1>\n'
+            f'{body}\n</body>\n</html>\n'
+        )
+
+    # -------------------------------------------------------------------------
+    # Auxiliary methods
+    # -------------------------------------------------------------------------
+
+    def _page_path(self, relative):
+        parts = relative.split('/') if relative else []
+        return path.join(self._output_path, *parts, PAGE_NAME)
+
+    def _remove_page(self, relative):
+        page_path = self._page_path(relative)
+        if path.exists(page_path):
+            remove(page_path)
+            self.removed += 1
+
+        # Folders left empty go as well, up to the output folder
+        folder = path.dirname(page_path)
+        while folder != self._output_path:
+            try:
+                rmdir(folder)
+            except OSError:
+                break
+            folder = path.dirname(folder)
+
+    @staticmethod
+    def _make_link(source, page_folder):
+        try:
+            relative = path.relpath(source, page_folder)
+        except ValueError:
+            # Another drive on Windows
+            return PurePath(source).as_uri()
+
+        return quote(relative.replace(path.sep, '/'))
+
+    @staticmethod
+    def _sorted(folder):
+        return [folder.children[name] for name in sorted(folder.children)]
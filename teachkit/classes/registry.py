@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+"""
+Exercise registry
+=================
+Keeps every exercise folder of the group resources (``EX001_-_Name``) in the
+group database, indexed both by number and by path, and hands out the
+numbers of new exercises from a sequence. Resolving an exercise or choosing
+the next number is a single indexed query instead of a listing of the
+resources tree.
+
+Numbers are taken from one sequence for the whole group, so every exercise
+added through the registry can be found by its number alone. Folders that
+were created by hand are registered the first time the registry is used, or
+when a lookup misses and their category is listed.
+"""
+
+from os import path, scandir
+from collections import namedtuple
+from re import match as re_match
+
+EXERCISE_PATTERN = r'^EX(\d+)_-_'
+EXERCISE_FOLDER_FORMAT = 'EX{:03d}_-_{}'
+
+_SEQUENCE_NAME = 'exercise'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS exercise (
+    topic TEXT NOT NULL,
+    category TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    PRIMARY KEY (topic, category, folder)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS exercise_number ON exercise (number);
+CREATE INDEX IF NOT EXISTS exercise_folder ON exercise (folder);
+
+CREATE TABLE IF NOT EXISTS sequence (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+) WITHOUT ROWID;
+'''
+
+Exercise = namedtuple('Exercise', ['topic', 'category', 'folder', 'number'])
+
+
+def parse_exercise_number(value):
+    """
+    Reads an exercise number given as ``7``, ``007``, ``EX007`` or as a full
+    ``EX007_-_Name`` folder name.
+
+    :return: Integer, or None if the value holds no number.
+    """
+
+    value = str(value or '').strip()
+
+    found = re_match(EXERCISE_PATTERN, value)
+    if found:
+        return int(found.group(1))
+
+    if value.upper().startswith('EX'):
+        value = value[2:]
+
+    return int(value) if value.isdigit() else None
+
+
+class ExerciseRegistry(object):
+    """
+    Exercises of the group resources, stored in the group database.
+
+    :param store: GroupStore holding the registry.
+    :param resources_path: Group resources folder.
+    """
+
+    def __init__(self, store, resources_path):
+        self._store = store
+        self._resources_path = resources_path
+
+        self._ready = False
+
+    # -------------------------------------------------------------------------
+    # Public methods
+    # -------------------------------------------------------------------------
+
+    def allocate(self):
+        """
+        Reserves the next exercise number. The increment runs in a write
+        transaction, so concurrent processes never get the same number.
+
+        :return: Integer.
+        """
+
+        self._prepare()
+
+        with self._store.transaction() as connection:
+            connection.execute(
+                'INSERT OR IGNORE INTO sequence (name, value) VALUES (?, 0)',
+                (_SEQUENCE_NAME,)
+            )
+            connection.execute(
+                'UPDATE sequence SET value = value + 1 WHERE name = ?',
+                (_SEQUENCE_NAME,)
+            )
+            row = connection.execute(
+                'SELECT value FROM sequence WHERE name = ?', (_SEQUENCE_NAME,)
+            ).fetchone()
+
+        return row[0]
+
+    def register(self, topic, category, folder):
+        """
+        Adds an exercise folder. The sequence is moved past its number, so it
+        is never handed out again.
+
+        :return: Exercise, or None if the folder is not an exercise.
+        """
+
+        self._prepare()
+
+        number = parse_exercise_number(folder)
+        if number is None:
+            return None
+
+        exercise = Exercise(topic, category, folder, number)
+        self._insert([exercise])
+
+        return exercise
+
+    def unregister(self, exercise):
+        """
+        Forgets an exercise. Its number is not reused.
+        """
+
+        self._prepare()
+
+        with self._store.transaction() as connection:
+            connection.execute(
+                'DELETE FROM exercise '
+                'WHERE topic = ? AND category = ? AND folder = ?',
+                (exercise.topic, exercise.category, exercise.folder)
+            )
+
+    def resolve(self, exercise, topic=None, category=None):
+        """
+        Finds the exercises matching a number, a folder name or a
+        ``topic/category/folder`` path, optionally within a topic and
+        category. Entries whose folder no longer exists are dropped.
+
+        :param exercise: Number, ``EX###`` prefix, folder name or path.
+        :param topic: Topic the exercise must belong to.
+        :param category: Category the exercise must belong to.
+        :return: List of Exercise.
+        """
+
+        self._prepare()
+
+        parts = str(exercise).replace('\\', '/').strip('/').split('/')
+        if len(parts) == 3:
+            topic, category, exercise = parts
+
+        number = parse_exercise_number(exercise)
+        if number is not None and re_match(EXERCISE_PATTERN, exercise):
+            number = None
+
+        found = self._select(exercise, number, topic, category)
+        if not found and topic and category:
+            # Folders created by hand since the category was last listed
+            self._register_category(topic, category)
+            found = self._select(exercise, number, topic, category)
+
+        existing = []
+        for item in found:
+            if path.isdir(self.path_of(item)):
+                existing.append(item)
+            else:
+                self.unregister(item)
+
+        return existing
+
+    def exercises(self):
+        """
+        :return: List with every registered Exercise, sorted by path.
+        """
+
+        self._prepare()
+
+        rows = self._store.connection.execute(
+            'SELECT topic, category, folder, number FROM exercise '
+            'ORDER BY topic, category, folder'
+        )
+
+        return [Exercise(*row) for row in rows]
+
+    def path_of(self, exercise):
+        """
+        :return: Absolute path of the exercise in the resources folder.
+        """
+
+        return path.join(self._resources_path, self.relative_path(exercise))
+
+    @staticmethod
+    def relative_path(exercise):
+        """
+        :return: Path of the exercise relative to the resources folder.
+        """
+
+        return path.join(exercise.topic, exercise.category, exercise.folder)
+
+    def rebuild(self):
+        """
+        Registers again every exercise found in the resources folder.
+
+        :return: Number of exercises registered.
+        """
+
+        self._store.ensure_schema(_SCHEMA)
+
+        exercises = []
+        for topic in self._list_folders(self._resources_path):
+            topic_path = path.join(self._resources_path, topic)
+            for category in self._list_folders(topic_path):
+                category_path = path.join(topic_path, category)
+                exercises.extend(
+                    self._find_exercises(topic, category, category_path))
+
+        with self._store.transaction() as connection:
+            connection.execute('DELETE FROM exercise')
+        self._insert(exercises)
+
+        self._ready = True
+
+        return len(exercises)
+
+    # -------------------------------------------------------------------------
+    # Auxiliary methods
+    # -------------------------------------------------------------------------
+
+    def _prepare(self):
+        """
+        Creates the tables and, on a group that never used the registry,
+        registers the exercises already in the resources folder.
+        """
+
+        if self._ready:
+            return
+
+        self._store.ensure_schema(_SCHEMA)
+
+        row = self._store.connection.execute(
+            'SELECT value FROM sequence WHERE name = ?', (_SEQUENCE_NAME,)
+        ).fetchone()
+        if row is None:
+            self.rebuild()
+
+        self._ready = True
+
+    def _select(self, exercise, number, topic, category):
+        if number is not None:
+            condition, values = 'number = ?', [number]
+        else:
+            condition, values = 'folder = ?', [exercise]
+
+        if topic:
+            condition += ' AND topic = ?'
+            values.append(topic)
+
+        if category:
+            condition += ' AND category = ?'
+            values.append(category)
+
+        rows = self._store.connection.execute(
+            'SELECT topic, category, folder, number FROM exercise '
+            'WHERE ' + condition + ' ORDER BY topic, category, folder',
+            values
+        )
+
+        return [Exercise(*row) for row in rows]
+
+    def _insert(self, exercises):
+        last = max((exercise.number for exercise in exercises), default=0)
+
+        with self._store.transaction() as connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO exercise '
+                '(topic, category, folder, number) VALUES (?, ?, ?, ?)',
+                exercises
+            )
+            connection.execute(
+                'INSERT INTO sequence (name, value) VALUES (?, ?) '
+                'ON CONFLICT (name) DO UPDATE '
+                'SET value = max(value, excluded.value)',
+                (_SEQUENCE_NAME, last)
+            )
+
+    def _register_category(self, topic, category):
+        category_path = path.join(self._resources_path, topic, category)
+        self._insert(self._find_exercises(topic, category, category_path))
+
+    def _find_exercises(self, topic, category, category_path):
+        return [
+            Exercise(topic, category, folder, parse_exercise_number(folder))
+            for folder in self._list_folders(category_path)
+            if re_match(EXERCISE_PATTERN, folder)
+        ]
+
+    @staticmethod
+    def _list_folders(base_path):
+        if not path.isdir(base_path):
+            return []
+
+        with scandir(base_path) as entries:
+            return sorted(entry.name for entry in entries if entry.is_dir())
@@ -0,0 +1,492 @@
+# -*- coding: utf-8 -*-
+"""
+Script runner
+=============
+Runs a file of teachkit commands in a single process. Every line holds the
+same words that would follow ``teachkit`` in the shell, and ``cd <folder>``
+changes the group the next lines work on::
+
+    group add 1dam
+    cd 1dam
+    student add "Ada Lovelace"
+    student add "Alan Turing"
+    student update
+
+The whole script is planned before anything runs. Each operation depends on
+the earlier operations of the same group it conflicts with, that is, those
+acting on the same student or on the whole group, unless both only read.
+Independent operations run in parallel, and an operation that repeats an
+earlier one with nothing conflicting in between is merged into it.
+"""
+
+from .context import Context
+from .parser import CommandLineInterface
+from .group import Group
+from .student import Student
+from .session import Session
+from .material import Resource
+from .grades import Grade
+
+from os import path
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import redirect_stderr
+from io import StringIO
+from shlex import split as shlex_split
+from threading import Lock
+from time import perf_counter
+
+TARGET_CLASSES = {
+    'group': Group,
+    'student': Student,
+    'session': Session,
+    'resource': Resource,
+    'grade': Grade,
+}
+
+# Actions that never change the group
+READ_ONLY_ACTIONS = ('read', 'get', 'activity', 'du')
+
+# Actions that can absorb a later identical call, joining their students
+MERGEABLE_ACTIONS = (
+    ('group', 'update'),
+    ('student', 'create'),
+    ('student', 'update'),
+    ('student', 'set'),
+    ('session', 'open'),
+    ('resource', 'create'),
+    ('resource', 'set'),
+)
+
+# Words accepted before the command, as in the shell
+PROGRAM_NAMES = ('teachkit', 'tk')
+
+OK = 'ok'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+MERGED = 'merged'
+
+
+class ScriptLine(object):
+    """
+    Outcome of a single line of the script.
+
+    :param number: Line number, starting at 1.
+    :param text: Line as written in the script.
+    """
+
+    def __init__(self, number, text):
+        self.number = number
+        self.text = text.strip()
+        self.status = None
+        self.message = ''
+        self.elapsed = 0.0
+
+
+class _Operation(object):
+    """
+    Planned operation, together with the lines merged into it.
+    """
+
+    def __init__(self, line, group_path, target, action, arguments):
+        self.lines = [line]
+        self.group_path = group_path
+        self.target = target
+        self.action = action
+        self.arguments = arguments
+
+        self.read_only = action in READ_ONLY_ACTIONS
+        self.scope = self._get_scope()
+        self.depends_on = set()
+
+    @property
+    def merge_key(self):
+        arguments = {
+            key: value for key, value in self.arguments.items()
+            if key != 'students'
+        }
+
+        return (self.group_path, self.target, self.action,
+                repr(sorted(arguments.items())))
+
+    def conflicts_with(self, other):
+        if self.group_path != other.group_path:
+            return False
+
+        if self.read_only and other.read_only:
+            return False
+
+        if self.scope is None or other.scope is None:
+            return True
+
+        return not self.scope.isdisjoint(other.scope)
+
+    def merge(self, other):
+        self.lines.extend(other.lines)
+
+        if self.scope is None or other.scope is None:
+            self.scope = None
+        else:
+            self.scope |= other.scope
+
+        if 'students' in self.arguments:
+            students = sorted(self.scope) if self.scope is not None else None
+            self.arguments['students'] = students
+
+    def _get_scope(self):
+        """
+        Returns the students the operation acts on, or None when it acts on
+        the whole group.
+        """
+
+        if self.target != 'student':
+            return None
+
+        # The folder of a new student depends on the [naming] settings of
+        # the group, so it cannot be told apart from the --students of
+        # other operations
+        if self.action in ('create', 'delete'):
+            return None
+
+        students = self.arguments.get('students', None)
+        return set(students) if students else None
+
+
+class ScriptRunner(object):
+    """
+    Plans and runs the lines of a script.
+
+    :param base_path: Folder the relative paths of the script start from.
+    :param workers: Maximum number of operations running at the same time.
+    """
+
+    def __init__(self, base_path, workers=8):
+        self._base_path = path.abspath(base_path)
+        self._workers = max(int(workers or 1), 1)
+
+        self._contexts = {}
+        self._lock = Lock()
+
+    # -------------------------------------------------------------------------
+    # Public methods
+    # -------------------------------------------------------------------------
+
+    def run(self, lines):
+        """
+        Plans and runs a script.
+
+        :param lines: Iterable with the lines of the script.
+        :return: List of ScriptLine, one for every command in the script.
+        """
+
+        script_lines, operations = self.plan(lines)
+        try:
+            self._execute(operations)
+        finally:
+            self._close_contexts()
+
+        return script_lines
+
+    def plan(self, lines):
+        """
+        Parses the script and builds the operations to run, merging the
+        redundant ones and computing the dependencies between them.
+
+        :param lines: Iterable with the lines of the script.
+        :return: Tuple ``(script_lines, operations)``.
+        """
+
+        script_lines = []
+        operations = []
+        current_path = self._base_path
+
+        for number, text in enumerate(lines, start=1):
+            try:
+                words = shlex_split(text, comments=True)
+            except ValueError as ex:
+                words = None
+                error = ex
+            else:
+                error = None
+
+            if words == []:
+                continue
+
+            line = ScriptLine(number, text)
+            script_lines.append(line)
+
+            if error is not None:
+                self._fail(line, f'Invalid line. {error}.')
+                continue
+
+            if words[0] in PROGRAM_NAMES:
+                words = words[1:]
+
+            if words and words[0] == 'cd':
+                current_path, line.status = self._change_folder(
+                    current_path, words[1:], line)
+                continue
+
+            operation = self._parse(line, words, current_path)
+            if operation is None:
+                continue
+
+            if self._merge(operation, operations):
+                continue
+
+            for index, previous in enumerate(operations):
+                if operation.conflicts_with(previous):
+                    operation.depends_on.add(index)
+
+            operations.append(operation)
+
+        return script_lines, operations
+
+    @staticmethod
+    def summarize(script_lines):
+        """
+        Counts the lines by status.
+
+        :param script_lines: List of ScriptLine.
+        :return: Dictionary mapping each status to its number of lines.
+        """
+
+        counts = dict.fromkeys((OK, MERGED, FAILED, SKIPPED), 0)
+        for line in script_lines:
+            counts[line.status] = counts.get(line.status, 0) + 1
+
+        return counts
+
+    # -------------------------------------------------------------------------
+    # Planning
+    # -------------------------------------------------------------------------
+
+    def _parse(self, line, words, current_path):
+        buffer = StringIO()
+        try:
+            with redirect_stderr(buffer):
+                cmd = CommandLineInterface(words)
+        except SystemExit:
+            lines = buffer.getvalue().strip().splitlines()
+            self._fail(line, lines[-1] if lines else 'Invalid command.')
+            return None
+
+        if cmd.target not in TARGET_CLASSES:
+            self._fail(line, f'"{cmd.target}" cannot be used in a script.')
+            return None
+
+        arguments = cmd.args_dict
+        arguments.pop('command', None)
+        arguments.pop('action', None)
+
+        group_path = current_path
+        if cmd.target == 'group' and cmd.action == 'create':
+            group_path = path.abspath(
+                path.join(current_path, arguments['directory']))
+            arguments['directory'] = group_path
+
+        return _Operation(line, group_path, cmd.target, cmd.action, arguments)
+
+    @staticmethod
+    def _merge(operation, operations):
+        """
+        Merges the operation into an identical earlier one, provided that
+        no operation planned after it conflicts with the new one.
+        """
+
+        if (operation.target, operation.action) not in MERGEABLE_ACTIONS:
+            return False
+
+        key = operation.merge_key
+        for index in range(len(operations) - 1, -1, -1):
+            previous = operations[index]
+
+            if previous.merge_key == key:
+                previous.merge(operation)
+                operation.lines[0].status = MERGED
+                operation.lines[0].message = \
+                    f'Merged into line {previous.lines[0].number}.'
+                return True
+
+            if operation.conflicts_with(previous):
+                return False
+
+        return False
+
+    def _change_folder(self, current_path, words, line):
+        if len(words) != 1:
+            self._fail(line, 'Usage: cd <folder>.')
+            return current_path, FAILED
+
+        return path.abspath(path.join(current_path, words[0])), OK
+
+    # -------------------------------------------------------------------------
+    # Execution
+    # -------------------------------------------------------------------------
+
+    def _execute(self, operations):
+        pending = set(range(len(operations)))
+        running = {}
+
+        # Line numbers of the failed lines that prevent each operation from
+        # running, for the operations that failed or were skipped
+        causes = {}
+
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            while pending or running:
+                for index in sorted(pending):
+                    operation = operations[index]
+
+                    failed = operation.depends_on.intersection(causes)
+                    if failed:
+                        pending.discard(index)
+                        causes[index] = set().union(
+                            *(causes[other] for other in failed))
+                        self._skip(operation, causes[index])
+                        continue
+
+                    waiting = pending.union(running.values())
+                    if operation.depends_on & waiting:
+                        continue
+
+                    pending.discard(index)
+                    future = executor.submit(self._run_operation, operation)
+                    running[future] = index
+
+                if not running:
+                    continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = running.pop(future)
+                    if not future.result():
+                        causes[index] = {operations[index].lines[0].number}
+
+    def _run_operation(self, operation):
+        start = perf_counter()
+
+        creates = operation.target == 'group' and operation.action == 'create'
+
+        context = None
+        try:
+            context = self._get_context(operation)
+            target = TARGET_CLASSES[operation.target](context)
+            getattr(target, operation.action)()
+        except Exception as ex:
+            status, message = FAILED, str(ex)
+        else:
+            status, message = OK, ''
+        finally:
+            if creates and context is not None:
+                context.close()
+
+        # A new group must be loaded again, now that its folder exists
+        if creates:
+            with self._lock:
+                root = self._contexts.pop(operation.group_path, None)
+            if root is not None:
+                root.close()
+
+        elapsed = perf_counter() - start
+        self._set_status(operation, status, message)
+        for line in operation.lines:
+            line.elapsed = elapsed
+
+        return status == OK
+
+    def _get_context(self, operation):
+        """
+        Returns a context for the operation. Operations on the same group
+        share its configuration, logger and store.
+        """
+
+        if operation.target == 'group' and operation.action == 'create':
+            return Context(operation.group_path, operation.target,
+                           operation.action, operation.arguments)
+
+        with self._lock:
+            root = self._contexts.get(operation.group_path)
+            if root is None:
+                root = Context(operation.group_path)
+                self._contexts[operation.group_path] = root
+
+        return root.derive(operation.target, operation.action,
+                           **operation.arguments)
+
+    def _close_contexts(self):
+        with self._lock:
+            contexts = list(self._contexts.values())
+            self._contexts.clear()
+
+        for context in contexts:
+            context.close()
+
+    @staticmethod
+    def _skip(operation, numbers):
+        message = 'Depends on line {} which did not succeed.'.format(
+            ', '.join(str(number) for number in sorted(numbers)))
+
+        ScriptRunner._set_status(operation, SKIPPED, message)
+
+    @staticmethod
+    def _set_status(operation, status, message):
+        """
+        Records the outcome of an operation in all its lines. Merged lines
+        keep their status only if the operation succeeded.
+        """
+
+        for line in operation.lines:
+            if line.status != MERGED:
+                line.status, line.message = status, message
+            elif status != OK:
+                line.status = status
+                line.message = f'{line.message} {message}'
+
+    @staticmethod
+    def _fail(line, message):
+        line.status = FAILED
+        line.message = message
+
+
+class Run(object):
+    """
+    ``teachkit run`` command.
+
+    :param context: Context of the command, built from ``sys.argv`` when
+                    omitted.
+    """
+
+    def __init__(self, context=None):
+        self._context = context or Context.from_command_line()
+
+    def execute(self):
+        arguments = self._context.arguments
+        script_path = path.abspath(arguments.get('script'))
+
+        workers = arguments.get('jobs', None) \
+            or self._context.config.get_value('parallel', 'workers')
+
+        with open(script_path, 'r', encoding='utf-8') as stream:
+            lines = stream.read().splitlines()
+
+        start = perf_counter()
+        runner = ScriptRunner(self._context.cwd, workers)
+        script_lines = runner.run(lines)
+        elapsed = perf_counter() - start
+
+        for line in script_lines:
+            print(f'{line.number:>5}  {line.status.ljust(7)}  '
+                  f'{line.elapsed:7.2f} s  {line.text}', flush=True)
+            if line.message:
+                print(f'{"":>25}{line.message}', flush=True)
+
+        counts = runner.summarize(script_lines)
+        print(f'{len(script_lines)} lines in {elapsed:.2f} s: ' + ', '.join(
+            f'{count} {status}' for status, count in counts.items()),
+            flush=True)
+
+        if counts[FAILED] or counts[SKIPPED]:
+            message = '{} of {} lines did not succeed'
+            raise Exception(message.format(
+                counts[FAILED] + counts[SKIPPED], len(script_lines)))
+
+        return script_lines
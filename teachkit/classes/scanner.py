@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""
+Tree scanner
+============
+Summarizes folder trees (number of files, total size and last modification)
+keeping the listing of every directory in the group store. A directory is
+listed again only when its own modification time changes, which happens
+whenever an entry is added, removed or renamed in it.
+
+Files edited in place do not change the modification time of their folder,
+so the files of a cached listing are still stat'ed on every scan: only the
+listing is saved, never their sizes or dates.
+"""
+
+from os import path, stat
+from collections import namedtuple
+from threading import Lock
+
+from .engine import IOEngine
+from .walker import TreeWalker
+
+_SCHEMA = '''
+DROP TABLE IF EXISTS directory_summary;
+
+CREATE TABLE IF NOT EXISTS directory_listing (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    names TEXT NOT NULL,
+    subdirs TEXT NOT NULL
+) WITHOUT ROWID;
+'''
+
+TreeSummary = namedtuple(
+    'TreeSummary', ['files', 'size', 'last_modified_ns', 'folders'])
+
+_Entry = namedtuple(
+    '_Entry', ['mtime_ns', 'files', 'size', 'newest_ns', 'subdirs'])
+
+_Listing = namedtuple('_Listing', ['mtime_ns', 'names', 'subdirs'])
+
+
+class TreeScanner(object):
+    """
+    Computes summaries of folder trees using a cache of directory listings
+    keyed by directory modification time.
+
+    :param base_path: Folder the cached paths are relative to.
+    :param store: GroupStore used to persist the cache, or None to keep it
+                  only in memory.
+    :param engine: IOEngine used to scan several trees at the same time.
+    :param walker: TreeWalker selecting the files and folders counted.
+    """
+
+    def __init__(self, base_path, store=None, engine=None, walker=None):
+        self._base_path = path.abspath(base_path)
+        self._store = store
+        self._engine = engine or IOEngine()
+        self._walker = walker or TreeWalker()
+
+        self._cache = None
+        self._updates = {}
+        self._removed = set()
+        self._lock = Lock()
+
+    # -------------------------------------------------------------------------
+    # Public methods
+    # -------------------------------------------------------------------------
+
+    def summarize(self, root, forget=True):
+        """
+        Summarizes a single tree.
+
+        :param root: Folder to summarize.
+        :param forget: Drop the cached folders below ``root`` that no longer
+                       exist. Not needed for trees inside another tree that
+                       has just been summarized.
+        :return: TreeSummary with the totals of the whole tree.
+        """
+
+        self._load_cache()
+
+        files = size = newest = folders = 0
+        visited = set()
+
+        stack = [path.abspath(root)]
+        while stack:
+            folder = stack.pop()
+            key = self._make_key(folder)
+            visited.add(key)
+
+            entry = self._get_entry(folder, key)
+            if entry is None:
+                continue
+
+            files += entry.files
+            size += entry.size
+            folders += 1
+            newest = max(newest, entry.newest_ns, entry.mtime_ns)
+
+            for name in entry.subdirs:
+                stack.append(path.join(folder, name))
+
+        if forget:
+            self._forget_missing(self._make_key(path.abspath(root)), visited)
+
+        return TreeSummary(files, size, newest, folders)
+
+    def summarize_many(self, roots):
+        """
+        Summarizes several trees in parallel and saves the cache.
+
+        :param roots: Folders to summarize.
+        :return: Dictionary mapping each root to its TreeSummary.
+        """
+
+        roots = list(roots)
+        self._load_cache()
+
+        summaries = self._engine.map(self.summarize, roots)
+        result = dict(zip(roots, summaries))
+
+        self.save()
+
+        return result
+
+    def find(self, root, predicate):
+        """
+        Finds the folders below ``root`` whose name satisfies a predicate,
+        using the cached listings. Matching folders are not entered.
+
+        :param root: Folder to search.
+        :param predicate: Callable receiving a folder name.
+        :return: Generator of folder paths.
+        """
+
+        self._load_cache()
+
+        stack = [path.abspath(root)]
+        while stack:
+            folder = stack.pop()
+
+            listing, _ = self._get_listing(folder, self._make_key(folder))
+            if listing is None:
+                continue
+
+            for name in listing.subdirs:
+                child = path.join(folder, name)
+                if predicate(name):
+                    yield child
+                else:
+                    stack.append(child)
+
+    def save(self):
+        """
+        Persists the directories listed since the last call in a single
+        transaction.
+        """
+
+        if self._store is None:
+            return
+
+        with self._lock:
+            updates, self._updates = self._updates, {}
+            removed, self._removed = self._removed, set()
+
+        if not updates and not removed:
+            return
+
+        # Names cannot contain the separator, so they are stored joined
+        rows = [
+            (key, listing.mtime_ns, '/'.join(listing.names),
+             '/'.join(listing.subdirs))
+            for key, listing in updates.items()
+        ]
+
+        with self._store.transaction() as connection:
+            connection.executemany(
+                'DELETE FROM directory_listing WHERE path = ?',
+                [(key,) for key in removed]
+            )
+            connection.executemany(
+                'INSERT OR REPLACE INTO directory_listing '
+                '(path, mtime_ns, names, subdirs) VALUES (?, ?, ?, ?)', rows
+            )
+
+    # -------------------------------------------------------------------------
+    # Auxiliary methods
+    # -------------------------------------------------------------------------
+
+    def _load_cache(self):
+        with self._lock:
+            if self._cache is not None:
+                return
+
+            self._cache = {}
+            if self._store is None:
+                return
+
+            self._store.ensure_schema(_SCHEMA)
+            rows = self._store.connection.execute(
+                'SELECT path, mtime_ns, names, subdirs FROM directory_listing'
+            )
+            for key, mtime_ns, names, subdirs in rows:
+                self._cache[key] = _Listing(
+                    mtime_ns, self._split(names), self._split(subdirs))
+
+    def _get_entry(self, folder, key):
+        listing, entry = self._get_listing(folder, key)
+        if entry is not None or listing is None:
+            return entry
+
+        entry = self._stat_files(folder, listing)
+        if entry is None:
+            _, entry = self._get_listing(folder, key, refresh=True)
+
+        return entry
+
+    def _get_listing(self, folder, key, refresh=False):
+        """
+        Returns the listing of a folder, from the cache while the folder
+        keeps its modification time.
+
+        :return: Tuple with the _Listing and, when the folder had to be
+                 listed, the _Entry with its totals. (None, None) if the
+                 folder does not exist.
+        """
+
+        try:
+            mtime_ns = stat(folder).st_mtime_ns
+        except OSError:
+            return None, None
+
+        listing = self._cache.get(key)
+        if not refresh and listing is not None \
+                and listing.mtime_ns == mtime_ns:
+            return listing, None
+
+        entry, listing = self._list_folder(folder, mtime_ns)
+        with self._lock:
+            self._cache[key] = listing
+            self._updates[key] = listing
+
+        return listing, entry
+
+    @staticmethod
+    def _stat_files(folder, listing):
+        """
+        Totals the files of a cached listing with fresh stats, so files
+        edited in place are counted with their current size and date.
+
+        :return: _Entry, or None if a file is gone and the folder has to be
+                 listed again.
+        """
+
+        size = newest = 0
+        for name in listing.names:
+            try:
+                file_stat = stat(path.join(folder, name))
+            except OSError:
+                return None
+
+            size += file_stat.st_size
+            newest = max(newest, file_stat.st_mtime_ns)
+
+        return _Entry(listing.mtime_ns, len(listing.names), size, newest,
+                      listing.subdirs)
+
+    def _list_folder(self, folder, mtime_ns):
+        size = newest = 0
+        names, subdirs = [], []
+
+        for item in self._walker.scan(folder):
+            if item.is_dir:
+                subdirs.append(item.name)
+            else:
+                item_stat = item.stat()
+                names.append(item.name)
+                size += item_stat.st_size
+                newest = max(newest, item_stat.st_mtime_ns)
+
+        subdirs = tuple(sorted(subdirs))
+        listing = _Listing(mtime_ns, tuple(sorted(names)), subdirs)
+
+        return _Entry(mtime_ns, len(names), size, newest, subdirs), listing
+
+    def _forget_missing(self, root_key, visited):
+        prefix = root_key + '/'
+
+        with self._lock:
+            for key in list(self._cache):
+                if key in visited:
+                    continue
+                if key == root_key or key.startswith(prefix):
+                    del self._cache[key]
+                    self._updates.pop(key, None)
+                    self._removed.add(key)
+
+    @staticmethod
+    def _split(value):
+        return tuple(value.split('/')) if value else ()
+
+    def _make_key(self, folder):
+        key = path.relpath(folder, self._base_path)
+        return key.replace(path.sep, '/')
@@ -0,0 +1,146 @@
+from .base import Base
+
+from os import path, makedirs
+from datetime import datetime, date
+
+SESSION_FOLDER_FORMAT = '%Y_%m_%d'
+SESSION_DATE_FORMATS = ('%Y-%m-%d', '%Y_%m_%d', '%Y%m%d', '%d/%m/%Y')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS session (
+    folder TEXT PRIMARY KEY,
+    opened_at TEXT NOT NULL,
+    seed TEXT,
+    students INTEGER NOT NULL
+);
+'''
+
+
+class Session(Base):
+
+    def __init__(self, context=None):
+        super(Session, self).__init__(context)
+
+        self.store.ensure_schema(_SCHEMA)
+
+    # -------------------------------------------------------------------------
+    # Open
+    # -------------------------------------------------------------------------
+
+    def open(self):
+        """
+        Creates the dated session folder in every student folder at once,
+        optionally seeding it with a subtree of the group resources.
+        """
+
+        self.ensure_within_the_group(raise_exception=True)
+
+        folders = self.student_paths
+        if not folders:
+            self._print('There are no students in this group yet.')
+            return
+
+        session_date = self._parse_date(self.arguments.get('date', None))
+        folder_name = session_date.strftime(SESSION_FOLDER_FORMAT)
+
+        total = len(folders)
+
+        seed = self.arguments.get('seed', None)
+        seed_path = self._get_seed_path(seed) if seed else None
+        if seed_path:
+            folders = self._check_quotas(folders, seed_path, folder_name)
+
+        targets = [
+            path.join(self.group_path, folder, folder_name)
+            for folder in folders
+        ]
+
+        results = self.engine.map(
+            lambda target: self._open_in_folder(target, seed_path), targets,
+            return_exceptions=True
+        )
+
+        failures = []
+        for folder, result in zip(folders, results):
+            if isinstance(result, Exception):
+                failures.append(folder)
+                message = 'Failed to open session in "%s". %s'
+                self.error(message, folder, result)
+
+        opened = len(folders) - len(failures)
+        self._record_session(folder_name, seed, opened)
+
+        self._count('students', opened)
+        self._count('failures', total - opened)
+
+        message = 'Session "{}" opened for {} of {} students.'
+        self._print(message, folder_name, opened, total)
+        self.info('Session %s opened for %s students', folder_name, opened)
+
+        return folder_name
+
+    # -------------------------------------------------------------------------
+    # Read
+    # -------------------------------------------------------------------------
+
+    def read(self):
+        self.ensure_within_the_group(raise_exception=True)
+
+        rows = self.store.connection.execute(
+            'SELECT folder, opened_at, students, seed FROM session '
+            'ORDER BY folder'
+        )
+
+        for folder, opened_at, students, seed in rows:
+            self._print('{}  {}  {:>4}  {}', folder, opened_at, students,
+                        seed or '')
+
+    # -------------------------------------------------------------------------
+    # Auxiliary methods
+    # -------------------------------------------------------------------------
+
+    def _open_in_folder(self, target, seed_path):
+        makedirs(target, exist_ok=True)
+
+        if seed_path:
+            self._make_copier().copy_tree(seed_path, target, overwrite=False)
+
+    def _record_session(self, folder_name, seed, students):
+        opened_at = datetime.now().isoformat(timespec='seconds')
+
+        with self.store.transaction() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO session '
+                '(folder, opened_at, seed, students) VALUES (?, ?, ?, ?)',
+                (folder_name, opened_at, seed, students)
+            )
+
+    def _get_seed_path(self, seed):
+        parts = seed.replace('\\', '/').strip('/').split('/')
+        resources_path = path.realpath(self.resources_path)
+        seed_path = path.realpath(path.join(resources_path, *parts))
+
+        # Neither "..", a drive nor a symbolic link may lead out of the
+        # resources, which would copy any folder into the students' ones
+        if path.commonpath([resources_path, seed_path]) != resources_path:
+            message = 'Seed folder "%s" is outside the resources.'
+            self.exception(ValueError, message, seed)
+
+        if not path.isdir(seed_path):
+            message = 'Seed folder "%s" does not exist in the resources.'
+            self.exception(FileNotFoundError, message, seed)
+
+        return seed_path
+
+    def _parse_date(self, value):
+        if not value:
+            return date.today()
+
+        for date_format in SESSION_DATE_FORMATS:
+            try:
+                return datetime.strptime(value, date_format).date()
+            except ValueError:
+                continue
+
+        message = 'Invalid session date "%s". Use the YYYY-MM-DD format.'
+        self.exception(ValueError, message, value)
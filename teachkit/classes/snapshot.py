@@ -0,0 +1,404 @@
+# -*- coding: utf-8 -*-
+"""
+Group snapshots
+===============
+Saves the files of a group in a deduplicated repository and brings them back
+later. Files are cut into content-defined chunks with a gear rolling hash,
+so an edit only changes the chunks around it, and every chunk is stored
+once, compressed, under its digest::
+
+    <repository>/chunks/3f/3f9a...e1
+    <repository>/snapshots/<group>/20241001-093012.json.gz
+
+A snapshot is a manifest listing the folders and the chunks of every file.
+Files whose size and modification time match the previous snapshot of the
+group reuse its chunks without being read, so snapshotting a group that
+barely changed only costs a walk of its tree. Changed files are chunked by
+a pool of threads, each one holding at most two chunks of a file in memory.
+The rolling hash is computed with NumPy when it is installed, which is
+dozens of times faster than a byte-by-byte loop and releases the GIL.
+"""
+
+from os import path, makedirs, replace, remove, chmod, utime, stat, getpid, \
+    listdir
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from hashlib import blake2b
+from json import dumps as json_dumps, loads as json_loads
+from threading import Lock, get_ident
+from zlib import compress, decompress
+import gzip
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+# Average chunk size. No cut is made before a quarter of it and one is
+# forced at four times it
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+COMPRESSION_LEVEL = 3
+
+SNAPSHOT_STAMP = '%Y%m%d-%H%M%S'
+MANIFEST_SUFFIX = '.json.gz'
+
+_MASK64 = (1 << 64) - 1
+
+# Gear table: a fixed pseudo-random 64-bit value for every byte value
+_GEAR = tuple(
+    int.from_bytes(blake2b(bytes([value]), digest_size=8).digest(), 'little')
+    for value in range(256)
+)
+
+# The hash only depends on the bytes of this window
+_WINDOW = 64
+
+# Bytes hashed at once. A cut point is usually found within the first block
+_BLOCK_SIZE = 16 * 1024
+
+if numpy is not None:
+    _GEAR_ARRAY = numpy.array(_GEAR, dtype=numpy.uint64)
+
+
+class ContentChunker(object):
+    """
+    Finds content-defined cut points with a gear rolling hash, whose value
+    only depends on the last 64 bytes seen.
+
+    :param chunk_size: Average chunk size, rounded to a power of two.
+    """
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        chunk_size = max(int(chunk_size or DEFAULT_CHUNK_SIZE), 1024)
+        bits = chunk_size.bit_length() - 1
+
+        self.min_size = max(chunk_size // 4, 256)
+        self.max_size = chunk_size * 4
+
+        # The highest bits of the hash depend on the most bytes
+        self._mask = ((1 << bits) - 1) << (64 - bits)
+
+    def cut(self, data, eof):
+        """
+        Finds the end of the first chunk of a buffer.
+
+        :param data: Bytes starting at the beginning of a chunk.
+        :param eof: Whether the buffer holds the rest of the file.
+        :return: Length of the first chunk, or 0 if more data is needed to
+                 know it.
+        """
+
+        size = len(data)
+        if size <= self.min_size:
+            return size if eof else 0
+        if size < self.max_size and not eof:
+            return 0
+
+        start = self.min_size
+        limit = min(size, self.max_size)
+
+        if numpy is not None:
+            return self._cut_vectorised(data, start, limit)
+
+        mask = self._mask
+        gear = _GEAR
+        value = 0
+        for position, byte in enumerate(data[start:limit], start + 1):
+            value = ((value << 1) + gear[byte]) & _MASK64
+            if not value & mask:
+                return position
+
+        return limit
+
+    def _cut_vectorised(self, data, start, limit):
+        """
+        Same as the loop of ``cut``, computing the hash of every position of
+        a block at once. The hash at a position is the sum of the gear values
+        of the last 64 bytes, each one shifted by its distance, so it is
+        built by doubling the window six times.
+        """
+
+        mask = numpy.uint64(self._mask)
+
+        for block_start in range(start, limit, _BLOCK_SIZE):
+            block_end = min(block_start + _BLOCK_SIZE, limit)
+            offset = max(block_start - _WINDOW + 1, start)
+
+            codes = numpy.frombuffer(data, dtype=numpy.uint8,
+                                     count=block_end - offset, offset=offset)
+            hashes = _GEAR_ARRAY[codes]
+            del codes
+
+            width = 1
+            while width < _WINDOW:
+                hashes[width:] += hashes[:-width] << numpy.uint64(width)
+                width *= 2
+
+            skipped = block_start - offset
+            found = numpy.flatnonzero((hashes[skipped:] & mask) == 0)
+            if found.size:
+                return block_start + int(found[0]) + 1
+
+        return limit
+
+    def split(self, stream):
+        """
+        Yields the chunks of a binary stream, reading it piece by piece.
+
+        :param stream: File object opened in binary mode.
+        :return: Generator of bytes.
+        """
+
+        buffer = bytearray()
+        eof = False
+        while True:
+            if not eof and len(buffer) < self.max_size:
+                data = stream.read(self.max_size)
+                eof = not data
+                buffer += data
+                if not eof:
+                    continue
+
+            if not buffer:
+                return
+
+            length = self.cut(buffer, eof)
+            yield bytes(buffer[:length])
+            del buffer[:length]
+
+
+class SnapshotRepository(object):
+    """
+    Local folder holding the chunks and manifests of the snapshots of one or
+    more groups. Chunks are shared, so a file present in several groups or
+    snapshots is stored once.
+
+    :param repository_path: Repository folder, created on first use.
+    :param chunk_size: Average chunk size in bytes.
+    :param max_workers: Number of files chunked at the same time.
+    """
+
+    def __init__(self, repository_path, chunk_size=DEFAULT_CHUNK_SIZE,
+                 max_workers=8):
+        self.repository_path = path.abspath(repository_path)
+
+        self._chunker = ContentChunker(chunk_size)
+        self._max_workers = max(int(max_workers or 1), 1)
+        self._lock = Lock()
+
+        self.new_chunks = 0
+        self.new_bytes = 0
+        self.read_files = 0
+
+    # -------------------------------------------------------------------------
+    # Snapshots
+    # -------------------------------------------------------------------------
+
+    def snapshots(self, group):
+        """
+        :param group: Name of the group.
+        :return: Sorted ids of the snapshots of the group, oldest first.
+        """
+
+        folder = path.join(self.repository_path, 'snapshots', group)
+        if not path.isdir(folder):
+            return []
+
+        return sorted(
+            name[:-len(MANIFEST_SUFFIX)] for name in listdir(folder)
+            if name.endswith(MANIFEST_SUFFIX)
+        )
+
+    def load(self, group, snapshot_id=None):
+        """
+        Reads the manifest of a snapshot.
+
+        :param group: Name of the group.
+        :param snapshot_id: Snapshot id, the latest one by default.
+        :return: Dictionary, or None if the group has no such snapshot.
+        """
+
+        if snapshot_id is None:
+            ids = self.snapshots(group)
+            if not ids:
+                return None
+            snapshot_id = ids[-1]
+
+        file_path = self._manifest_path(group, snapshot_id)
+        if not path.exists(file_path):
+            return None
+
+        with gzip.open(file_path, 'rt', encoding='utf-8') as stream:
+            return json_loads(stream.read())
+
+    def create(self, group, entries, folders, message=None):
+        """
+        Takes a snapshot of a group.
+
+        :param group: Name of the group.
+        :param entries: List of ``(relative_path, file_path, stat_result)``
+                        for every file.
+        :param folders: Relative paths of every folder, so empty ones are
+                        restored too.
+        :param message: Description of the snapshot.
+        :return: Manifest of the new snapshot.
+        """
+
+        previous = self.load(group) or {}
+        known = {
+            item[0]: item for item in previous.get('files', [])
+        }
+
+        files = []
+        changed = []
+        for relative, file_path, file_stat in entries:
+            item = known.get(relative)
+            if item is not None and item[1] == file_stat.st_size \
+                    and item[2] == file_stat.st_mtime_ns:
+                files.append(item)
+            else:
+                files.append(None)
+                changed.append((len(files) - 1, relative, file_path,
+                                file_stat))
+
+        def store_file(change):
+            _, relative, file_path, file_stat = change
+            return [relative, file_stat.st_size, file_stat.st_mtime_ns,
+                    file_stat.st_mode & 0o7777, self._store_file(file_path)]
+
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            for change, item in zip(changed, executor.map(store_file,
+                                                          changed)):
+                files[change[0]] = item
+
+        self.read_files += len(changed)
+
+        created = datetime.now()
+        snapshot_id = self._make_id(group, created)
+        manifest = {
+            'id': snapshot_id,
+            'group': group,
+            'created': created.isoformat(timespec='seconds'),
+            'parent': previous.get('id'),
+            'message': message or '',
+            'size': sum(item[1] for item in files),
+            'folders': sorted(folders),
+            'files': files,
+        }
+
+        file_path = self._manifest_path(group, snapshot_id)
+        makedirs(path.dirname(file_path), exist_ok=True)
+        temp_path = f'{file_path}.{getpid()}.tmp'
+        with gzip.open(temp_path, 'wt', encoding='utf-8') as stream:
+            stream.write(json_dumps(manifest, separators=(',', ':')))
+        replace(temp_path, file_path)
+
+        return manifest
+
+    def restore(self, manifest, target_path):
+        """
+        Writes back the files of a snapshot. Files whose size and
+        modification time already match are left untouched.
+
+        :param manifest: Manifest returned by ``load``.
+        :param target_path: Folder the group is restored into.
+        :return: Number of files written.
+        """
+
+        for folder in manifest['folders']:
+            makedirs(path.join(target_path, *folder.split('/')),
+                     exist_ok=True)
+
+        def is_current(item):
+            try:
+                file_stat = stat(path.join(target_path, *item[0].split('/')))
+            except OSError:
+                return False
+            return file_stat.st_size == item[1] \
+                and file_stat.st_mtime_ns == item[2]
+
+        pending = [item for item in manifest['files'] if not is_current(item)]
+
+        def restore_file(item):
+            relative, _, mtime_ns, mode, chunks = item
+            file_path = path.join(target_path, *relative.split('/'))
+            makedirs(path.dirname(file_path), exist_ok=True)
+
+            temp_path = f'{file_path}.{getpid()}.{get_ident()}.tmp'
+            try:
+                with open(temp_path, 'wb') as stream:
+                    for chunk_id in chunks:
+                        stream.write(self._read_chunk(chunk_id))
+                chmod(temp_path, mode or 0o644)
+                utime(temp_path, ns=(mtime_ns, mtime_ns))
+                replace(temp_path, file_path)
+            except BaseException:
+                if path.exists(temp_path):
+                    remove(temp_path)
+                raise
+
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            list(executor.map(restore_file, pending))
+
+        return len(pending)
+
+    # -------------------------------------------------------------------------
+    # Chunks
+    # -------------------------------------------------------------------------
+
+    def _store_file(self, file_path):
+        chunks = []
+        with open(file_path, 'rb') as stream:
+            for data in self._chunker.split(stream):
+                chunks.append(self._store_chunk(data))
+
+        return chunks
+
+    def _store_chunk(self, data):
+        chunk_id = blake2b(data, digest_size=20).hexdigest()
+        chunk_path = self._chunk_path(chunk_id)
+        if path.exists(chunk_path):
+            return chunk_id
+
+        content = compress(data, COMPRESSION_LEVEL)
+
+        # Writers of the same chunk race harmlessly: the content is equal
+        makedirs(path.dirname(chunk_path), exist_ok=True)
+        temp_path = f'{chunk_path}.{getpid()}.{get_ident()}.tmp'
+        with open(temp_path, 'wb') as stream:
+            stream.write(content)
+        replace(temp_path, chunk_path)
+
+        with self._lock:
+            self.new_chunks += 1
+            self.new_bytes += len(content)
+
+        return chunk_id
+
+    def _read_chunk(self, chunk_id):
+        with open(self._chunk_path(chunk_id), 'rb') as stream:
+            data = decompress(stream.read())
+
+        if blake2b(data, digest_size=20).hexdigest() != chunk_id:
+            raise ValueError(f'Chunk {chunk_id} is damaged.')
+
+        return data
+
+    def _chunk_path(self, chunk_id):
+        return path.join(self.repository_path, 'chunks', chunk_id[:2],
+                         chunk_id)
+
+    def _manifest_path(self, group, snapshot_id):
+        return path.join(self.repository_path, 'snapshots', group,
+                         snapshot_id + MANIFEST_SUFFIX)
+
+    def _make_id(self, group, created):
+        snapshot_id = created.strftime(SNAPSHOT_STAMP)
+
+        candidate, number = snapshot_id, 1
+        while path.exists(self._manifest_path(group, candidate)):
+            number += 1
+            candidate = f'{snapshot_id}-{number}'
+
+        return candidate
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Exercise status
+===============
+Compares the student copies of exercises with their source in the group
+resources. File contents are compared through the fingerprint cache, so a
+file is only hashed again when its size or modification time changes. The
+files of a personalised exercise are compared with the variant rendered for
+each student instead.
+"""
+
+from os import path
+
+from .engine import IOEngine
+from .walker import TreeWalker
+
+UNTOUCHED = 'untouched'
+MODIFIED = 'modified'
+MISSING = 'missing'
+EXTRA = 'extra'
+
+
+class StatusEngine(object):
+    """
+    Computes the status of exercises for several students in parallel.
+
+    :param fingerprints: FingerprintCache used to compare file contents.
+    :param engine: IOEngine used to list the student copies concurrently.
+    :param walker: TreeWalker selecting the files compared.
+    """
+
+    def __init__(self, fingerprints, engine=None, walker=None):
+        self._fingerprints = fingerprints
+        self._engine = engine or IOEngine()
+        self._walker = walker or TreeWalker()
+
+    # -------------------------------------------------------------------------
+    # Public methods
+    # -------------------------------------------------------------------------
+
+    def compare_many(self, source_path, targets, rendered=None):
+        """
+        Compares one exercise with the copies of several students.
+
+        :param source_path: Exercise folder in the resources.
+        :param targets: Dictionary mapping student names to the folder of
+                        their copy, or None if they have no copy.
+        :param rendered: Dictionary mapping student names to the digests of
+                         the files personalised for them, by relative path.
+        :return: Dictionary mapping student names to ``(status, files)``,
+                 where ``files`` maps relative paths to file statuses.
+        """
+
+        rendered = rendered or {}
+        source_files = self._list_files(source_path)
+
+        listings = self._engine.map(self._list_target, targets.values())
+        listings = dict(zip(targets, listings))
+
+        # Only files whose size matches the source need their contents,
+        # besides the personalised ones, whose size is not known
+        candidates = list(source_files.values())
+        for student, target_files in listings.items():
+            expected = rendered.get(student, {})
+            for relative, (file_path, file_stat) in (target_files or {}).items():
+                source = source_files.get(relative)
+                if relative in expected or (
+                        source and source[1].st_size == file_stat.st_size):
+                    candidates.append((file_path, file_stat))
+
+        digests = self._fingerprints.get_many(candidates)
+        self._fingerprints.save()
+
+        return {
+            student: self.compare(source_files, target_files, digests,
+                                  rendered.get(student))
+            for student, target_files in listings.items()
+        }
+
+    def compare(self, source_files, target_files, digests, rendered=None):
+        """
+        Compares the files of an exercise with one student copy.
+
+        :param source_files: Result of ``_list_files`` for the source.
+        :param target_files: Result of ``_list_files`` for the student copy,
+                             or None if the student has no copy.
+        :param digests: Fingerprints of the files to compare by content.
+        :param rendered: Digests of the files personalised for the student,
+                         compared instead of the source files.
+        :return: Tuple ``(status, files)``.
+        """
+
+        rendered = rendered or {}
+
+        if target_files is None:
+            files = dict.fromkeys(source_files, MISSING)
+            return MISSING, files
+
+        files = {}
+        for relative, (source_file, source_stat) in source_files.items():
+            target = target_files.get(relative)
+            if target is None:
+                files[relative] = MISSING
+            elif relative in rendered:
+                target_digest = digests.get(target[0])
+                same = target_digest is not None \
+                    and target_digest.strong == rendered[relative]
+                files[relative] = UNTOUCHED if same else MODIFIED
+            elif self._same_content(source_file, target[0], digests):
+                files[relative] = UNTOUCHED
+            else:
+                files[relative] = MODIFIED
+
+        for relative in target_files:
+            if relative not in source_files:
+                files[relative] = EXTRA
+
+        if all(status == UNTOUCHED for status in files.values()):
+            return UNTOUCHED, files
+
+        return MODIFIED, files
+
+    # -------------------------------------------------------------------------
+    # Auxiliary methods
+    # -------------------------------------------------------------------------
+
+    @staticmethod
+    def _same_content(source_file, target_file, digests):
+        source = digests.get(source_file)
+        target = digests.get(target_file)
+
+        if source is None or target is None:
+            return False
+
+        return source.strong == target.strong
+
+    def _list_target(self, target_path):
+        if not target_path or not path.isdir(target_path):
+            return None
+
+        return self._list_files(target_path)
+
+    def _list_files(self, base_path):
+        return {
+            entry.relative: (entry.path, entry.stat())
+            for entry in self._walker.files(base_path)
+        }
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+Group store
+===========
+SQLite database kept in the group metadata folder. It holds the data that
+must be queried for the whole group at once, such as student properties,
+so reading a value for every student costs a single query instead of one
+file per student.
+"""
+
+from os import path
+from contextlib import contextmanager
+from threading import RLock
+import sqlite3
+
+STORE_FILE_NAME = 'teachkit.db'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS student_property (
+    property TEXT NOT NULL,
+    student TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (property, student)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS student_property_student
+    ON student_property (student);
+'''
+
+
+class GroupStore(object):
+    """
+    Access to the group database. Rows are keyed by property first, so all
+    the values of one property for the whole group are stored together and
+    can be read as a single column.
+
+    :param metadata_path: Path to the group metadata folder.
+    :param file_name: Name of the database file.
+    """
+
+    def __init__(self, metadata_path, file_name=STORE_FILE_NAME):
+        self._file_path = path.join(metadata_path, file_name)
+        self._connection = None
+        self._lock = RLock()
+
+    # -------------------------------------------------------------------------
+    # Properties
+    # -------------------------------------------------------------------------
+
+    @property
+    def file_path(self):
+        return self._file_path
+
+    @property
+    def connection(self):
+        """
+        Returns the open connection, creating the database on first use.
+
+        :return: Instance of sqlite3.Connection.
+        """
+
+        if self._connection is None:
+            with self._lock:
+                if self._connection is None:
+                    self._connection = self._connect()
+
+        return self._connection
+
+    # -------------------------------------------------------------------------
+    # Public methods
+    # -------------------------------------------------------------------------
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    @contextmanager
+    def transaction(self):
+        """
+        Runs the enclosed statements in a single write transaction. The
+        connection is shared by every thread, so transactions are serialized.
+
+        :return: The open connection.
+        """
+
+        with self._lock:
+            connection = self.connection
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                yield connection
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+            else:
+                connection.execute('COMMIT')
+
+    def ensure_schema(self, script):
+        """
+        Creates the tables used by a feature if they do not exist yet.
+
+        :param script: SQL script with ``CREATE ... IF NOT EXISTS`` clauses.
+        """
+
+        # executescript() commits first, so it must not run in the middle
+        # of a transaction opened by another thread
+        with self._lock:
+            self.connection.executescript(script)
+
+    # -------------------------------------------------------------------------
+    # Student properties
+    # -------------------------------------------------------------------------
+
+    def get_property(self, name, students=None):
+        """
+        Reads one property for several students with a single query.
+
+        :param name: Property name.
+        :param students: Student folder names, or None for every student.
+        :return: Dictionary mapping student folder names to values.
+        """
+
+        query = 'SELECT student, value FROM student_property WHERE property = ?'
+        rows = self.connection.execute(query, (name,))
+
+        if students is None:
+            return dict(rows)
+
+        wanted = set(students)
+        return {student: value for student, value in rows if student in wanted}
+
+    def get_properties(self, student):
+        """
+        Reads every property stored for one student.
+
+        :param student: Student folder name.
+        :return: Dictionary mapping property names to values.
+        """
+
+        query = 'SELECT property, value FROM student_property WHERE student = ?'
+        return dict(self.connection.execute(query, (student,)))
+
+    def get_all_properties(self, students=None):
+        """
+        Reads every property of several students with a single query.
+
+        :param students: Student folder names, or None for every student.
+        :return: Dictionary mapping student folder names to dictionaries of
+                 property values.
+        """
+
+        query = 'SELECT student, property, value FROM student_property'
+        wanted = set(students) if students is not None else None
+
+        result = {}
+        for student, name, value in self.connection.execute(query):
+            if wanted is None or student in wanted:
+                result.setdefault(student, {})[name] = value
+
+        return result
+
+    def set_property(self, name, values):
+        """
+        Writes one property for several students in one transaction.
+
+        :param name: Property name.
+        :param values: Dictionary mapping student folder names to values. A
+                       value of None removes the property for that student.
+        :return: Number of rows actually changed. Unchanged values are not
+                 written at all.
+        """
+
+        current = self.get_property(name, values.keys())
+
+        upserts = []
+        deletes = []
+        for student, value in values.items():
+            if value is None:
+                if student in current:
+                    deletes.append((name, student))
+            elif current.get(student) != str(value):
+                upserts.append((name, student, str(value)))
+
+        if not upserts and not deletes:
+            return 0
+
+        with self.transaction() as connection:
+            connection.executemany(
+                'INSERT INTO student_property (property, student, value) '
+                'VALUES (?, ?, ?) ON CONFLICT (property, student) '
+                'DO UPDATE SET value = excluded.value', upserts
+            )
+            connection.executemany(
+                'DELETE FROM student_property '
+                'WHERE property = ? AND student = ?', deletes
+            )
+
+        return len(upserts) + len(deletes)
+
+    def delete_student(self, student):
+        """
+        Removes every property stored for one student.
+
+        :param student: Student folder name.
+        """
+
+        with self.transaction() as connection:
+            connection.execute(
+                'DELETE FROM student_property WHERE student = ?', (student,))
+
+    # -------------------------------------------------------------------------
+    # Auxiliary methods
+    # -------------------------------------------------------------------------
+
+    def _connect(self):
+        connection = sqlite3.connect(
+            self._file_path, isolation_level=None, timeout=30,
+            check_same_thread=False
+        )
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.executescript(_SCHEMA)
+
+        return connection
@@ -1,15 +1,57 @@
 from .base import Base
-from os import path, listdir, makedirs
+from .scanner import TreeScanner
+from .material import EXERCISE_PATTERN
+from .cover import CoverBook, read_group_values
+from os import path, stat
 from datetime import datetime
-from shutil import copytree, copy2
+from itertools import islice
+from csv import writer as csv_writer
+from json import dumps as json_dumps
+from re import match as re_match
+import sys
 
 # STUDENT_ICON = '%SystemRoot%\\system32\\imageres.dll,-123'
 
+# Field name: (table header, table width)
+LIST_FIELDS = {
+    'position': ('P', 1),
+    'created': ('C. date', 10),
+    'days': ('D', 5),
+    'accessed': ('A. date', 10),
+    'time': ('A. time', 8),
+    'name': ('Name', 0),
+}
+
+ACTIVITY_FIELDS = {
+    'modified': ('Modified', 16),
+    'days': ('D', 5),
+    'files': ('Files', 7),
+    'size': ('Size', 12),
+    'name': ('Name', 0),
+}
+
+DU_FIELDS = {
+    'files': ('Files', 7),
+    'size': ('Size', 12),
+    'quota': ('Quota', 12),
+    'usage': ('Use %', 6),
+    'name': ('Name', 0),
+}
+
+EXERCISE_DU_FIELDS = {
+    'files': ('Files', 7),
+    'size': ('Size', 12),
+    'name': ('Name', 24),
+    'exercise': ('Exercise', 0),
+}
+
+DEFAULT_PAGE_SIZE = 50
+
 
 class Student(Base):
 
-    def __init__(self, **kwargs):
-        super(Student, self).__init__(**kwargs)
+    def __init__(self, context=None, **kwargs):
+        super(Student, self).__init__(context)
 
         value = kwargs.get('num_words', None)
         self._num_words = value if isinstance(value, int) else 2
@@ -18,18 +60,61 @@ class Student(Base):
         self._min_word_length = value if isinstance(value, int) else 3
 
     def create(self):
+        """
+        Creates the folder of one student, or of every student listed with
+        ``--file``. Every name is checked against the name index first, so
+        nothing is created if any of them would reuse an existing folder.
+
+        :return: Folder name of the student, or a list with the folder name
+                 of each student when several were given.
+        """
+
         self.ensure_within_the_group(raise_exception=True)
 
-        if not self._name:
+        names = self._get_new_names()
+        if not names:
             raise Exception('The name is required to create new student.')
 
-        base_name = self._make_folder_name()
-        base_path = path.join(self._cwd, base_name)
-        self._mkdir(base_path)
-        self._execute_cmd_attrib(base_path, '+s')
+        index = self._get_name_index()
+        folders = [self._make_folder_name(name) for name in names]
+
+        conflicts = []
+        seen = {}
+        for name, folder in zip(names, folders):
+            other = seen.get(folder) or index.get(folder)
+            if other is None and path.exists(path.join(self._cwd, folder)):
+                other = folder
+            if other is not None:
+                conflicts.append(f'"{name}" would use the folder "{folder}" '
+                                 f'of "{other}"')
+            seen[folder] = name
+
+        if conflicts:
+            message = 'Students were not added. %s'
+            self.exception(FileExistsError, message, '; '.join(conflicts))
 
-        student_name = self._limit_words(self._name)
-        self._create_desktop_ini(base_path, student_name.title())
+        for name, folder in zip(names, folders):
+            for score, other_folder, other_name in index.similar(name):
+                self._print('"{}" looks like "{}" ({}), {:.0%} alike.',
+                            name, other_name, other_folder, score)
+
+            other = index.claim(folder, name)
+            if other is not None:
+                message = 'Student "%s" would use the folder "%s" of "%s".'
+                self.exception(FileExistsError, message, name, folder, other)
+
+            base_path = path.join(self._cwd, folder)
+            self._mkdir(base_path)
+            self._execute_cmd_attrib(base_path, '+s')
+            self._count('students_added')
+
+            student_name = self._limit_words(name)
+            self._create_desktop_ini(base_path, student_name.title())
+
+        if len(names) == 1 and not self._is_bulk_create():
+            return folders[0]
+
+        return folders
 
     def read(self):
         self.ensure_within_the_group(raise_exception=True)
@@ -37,73 +122,364 @@ class Student(Base):
         folders = self.student_paths
         if not folders:
             self._print('There are no students in this group yet.')
-        else:
-            lines = []
-            sizes = [0, 0, 0, 0, 0, 0]
+            return
 
-            fields = ['P', 'C. date', 'D', 'A. date', 'A. time', 'Name']
-            lines.append(fields)
-            self._update_line_sizes(sizes, fields)
+        fields = self._get_list_fields()
+        rows = self._paginate(self._iter_sorted_rows(folders))
 
-            for index, folder in enumerate(sorted(folders)):
-                full_path = path.abspath(path.join(self.group_path, folder))
+        self._write_rows(rows, fields, len(folders))
 
-                cdt = path.getctime(full_path)
-                cdt = datetime.fromtimestamp(cdt)
+    def activity(self):
+        self.ensure_within_the_group(raise_exception=True)
 
-                adt = path.getatime(full_path)
-                adt = datetime.fromtimestamp(adt)
+        folders = self.student_paths
+        if not folders:
+            self._print('There are no students in this group yet.')
+            return
+
+        scanner = TreeScanner(self.group_path, self.store, self.engine,
+                              self._make_walker())
+
+        roots = [path.join(self.group_path, folder) for folder in folders]
+        summaries = scanner.summarize_many(roots)
+
+        today = datetime.now()
+        rows = []
+        for folder, root in zip(folders, roots):
+            summary = summaries[root]
+            mdt = datetime.fromtimestamp(summary.last_modified_ns / 1e9)
+            rows.append({
+                'modified': mdt.strftime('%Y-%m-%d %H:%M'),
+                'days': self._date_diff(mdt, today),
+                'files': summary.files,
+                'size': summary.size,
+                'name': folder,
+            })
+
+        sort_key = self.arguments.get('sort', None) or 'name'
+        reverse = bool(self.arguments.get('reverse', False))
+        rows.sort(key=lambda row: row[sort_key], reverse=reverse)
+
+        self._write_rows(rows, list(ACTIVITY_FIELDS), len(rows),
+                         ACTIVITY_FIELDS)
+
+        return rows
+
+    def du(self):
+        """
+        Shows the disk space used by each student, or by each exercise of
+        each student with ``--exercises``, along with their quotas.
+        """
 
-                days = self._date_diff(cdt, adt)
+        self.ensure_within_the_group(raise_exception=True)
 
-                cdate = cdt.strftime('%Y-%m-%d')
-                adate = adt.strftime('%Y-%m-%d')
-                atime = adt.strftime('%H:%M:%S')
+        folders = self._get_selected_students()
+        if not folders:
+            self._print('There are no students in this group yet.')
+            return
 
-                fields = [index, cdate, days, adate, atime, folder]
-                self._update_line_sizes(sizes, fields)
+        scanner = TreeScanner(self.group_path, self.store, self.engine,
+                              self._make_walker())
 
-                lines.append(fields)
+        roots = [path.join(self.group_path, folder) for folder in folders]
+        summaries = scanner.summarize_many(roots)
 
-            separator = ['-' * size for size in sizes]
-            lines.insert(1, separator)
+        if self.arguments.get('exercises', False):
+            rows = self._make_exercise_du_rows(scanner, folders, roots)
+            spec = EXERCISE_DU_FIELDS
+        else:
+            quotas = self._get_quotas(folders)
+            rows = []
+            for folder, root in zip(folders, roots):
+                size, quota = summaries[root].size, quotas[folder]
+                rows.append({
+                    'files': summaries[root].files,
+                    'size': size,
+                    'quota': quota or '',
+                    'usage': round(100 * size / quota, 1) if quota else '',
+                    'name': folder,
+                })
+            spec = DU_FIELDS
+
+        sort_key = self.arguments.get('sort', None) or 'size'
+        if sort_key not in spec:
+            message = 'Unsupported sort field "%s".'
+            self.exception(ValueError, message, sort_key)
+
+        # Names sort alphabetically, numbers biggest first
+        reverse = bool(self.arguments.get('reverse', False))
+        if sort_key in ('name', 'exercise'):
+            rows.sort(key=lambda row: row[sort_key], reverse=reverse)
+        else:
+            rows.sort(key=lambda row: row[sort_key] or 0, reverse=not reverse)
 
-            for pos, line in enumerate(lines):
-                args = [
-                    self._adjust(line[0], sizes[0], fill=True),
-                    self._adjust(line[1], sizes[1]),
-                    self._adjust(line[2], sizes[2]),
-                    self._adjust(line[3], sizes[3]),
-                    self._adjust(line[4], sizes[4]),
-                    self._adjust(line[5], sizes[5]),
-                ]
+        self._write_rows(rows, list(spec), len(rows), spec)
 
-                self._print('{}  {}  {}  {}  {}  {}', *args)
+        return rows
 
     def update(self):
-        folders = listdir(self.group_path)
+        folders = self._get_selected_students()
         if not folders:
             self._print('There are no students in this group yet.')
         else:
             resources_path = self.resources_path
-            for index, folder in enumerate(sorted(folders)):
-                dest_path = path.abspath(path.join(self.group_path, folder))
-                if path.isdir(dest_path) and folder[0].isalpha():
-                    self._copy_folder(
-                        resources_path, dest_path, overwrite=self._force)
+            folders = self._check_quotas(folders, resources_path,
+                                         overwrite=self._force)
+            targets = [
+                path.abspath(path.join(self.group_path, folder))
+                for folder in folders
+            ]
+            self._copy_folders(resources_path, targets, overwrite=self._force)
+
+    def get(self):
+        property_name = self.arguments.get('property', None)
+        folders = self._get_selected_students()
+
+        values = self.store.get_property(property_name, folders)
+        for folder in folders:
+            self._print('{}: {}', folder, values.get(folder, ''))
+
+        return values
+
+    def set(self):
+        property_name = self.arguments.get('property', None)
+        value = self.arguments.get('value', None)
+        folders = self._get_selected_students()
+
+        values = dict.fromkeys(folders, value)
+        changed = self.store.set_property(property_name, values)
+
+        message = 'Property "%s" was set for %s students (%s changed).'
+        self.info(message, property_name, len(folders), changed)
+
+        return changed
 
     def delete(self):
+        if not self._name:
+            raise Exception('The name is required to delete a student.')
 
         base_name = self._make_folder_name()
         base_path = path.join(self._cwd, base_name)
+        if not base_name or not path.isdir(base_path):
+            raise FileNotFoundError(f'Student "{self._name}" does not exist.')
 
         self._rmtree(base_path)
+        self.store.delete_student(base_name)
+        self._get_name_index().remove(base_name)
         self._print(f'Student "{self._name}" folder has been removed.')
 
-    @staticmethod
-    def _update_line_sizes(sizes, fields):
-        for index, field in enumerate(fields):
-            sizes[index] = max(sizes[index], len(str(field)))
+    def print(self):
+        """
+        Writes the cover page of one student, or of every student when no
+        student is given.
+
+        :return: List with the paths of the written documents.
+        """
+
+        self.ensure_within_the_group(raise_exception=True)
+
+        folders = self.student_paths
+        directory = self.arguments.get('directory', None)
+        if directory:
+            folder = directory if directory in folders \
+                else self._make_folder_name(directory)
+            if folder not in folders:
+                message = 'Student "%s" does not exist.'
+                self.exception(FileNotFoundError, message, directory)
+            folders = [folder]
+        elif not folders:
+            self._print('There are no students in this group yet.')
+            return []
+
+        values = read_group_values(self.config_path, self.group_path,
+                                   len(self.student_paths))
+
+        book = CoverBook(self.config_path,
+                         path.join(self.metadata_path, 'covers'),
+                         self.store, self.engine)
+        pages = book.student_pages(folders, values, self._get_name_index(),
+                                   self.store.get_all_properties(folders))
+
+        return self._write_covers(book, pages, folders[0] if directory
+                                  else 'students')
+
+    def _write_covers(self, book, pages, file_name):
+        """
+        Writes the pages to ``--output``, or to the covers folder of the
+        group metadata, and reports the characters drawn as ``?``.
+
+        :return: List with the paths of the documents.
+        """
+
+        separate = bool(self.arguments.get('separate', False))
+        output = book.output_path(
+            file_name, self.arguments.get('output', None), separate)
+
+        try:
+            file_paths = book.write(pages, output, separate, title=file_name)
+        except OSError as ex:
+            message = 'Failed to write the cover pages to %s. %s'
+            self.exception(OSError, message, output, ex)
+
+        renderer = book.renderer
+        for key, characters in sorted(renderer.unsupported.items()):
+            message = 'The cover page of %s cannot show %s, drawn as "?"'
+            self.warning(message, key, ' '.join(characters))
+
+        self._count('pages_rendered', renderer.rendered)
+        self._count('pages_cached', renderer.cached)
+
+        message = '{} pages ({} rendered, {} cached) written to {}'
+        self._print(message, len(pages), renderer.rendered, renderer.cached,
+                    output)
+        self.info('%s cover pages written to %s', len(pages), output)
+
+        return file_paths
+
+    def _iter_rows(self, folders, reverse=False):
+        """
+        Yields one dictionary per student folder, stat'ing each folder only
+        when its row is requested.
+
+        :param folders: Sorted student folder names.
+        :param reverse: Yield the rows from the last folder. Positions still
+                        follow the order of ``folders``.
+        """
+
+        indexes = range(len(folders))
+        if reverse:
+            indexes = reversed(indexes)
+
+        for index in indexes:
+            folder = folders[index]
+            full_path = path.abspath(path.join(self.group_path, folder))
+            yield self._make_row(index, folder, full_path)
+
+    def _iter_sorted_rows(self, folders):
+        sort_key = self.arguments.get('sort', None) or 'name'
+        reverse = bool(self.arguments.get('reverse', False))
+
+        if sort_key == 'name':
+            yield from self._iter_rows(sorted(folders), reverse)
+            return
+
+        if sort_key not in LIST_FIELDS:
+            message = 'Unsupported sort field "%s".'
+            self.exception(ValueError, message, sort_key)
+
+        # Sorting by any other field requires every row to be known first
+        rows = list(self._iter_rows(sorted(folders)))
+        rows.sort(key=lambda row: row[sort_key], reverse=reverse)
+        yield from rows
+
+    def _make_row(self, index, folder, full_path):
+        stat_result = stat(full_path)
+
+        cdt = datetime.fromtimestamp(stat_result.st_ctime)
+        adt = datetime.fromtimestamp(stat_result.st_atime)
+
+        return {
+            'position': index,
+            'created': cdt.strftime('%Y-%m-%d'),
+            'days': self._date_diff(cdt, adt),
+            'accessed': adt.strftime('%Y-%m-%d'),
+            'time': adt.strftime('%H:%M:%S'),
+            'name': folder,
+        }
+
+    def _paginate(self, rows):
+        page = self.arguments.get('page', None)
+        if not page:
+            return rows
+
+        page = self._safe_cast(page, int, 1)
+        page_size = self.arguments.get('page_size', None)
+        page_size = self._safe_cast(page_size, int, DEFAULT_PAGE_SIZE)
+
+        start = (max(page, 1) - 1) * page_size
+        return islice(rows, start, start + page_size)
+
+    def _get_list_fields(self):
+        value = self.arguments.get('fields', None)
+        if not value:
+            return list(LIST_FIELDS)
+
+        fields = [field.strip() for field in value.split(',') if field]
+        for field in fields:
+            if field not in LIST_FIELDS:
+                message = 'Unknown field "%s". Allowed fields are: %s.'
+                self.exception(ValueError, message, field,
+                               ', '.join(LIST_FIELDS))
+
+        return fields
+
+    # -------------------------------------------------------------------------
+    # Output writers
+    # -------------------------------------------------------------------------
+
+    def _write_rows(self, rows, fields, count, spec=LIST_FIELDS):
+        output_format = self.arguments.get('format', None) or 'table'
+
+        writer = getattr(self, f'_write_{output_format}', None)
+        if not writer:
+            message = 'Unsupported output format "%s".'
+            self.exception(ValueError, message, output_format)
+
+        writer(rows, fields, count, spec)
+
+    def _write_table(self, rows, fields, count, spec):
+        """
+        Prints rows as they arrive. Widths are fixed beforehand, so nothing
+        has to be buffered to align the columns.
+        """
+
+        sizes = []
+        for field in fields:
+            header, size = spec[field]
+            if field == 'position':
+                size = len(str(count))
+            sizes.append(max(size, len(header)))
+
+        headers = [spec[field][0] for field in fields]
+        self._print_table_line(headers, sizes, fields)
+        self._print_table_line(['-' * size for size in sizes], sizes, fields)
+
+        for row in rows:
+            values = [row[field] for field in fields]
+            self._print_table_line(values, sizes, fields)
+
+    def _print_table_line(self, values, sizes, fields):
+        args = []
+        for value, size, field in zip(values, sizes, fields):
+            fill = field == 'position'
+            last = field == fields[-1] and not isinstance(value, int)
+            args.append(str(value) if last else self._adjust(value, size, fill))
+
+        self._print('  '.join(['{}'] * len(args)), *args)
+
+    def _write_csv(self, rows, fields, count, spec):
+        writer = csv_writer(sys.stdout, lineterminator='\n')
+        writer.writerow(fields)
+
+        for row in rows:
+            writer.writerow([row[field] for field in fields])
+
+    def _write_json(self, rows, fields, count, spec):
+        sys.stdout.write('[')
+
+        separator = '\n'
+        for row in rows:
+            values = {field: row[field] for field in fields}
+            text = json_dumps(values, ensure_ascii=False)
+            sys.stdout.write(separator + text)
+            separator = ',\n'
+
+        sys.stdout.write('\n]\n')
+
+    def _write_jsonl(self, rows, fields, count, spec):
+        for row in rows:
+            values = {field: row[field] for field in fields}
+            sys.stdout.write(json_dumps(values, ensure_ascii=False) + '\n')
 
     @staticmethod
     def _adjust(value, size, fill=False):
@@ -129,39 +505,64 @@ class Student(Base):
 
         return abs(delta.days)
 
-    @classmethod
-    def _copy_folder(cls, source, target, drop_dest=False, overwrite=False):
+    def _copy_folders(self, source, targets, overwrite=False):
         if not path.exists(source):
             message = f'Source folder "{source}" does not exist.'
             raise FileNotFoundError(message)
 
-        try:
+        copier = self._make_copier()
+        pairs = [(source, target) for target in targets]
+        results = self.engine.copy_many(copier, pairs, overwrite=overwrite)
+
+        for target, result in zip(targets, results):
+            if isinstance(result, Exception):
+                message = f'Failed to copy {source} to {target}. {result}'
+                raise Exception(message) from result
+
+    def _make_exercise_du_rows(self, scanner, folders, roots):
+        rows = []
+
+        for folder, root in zip(folders, roots):
+            for exercise_path in scanner.find(root, self._is_exercise):
+                summary = scanner.summarize(exercise_path, forget=False)
+                relative = path.relpath(exercise_path, root)
+                rows.append({
+                    'files': summary.files,
+                    'size': summary.size,
+                    'name': folder,
+                    'exercise': relative.replace(path.sep, '/'),
+                })
+
+        scanner.save()
+
+        return rows
+
+    @staticmethod
+    def _is_exercise(folder_name):
+        return re_match(EXERCISE_PATTERN, folder_name) is not None
+
+    def _get_new_names(self):
+        names = list(self.arguments.get('names', None) or [])
+
+        if self._name:
+            names.insert(0, self._name)
+
+        file_path = self.arguments.get('file', None)
+        if file_path:
+            with open(file_path, 'r', encoding='utf-8') as stream:
+                names.extend(stream.read().splitlines())
+
+        return [
+            name.strip() for name in names
+            if name and name.strip() and not name.lstrip().startswith('#')
+        ]
+
+    def _is_bulk_create(self):
+        return bool(self.arguments.get('names', None)
+                    or self.arguments.get('file', None))
 
-            if not path.exists(target):
-                makedirs(target)
-
-            for item in listdir(source):
-                src_path = path.join(source, item)
-                dest_path = path.join(target, item)
-
-                if path.isdir(src_path):
-                    if not path.exists(dest_path):
-                        copytree(src_path, dest_path)
-                    else:
-                        cls._copy_folder(src_path, dest_path)
-                elif item == 'desktop.ini':
-                    pass
-                elif not overwrite and path.exists(dest_path):
-                    pass
-                else:
-                    copy2(src_path, dest_path)
-
-        except Exception as ex:
-            message = f'Failed to copy {source} to {target}. {ex}'
-            raise Exception(message) from ex
-
-    def _make_folder_name(self):
-        base_name = self._limit_words(self._name)
+    def _make_folder_name(self, name=None):
+        base_name = self._limit_words(name or self._name)
         base_name = self._sanitize_filename(base_name)
         base_name = self._unidecode(base_name)
         base_name = base_name.lower()
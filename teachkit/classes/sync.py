@@ -0,0 +1,415 @@
+# -*- coding: utf-8 -*-
+"""
+Platform sync
+=============
+Pushes the roster, the resources and the exercise states of a group to an
+external learning platform over HTTP. Items of the same kind are sent
+together, a batch per request::
+
+    POST <url>/<kind>
+    {"group": "1dam", "items": [{"id": ..., ...}, ...], "deleted": [...]}
+
+A digest of every item sent is kept in the group database, so later syncs
+only upload the items that changed and the ids of those that disappeared.
+Requests reuse a small pool of keep-alive connections, run concurrently up
+to the size of the pool and are retried with exponential backoff when the
+connection fails or the platform answers 429 or 5xx.
+
+Running this module starts a stand-in platform that accepts every batch and
+prints a line for each one, to try a sync without a real platform::
+
+    python -m teachkit.classes.sync --port 8765
+"""
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import blake2b
+from http.client import HTTPConnection, HTTPSConnection, HTTPException
+from json import dumps as json_dumps, loads as json_loads
+from queue import LifoQueue, Empty
+from random import uniform
+from time import sleep
+from urllib.parse import urlsplit
+
+SYNC_KINDS = ('roster', 'resources', 'exercises')
+
+# Status codes worth trying again
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+MAX_BACKOFF = 30.0
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sync_state (
+    kind TEXT NOT NULL,
+    item TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (kind, item)
+) WITHOUT ROWID;
+'''
+
+BatchResult = namedtuple('BatchResult', ['items', 'deleted', 'error'])
+
+
+class SyncError(Exception):
+    """
+    Request refused by the platform or failed after every retry.
+    """
+
+    def __init__(self, message, status=None):
+        super(SyncError, self).__init__(message)
+        self.status = status
+
+
+class ConnectionPool(object):
+    """
+    Keep-alive HTTP connections to a single host, shared by several threads.
+
+    :param url: Base URL of the platform.
+    :param size: Maximum number of idle connections kept open.
+    :param timeout: Socket timeout in seconds.
+    """
+
+    def __init__(self, url, size=4, timeout=30):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise ValueError(f'Invalid platform URL "{url}".')
+
+        self._connection_class = HTTPSConnection \
+            if parts.scheme == 'https' else HTTPConnection
+        self._host = parts.hostname
+        self._port = parts.port
+        self._timeout = timeout
+
+        self.base_path = parts.path.rstrip('/')
+        self.size = max(int(size or 1), 1)
+        self.opened = 0
+
+        self._idle = LifoQueue(maxsize=self.size)
+
+    # -------------------------------------------------------------------------
+    # Public methods
+    # -------------------------------------------------------------------------
+
+    def request(self, method, url_path, body=None, headers=None):
+        """
+        Sends a request through an idle connection, or a new one if none is
+        idle. A connection that fails is closed instead of reused.
+
+        :return: Tuple ``(status, headers, body)``.
+        """
+
+        connection = self._acquire()
+        try:
+            connection.request(method, self.base_path + url_path, body,
+                               headers or {})
+            response = connection.getresponse()
+            data = response.read()
+        except BaseException:
+            connection.close()
+            raise
+
+        if response.will_close:
+            connection.close()
+        else:
+            self._release(connection)
+
+        return response.status, dict(response.getheaders()), data
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except Empty:
+                break
+
+    # -------------------------------------------------------------------------
+    # Auxiliary methods
+    # -------------------------------------------------------------------------
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except Empty:
+            self.opened += 1
+            return self._connection_class(self._host, self._port,
+                                          timeout=self._timeout)
+
+    def _release(self, connection):
+        try:
+            self._idle.put_nowait(connection)
+        except Exception:
+            connection.close()
+
+
+class SyncClient(object):
+    """
+    Sends batches of items to the platform.
+
+    :param url: Base URL of the platform API.
+    :param token: Bearer token sent with every request.
+    :param connections: Number of requests running at the same time.
+    :param batch_size: Maximum number of items per request.
+    :param retries: Attempts after the first failed one.
+    :param backoff: Seconds waited before the first retry, doubled for each
+                    of the next ones.
+    :param timeout: Socket timeout in seconds.
+    """
+
+    def __init__(self, url, token=None, connections=4, batch_size=100,
+                 retries=3, backoff=0.5, timeout=30):
+        self._pool = ConnectionPool(url, connections, timeout)
+        self._token = token
+        self._batch_size = max(int(batch_size or 1), 1)
+        self._retries = max(int(retries or 0), 0)
+        self._backoff = float(backoff or 0)
+
+        self.requests = 0
+
+    # -------------------------------------------------------------------------
+    # Public methods
+    # -------------------------------------------------------------------------
+
+    def push(self, kind, group, items, deleted=(), on_batch=None):
+        """
+        Sends items and deleted ids in batches, several at the same time.
+
+        :param kind: Kind of item, used as the endpoint name.
+        :param group: Group identifier sent with every batch.
+        :param items: List of dictionaries, each one with an ``id``.
+        :param deleted: Ids of the items that no longer exist.
+        :param on_batch: Callable receiving every BatchResult as soon as its
+                         request ends.
+        :return: List of BatchResult.
+        """
+
+        items, deleted = list(items), list(deleted)
+        size = self._batch_size
+
+        batches = [(items[start:start + size], [])
+                   for start in range(0, len(items), size)]
+        batches.extend(([], deleted[start:start + size])
+                       for start in range(0, len(deleted), size))
+
+        def send(batch):
+            batch_items, batch_deleted = batch
+            body = {'group': group, 'items': batch_items,
+                    'deleted': batch_deleted}
+            try:
+                self.post(f'/{kind}', body)
+            except Exception as ex:
+                result = BatchResult(batch_items, batch_deleted, ex)
+            else:
+                result = BatchResult(batch_items, batch_deleted, None)
+
+            if on_batch is not None:
+                on_batch(result)
+
+            return result
+
+        if len(batches) < 2:
+            return [send(batch) for batch in batches]
+
+        workers = min(self._pool.size, len(batches))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(send, batches))
+
+    def post(self, url_path, body):
+        """
+        Sends a JSON document, retrying failed attempts with exponential
+        backoff and jitter. A ``Retry-After`` header is honored.
+
+        :return: Decoded JSON answer, or None if it is empty.
+        """
+
+        data = json_dumps(body, ensure_ascii=False).encode('utf-8')
+        headers = {
+            'Content-Type': 'application/json; charset=utf-8',
+            'Accept': 'application/json',
+        }
+        if self._token:
+            headers['Authorization'] = f'Bearer {self._token}'
+
+        attempt = 0
+        while True:
+            retry_after = None
+            try:
+                self.requests += 1
+                status, answer_headers, answer = self._pool.request(
+                    'POST', url_path, data, headers)
+            except (OSError, HTTPException) as ex:
+                error = SyncError(f'POST {url_path} failed. {ex}')
+            else:
+                if 200 <= status < 300:
+                    return json_loads(answer) if answer.strip() else None
+
+                error = SyncError(
+                    f'POST {url_path} answered {status}. '
+                    f'{answer[:200].decode("utf-8", "replace")}', status)
+                if status not in RETRY_STATUSES:
+                    raise error
+                retry_after = answer_headers.get('Retry-After')
+
+            if attempt >= self._retries:
+                raise error
+
+            sleep(self._get_delay(attempt, retry_after))
+            attempt += 1
+
+    def close(self):
+        self._pool.close()
+
+    # -------------------------------------------------------------------------
+    # Auxiliary methods
+    # -------------------------------------------------------------------------
+
+    def _get_delay(self, attempt, retry_after=None):
+        try:
+            return min(float(retry_after), MAX_BACKOFF)
+        except (TypeError, ValueError):
+            pass
+
+        delay = min(self._backoff * 2 ** attempt, MAX_BACKOFF)
+        return uniform(delay / 2, delay)
+
+
+class SyncState(object):
+    """
+    Digest of every item last accepted by the platform, stored in the group
+    database.
+
+    :param store: GroupStore holding the state.
+    """
+
+    def __init__(self, store):
+        self._store = store
+        self._store.ensure_schema(_SCHEMA)
+
+    def changes(self, kind, items):
+        """
+        Compares items with those last sent.
+
+        :param kind: Kind of item.
+        :param items: List of dictionaries, each one with an ``id``.
+        :return: Tuple ``(changed, deleted)`` with the items that are new or
+                 different and the ids of those that no longer exist.
+        """
+
+        rows = self._store.connection.execute(
+            'SELECT item, digest FROM sync_state WHERE kind = ?', (kind,))
+        sent = dict(rows)
+
+        changed = [
+            item for item in items
+            if sent.pop(str(item['id']), None) != self.digest(item)
+        ]
+
+        return changed, sorted(sent)
+
+    def commit(self, kind, items=(), deleted=()):
+        """
+        Records items accepted by the platform.
+
+        :param kind: Kind of item.
+        :param items: Items sent.
+        :param deleted: Ids reported as deleted.
+        """
+
+        with self._store.transaction() as connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO sync_state (kind, item, digest) '
+                'VALUES (?, ?, ?)',
+                [(kind, str(item['id']), self.digest(item)) for item in items]
+            )
+            connection.executemany(
+                'DELETE FROM sync_state WHERE kind = ? AND item = ?',
+                [(kind, str(item_id)) for item_id in deleted]
+            )
+
+    def forget(self, kind=None):
+        """
+        Forgets what was sent, so the next sync uploads everything.
+        """
+
+        with self._store.transaction() as connection:
+            if kind is None:
+                connection.execute('DELETE FROM sync_state')
+            else:
+                connection.execute(
+                    'DELETE FROM sync_state WHERE kind = ?', (kind,))
+
+    @staticmethod
+    def digest(item):
+        text = json_dumps(item, sort_keys=True, ensure_ascii=False)
+        return blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+
+# -----------------------------------------------------------------------------
+# Stand-in platform
+# -----------------------------------------------------------------------------
+
+def serve(port=8765, fail_every=0):
+    """
+    Runs a platform stand-in that accepts every batch.
+
+    :param port: Port to listen on, in the loopback interface.
+    :param fail_every: Answer 503 to one of every that many requests, to
+                       exercise the retries. 0 never fails.
+    """
+
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+    from itertools import count
+
+    counter = count(1)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            body = json_loads(self.rfile.read(length) or b'{}')
+            number = next(counter)
+
+            if fail_every and number % fail_every == 0:
+                self._answer(503, {'error': 'try again'})
+                return
+
+            items = body.get('items', [])
+            deleted = body.get('deleted', [])
+            print(f'#{number} {self.path} group={body.get("group")} '
+                  f'items={len(items)} deleted={len(deleted)}', flush=True)
+            self._answer(200, {'accepted': len(items) + len(deleted)})
+
+        def _answer(self, status, body):
+            data = json_dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    print(f'Listening on http://127.0.0.1:{port}', flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description='Stand-in learning platform')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--fail-every', type=int, default=0)
+    args = parser.parse_args()
+
+    serve(args.port, args.fail_every)
+
+
+if __name__ == '__main__':
+    main()
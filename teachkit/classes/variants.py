@@ -0,0 +1,387 @@
+# -*- coding: utf-8 -*-
+"""
+Exercise variants
+=================
+Personalises the copy of an exercise that every student receives. An
+exercise becomes a template when its folder holds a ``variants.ini`` file::
+
+    [variant]
+    files = statement.md, data/*.csv
+
+    [parameters]
+    speed = integer 40 120
+    time = uniform 0.5 3 decimals=1
+    readings = normal 20 4 size=12
+    unit = choice km/h m/s
+    distance = expr speed * time
+
+The files matching ``files`` have their ``$name`` placeholders replaced by
+the values of each student. Parameters are drawn with ``integer LOW HIGH``,
+``uniform LOW HIGH``, ``normal MEAN STD`` or ``choice A B ...``; ``size=N``
+draws a list of values (``$readings`` joins them with commas and
+``$readings_lines`` with line breaks) and ``decimals=D`` rounds them.
+``expr`` computes a value from the previous ones, with ``abs``, ``sqrt``,
+``floor``, ``ceil``, ``round``, ``exp``, ``log``, ``sin``, ``cos`` and the
+per-student ``sum``, ``mean``, ``min`` and ``max``.
+
+The values of the whole group are computed at once with NumPy. Each value
+comes from a counter-based hash of the group seed, the exercise, the
+student folder and the parameter name, so a student always gets the same
+variant, no matter which other students or parameters exist.
+"""
+
+from ast import parse as ast_parse, walk as ast_walk, Name, Call, Load, \
+    Expression, BinOp, UnaryOp, Constant, operator, unaryop
+from configparser import ConfigParser
+from fnmatch import fnmatch
+from hashlib import blake2b
+from re import match as re_match
+from secrets import token_hex
+from shlex import split as shlex_split
+from string import Template
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+VARIANTS_FILE = 'variants.ini'
+
+PARAMETER_KINDS = ('integer', 'uniform', 'normal', 'choice', 'expr')
+
+DEFAULT_DECIMALS = 2
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS variant_seed (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    seed TEXT NOT NULL
+);
+'''
+
+
+def get_group_seed(store):
+    """
+    Returns the seed of the group, creating a random one on first use. It is
+    kept in the group database, so snapshots keep it too.
+
+    :param store: GroupStore of the group.
+    :return: Hexadecimal string.
+    """
+
+    store.ensure_schema(_SCHEMA)
+    with store.transaction() as connection:
+        connection.execute(
+            'INSERT OR IGNORE INTO variant_seed (id, seed) VALUES (0, ?)',
+            (token_hex(16),)
+        )
+        row = connection.execute(
+            'SELECT seed FROM variant_seed WHERE id = 0').fetchone()
+
+    return row[0]
+
+
+def _require_numpy():
+    if numpy is None:
+        raise ImportError('Exercise variants need NumPy. '
+                          'Install it with "pip install numpy"')
+
+
+def _hash64(text):
+    return int.from_bytes(
+        blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def _mix(values):
+    """
+    SplitMix64 finalizer over an array of unsigned 64-bit integers.
+    """
+
+    uint = numpy.uint64
+    with numpy.errstate(over='ignore'):
+        values = values + uint(0x9E3779B97F4A7C15)
+        values = (values ^ (values >> uint(30))) * uint(0xBF58476D1CE4E5B9)
+        values = (values ^ (values >> uint(27))) * uint(0x94D049BB133111EB)
+        return values ^ (values >> uint(31))
+
+
+class Parameter(object):
+    """
+    Parameter of a template, as declared in ``variants.ini``.
+
+    :param name: Placeholder name.
+    :param definition: Kind followed by its arguments.
+    """
+
+    def __init__(self, name, definition):
+        self.name = name
+        self.size = None
+        self.decimals = None
+
+        kind, _, rest = definition.strip().partition(' ')
+        self.kind = kind.lower()
+        if self.kind not in PARAMETER_KINDS:
+            raise ValueError(f'Unknown kind "{kind}" for parameter "{name}". '
+                             f'Use one of {", ".join(PARAMETER_KINDS)}')
+
+        if self.kind == 'expr':
+            found = re_match(r'^(.*?)\s+decimals=(\d+)\s*$', rest)
+            if found:
+                rest, self.decimals = found.group(1), int(found.group(2))
+            self.arguments = [rest.strip()]
+            return
+
+        arguments = []
+        for item in shlex_split(rest):
+            option, _, value = item.partition('=')
+            if option == 'size' and value.isdigit():
+                self.size = max(int(value), 1)
+            elif option == 'decimals' and value.isdigit():
+                self.decimals = int(value)
+            else:
+                arguments.append(item)
+
+        expected = None if self.kind == 'choice' else 2
+        if (expected and len(arguments) != expected) or not arguments:
+            raise ValueError(f'Wrong arguments for parameter "{name}": '
+                             f'"{definition}"')
+
+        if self.kind != 'choice':
+            arguments = [float(argument) for argument in arguments]
+        self.arguments = arguments
+
+
+class VariantTemplate(object):
+    """
+    Exercise template: the parameters and the files they are written into.
+
+    :param parameters: List of Parameter, in declaration order.
+    :param patterns: Glob patterns of the files rendered, relative to the
+                     exercise folder.
+    """
+
+    # Functions allowed in expressions, reducing per student where needed
+    FUNCTIONS = ('abs', 'sqrt', 'floor', 'ceil', 'round', 'exp', 'log',
+                 'sin', 'cos', 'sum', 'mean', 'min', 'max')
+
+    def __init__(self, parameters, patterns):
+        self.parameters = parameters
+        self.patterns = patterns
+
+        self._expressions = {
+            parameter.name: self._compile(parameter)
+            for parameter in parameters if parameter.kind == 'expr'
+        }
+
+    @classmethod
+    def load(cls, file_path):
+        """
+        Reads a ``variants.ini`` file.
+
+        :return: VariantTemplate instance.
+        """
+
+        parser = ConfigParser(strict=False, interpolation=None)
+        parser.optionxform = str
+        parser.read(file_path, encoding='utf-8')
+
+        patterns = [
+            pattern.strip() for pattern
+            in parser.get('variant', 'files', fallback='').split(',')
+            if pattern.strip()
+        ]
+
+        parameters = []
+        if parser.has_section('parameters'):
+            parameters = [
+                Parameter(name, definition)
+                for name, definition in parser['parameters'].items()
+            ]
+
+        return cls(parameters, patterns)
+
+    # -------------------------------------------------------------------------
+    # Public methods
+    # -------------------------------------------------------------------------
+
+    def matches(self, relative):
+        """
+        :param relative: File path relative to the exercise, with ``/``.
+        :return: Whether the file is rendered for each student.
+        """
+
+        return relative != VARIANTS_FILE and any(
+            fnmatch(relative, pattern) for pattern in self.patterns)
+
+    def generate(self, seed, exercise, students):
+        """
+        Computes the values of every student in a single vectorised pass.
+
+        :param seed: Group seed.
+        :param exercise: Identifier of the exercise, such as its path.
+        :param students: Student folder names.
+        :return: Dictionary mapping each parameter name to an array with a
+                 row for every student.
+        """
+
+        _require_numpy()
+
+        keys = numpy.array(
+            [_hash64(f'{seed}/{exercise}/{student}') for student in students],
+            dtype=numpy.uint64
+        ).reshape(-1, 1)
+
+        values = {}
+        for parameter in self.parameters:
+            if parameter.kind == 'expr':
+                result = self._evaluate(parameter, values, len(students))
+            else:
+                result = self._draw(parameter, keys)
+
+            if parameter.decimals is not None \
+                    or result.dtype.kind == 'f':
+                decimals = DEFAULT_DECIMALS if parameter.decimals is None \
+                    else parameter.decimals
+                result = numpy.round(result.astype(float), decimals)
+
+            values[parameter.name] = result
+
+        return values
+
+    def format(self, values, index):
+        """
+        Returns the placeholder values of one student as text.
+
+        :param values: Result of ``generate``.
+        :param index: Position of the student.
+        :return: Dictionary of strings.
+        """
+
+        text = {}
+        for parameter in self.parameters:
+            row = values[parameter.name][index]
+            items = [self._format_value(parameter, value) for value in row]
+
+            if parameter.size is None and len(items) == 1:
+                text[parameter.name] = items[0]
+            else:
+                text[parameter.name] = ', '.join(items)
+                text[parameter.name + '_lines'] = '\n'.join(items)
+
+        return text
+
+    @staticmethod
+    def render(content, text):
+        """
+        Replaces the placeholders of a file. Unknown ones are left as is.
+        """
+
+        return Template(content).safe_substitute(text)
+
+    # -------------------------------------------------------------------------
+    # Auxiliary methods
+    # -------------------------------------------------------------------------
+
+    @staticmethod
+    def _uniform(keys, stream, size):
+        """
+        Uniform values in [0, 1), one row per student. The value depends only
+        on the student key, the stream and the position in the row.
+        """
+
+        counters = numpy.arange(size, dtype=numpy.uint64).reshape(1, -1)
+        with numpy.errstate(over='ignore'):
+            bits = _mix(keys ^ _mix(counters + numpy.uint64(stream)))
+
+        return (bits >> numpy.uint64(11)).astype(float) * 2.0 ** -53
+
+    def _draw(self, parameter, keys):
+        size = parameter.size or 1
+        stream = _hash64(parameter.name)
+        arguments = parameter.arguments
+        uniform = self._uniform(keys, stream, size)
+
+        if parameter.kind == 'integer':
+            low, high = int(arguments[0]), int(arguments[1])
+            return low + numpy.floor(
+                uniform * (high - low + 1)).astype(numpy.int64)
+
+        if parameter.kind == 'uniform':
+            low, high = arguments
+            return low + uniform * (high - low)
+
+        if parameter.kind == 'normal':
+            # Box-Muller, with a second stream for the angle
+            mean, deviation = arguments
+            angle = self._uniform(keys, stream ^ 0x5DEECE66D, size)
+            radius = numpy.sqrt(-2.0 * numpy.log1p(-uniform))
+            return mean + deviation * radius * numpy.cos(2 * numpy.pi * angle)
+
+        options = numpy.array(arguments, dtype=object)
+        return options[numpy.floor(uniform * len(options)).astype(int)]
+
+    def _compile(self, parameter):
+        expression = parameter.arguments[0]
+        try:
+            tree = ast_parse(expression, mode='eval')
+        except SyntaxError:
+            raise ValueError(f'Invalid expression for "{parameter.name}": '
+                             f'{expression}')
+
+        allowed = (Expression, BinOp, UnaryOp, Constant, Name, Call, Load,
+                   operator, unaryop)
+        for node in ast_walk(tree):
+            if not isinstance(node, allowed) or (
+                    isinstance(node, Call)
+                    and not (isinstance(node.func, Name)
+                             and node.func.id in self.FUNCTIONS)):
+                raise ValueError(f'Expression of "{parameter.name}" can only '
+                                 f'use numbers, parameters and '
+                                 f'{", ".join(self.FUNCTIONS)}')
+
+        return compile(tree, parameter.name, 'eval')
+
+    def _evaluate(self, parameter, values, count):
+        def per_student(function):
+            return lambda array: function(array, axis=1, keepdims=True)
+
+        namespace = {
+            'abs': numpy.abs, 'sqrt': numpy.sqrt, 'floor': numpy.floor,
+            'ceil': numpy.ceil, 'round': numpy.round, 'exp': numpy.exp,
+            'log': numpy.log, 'sin': numpy.sin, 'cos': numpy.cos,
+            'sum': per_student(numpy.sum), 'mean': per_student(numpy.mean),
+            'min': per_student(numpy.min), 'max': per_student(numpy.max),
+        }
+        namespace.update(values)
+
+        try:
+            result = eval(self._expressions[parameter.name],
+                          {'__builtins__': {}}, namespace)
+        except NameError as ex:
+            raise ValueError(f'Expression of "{parameter.name}" uses an '
+                             f'unknown name. {ex}')
+
+        result = numpy.asarray(result)
+        result = numpy.broadcast_to(
+            result.reshape(count, -1) if result.ndim else result,
+            (count, result.shape[-1] if result.ndim > 1 else 1)
+        )
+
+        if result.shape[1] > 1:
+            parameter.size = result.shape[1]
+
+        return result
+
+    @staticmethod
+    def _format_value(parameter, value):
+        if isinstance(value, str):
+            return value
+
+        if isinstance(value, (numpy.integer, int)):
+            return str(int(value))
+
+        decimals = DEFAULT_DECIMALS if parameter.decimals is None \
+            else parameter.decimals
+        if decimals == 0:
+            return str(int(round(float(value))))
+
+        return f'{float(value):.{decimals}f}'
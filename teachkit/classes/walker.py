@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+Tree walker
+===========
+Iterates over folder trees without recursion. The walker keeps one open
+``os.scandir`` iterator per level of the current branch, so the memory used
+depends on the depth of the tree and not on the number of entries in it.
+
+Entries can be filtered by name (``desktop.ini``), hidden state and include
+or exclude glob patterns. When symbolic links to folders are followed, a
+folder already open in the current branch is never entered again.
+"""
+
+from os import path, scandir, stat, name as os_name
+from fnmatch import fnmatch
+
+SKIP_NAMES = ('desktop.ini',)
+
+# Windows hidden attribute, as reported by os.stat().st_file_attributes
+FILE_ATTRIBUTE_HIDDEN = 0x02
+
+
+class WalkEntry(object):
+    """
+    File or folder found by the walker.
+
+    :param entry: os.DirEntry returned by scandir.
+    :param relative: Path relative to the root, using ``/`` as separator.
+    :param is_dir: Whether the entry is a folder.
+    """
+
+    __slots__ = ('path', 'name', 'relative', 'is_dir', '_entry')
+
+    def __init__(self, entry, relative, is_dir):
+        self.path = entry.path
+        self.name = entry.name
+        self.relative = relative
+        self.is_dir = is_dir
+
+        self._entry = entry
+
+    def stat(self):
+        """
+        :return: Stat result of the entry, or of the file or folder it links
+                 to, cached by scandir.
+        """
+
+        return self._entry.stat()
+
+
+class TreeWalker(object):
+    """
+    Iterative walker with filtering.
+
+    :param skip_names: File and folder names that are never returned.
+    :param hidden: Return hidden files and folders.
+    :param include: Glob patterns files must match to be returned. They are
+                    matched against both the name and the relative path.
+    :param exclude: Glob patterns of files and folders to leave out. An
+                    excluded folder is not entered.
+    :param follow_symlinks: Enter symbolic links to folders. Links to files
+                            are always returned.
+    """
+
+    def __init__(self, skip_names=SKIP_NAMES, hidden=True, include=None,
+                 exclude=None, follow_symlinks=False):
+        self._skip_names = frozenset(skip_names or ())
+        self._hidden = hidden
+        self._include = tuple(include or ())
+        self._exclude = tuple(exclude or ())
+        self._follow = follow_symlinks
+
+    # -------------------------------------------------------------------------
+    # Public methods
+    # -------------------------------------------------------------------------
+
+    def walk(self, root, topdown=True, on_leave=None):
+        """
+        Yields every file and folder below ``root``, depth first.
+
+        :param root: Folder to walk.
+        :param topdown: Yield each folder before its contents. With False it
+                        is yielded once all its contents have been.
+        :param on_leave: Callable receiving each folder once all its
+                         contents have been yielded.
+        :return: Generator of WalkEntry.
+        """
+
+        root = path.abspath(root)
+        if not path.isdir(root):
+            return
+
+        ancestors = {self._folder_key(root)}
+        stack = [(scandir(root), '', None, None)]
+
+        try:
+            while stack:
+                iterator, prefix, folder, key = stack[-1]
+
+                entry = next(iterator, None)
+                if entry is None:
+                    iterator.close()
+                    stack.pop()
+                    ancestors.discard(key)
+                    if folder is not None:
+                        if on_leave is not None:
+                            on_leave(folder)
+                        if not topdown:
+                            yield folder
+                    continue
+
+                is_dir = self._is_dir(entry)
+                if not self._accept(entry, prefix + entry.name, is_dir):
+                    continue
+
+                item = WalkEntry(entry, prefix + entry.name, is_dir)
+                if not is_dir:
+                    yield item
+                    continue
+
+                key = self._folder_key(entry.path, entry)
+                if key in ancestors:
+                    continue
+
+                if topdown:
+                    yield item
+
+                try:
+                    children = scandir(entry.path)
+                except OSError:
+                    if on_leave is not None:
+                        on_leave(item)
+                    if not topdown:
+                        yield item
+                    continue
+
+                ancestors.add(key)
+                stack.append((children, item.relative + '/', item, key))
+        finally:
+            for iterator, _, _, _ in stack:
+                iterator.close()
+
+    def files(self, root):
+        """
+        Yields every file below ``root``.
+
+        :param root: Folder to walk.
+        :return: Generator of WalkEntry.
+        """
+
+        for entry in self.walk(root):
+            if not entry.is_dir:
+                yield entry
+
+    def scan(self, folder):
+        """
+        Yields the direct contents of a single folder, with the same
+        filters as ``walk``.
+
+        :param folder: Folder to list.
+        :return: Generator of WalkEntry.
+        """
+
+        with scandir(folder) as entries:
+            for entry in entries:
+                is_dir = self._is_dir(entry)
+                if self._accept(entry, entry.name, is_dir):
+                    yield WalkEntry(entry, entry.name, is_dir)
+
+    # -------------------------------------------------------------------------
+    # Auxiliary methods
+    # -------------------------------------------------------------------------
+
+    def _is_dir(self, entry):
+        try:
+            return entry.is_dir(follow_symlinks=self._follow)
+        except OSError:
+            return False
+
+    def _accept(self, entry, relative, is_dir):
+        name = entry.name
+
+        if name in self._skip_names:
+            return False
+
+        # Links to files are always returned, links to folders only when
+        # they are followed
+        if not is_dir and not entry.is_file():
+            return False
+
+        if not self._hidden and self._is_hidden(entry):
+            return False
+
+        if self._matches(name, relative, self._exclude):
+            return False
+
+        if self._include and not is_dir:
+            return self._matches(name, relative, self._include)
+
+        return True
+
+    @staticmethod
+    def _matches(name, relative, patterns):
+        return any(
+            fnmatch(name, pattern) or fnmatch(relative, pattern)
+            for pattern in patterns
+        )
+
+    @staticmethod
+    def _is_hidden(entry):
+        if entry.name.startswith('.'):
+            return True
+
+        # Only Windows has a hidden attribute, and there scandir already
+        # knows it without another system call
+        if os_name != 'nt':
+            return False
+
+        try:
+            attributes = getattr(entry.stat(), 'st_file_attributes', 0)
+        except OSError:
+            return False
+
+        return bool(attributes & FILE_ATTRIBUTE_HIDDEN)
+
+    def _folder_key(self, folder, entry=None):
+        """
+        Identifies a folder by device and inode. Only needed to detect loops
+        when links are followed; otherwise the path is enough.
+        """
+
+        if not self._follow:
+            return folder
+
+        try:
+            folder_stat = entry.stat() if entry is not None else stat(folder)
+        except OSError:
+            return folder
+
+        # Some network file systems report no inode numbers at all
+        if not folder_stat.st_ino:
+            return path.realpath(folder)
+
+        return folder_stat.st_dev, folder_stat.st_ino
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+File writer
+===========
+Writes small generated files (desktop.ini, group.ini, ...) only when their
+content actually changes. Changes are written to a temporary file that
+replaces the target with a rename, so readers never see a half written file.
+Inside a batch, the fsync calls for every written file and folder are
+issued together when the batch ends. Rewritten files keep the permissions
+they had, and new ones get the usual ones for the process umask.
+"""
+
+from os import path, replace, remove, fsync, stat, chmod, umask, \
+    open as os_open, close as os_close, O_RDONLY
+from contextlib import contextmanager
+from hashlib import blake2b
+from tempfile import mkstemp
+from threading import RLock
+from stat import S_IMODE
+
+
+def _read_umask():
+    # The umask can only be read by setting it, so it is done once, at
+    # import time, before any thread could create files
+    mask = umask(0)
+    umask(mask)
+    return mask
+
+
+# Permissions of the files that did not exist yet
+_NEW_FILE_MODE = 0o666 & ~_read_umask()
+
+
+class FileWriter(object):
+    """
+    Writes files atomically, skipping the ones whose content is unchanged.
+
+    :param durable: Flush data and folder entries to disk with fsync.
+    """
+
+    def __init__(self, durable=True):
+        self._durable = durable
+        self._lock = RLock()
+
+        self._digests = {}
+        self._pending = None
+
+    # -------------------------------------------------------------------------
+    # Public methods
+    # -------------------------------------------------------------------------
+
+    def write(self, file_path, content, encoding='utf-8', before=None,
+              after=None):
+        """
+        Writes ``content`` to ``file_path`` if it differs from the file on
+        disk.
+
+        :param file_path: Target file.
+        :param content: Text or bytes to write.
+        :param encoding: Encoding used when ``content`` is text.
+        :param before: Callable run with the target path just before it is
+                       replaced, e.g. to clear read-only attributes.
+        :param after: Callable run with the target path once it is replaced.
+        :return: True if the file was written, False if it was unchanged.
+        """
+
+        if isinstance(content, str):
+            content = content.encode(encoding)
+
+        digest = blake2b(content, digest_size=16).digest()
+        if not self.has_changed(file_path, content, digest):
+            return False
+
+        folder = path.dirname(path.abspath(file_path))
+        handle, temp_path = mkstemp(prefix='.tk-', suffix='.tmp', dir=folder)
+        try:
+            with open(handle, 'wb') as stream:
+                stream.write(content)
+                if self._durable and self._pending is None:
+                    stream.flush()
+                    fsync(stream.fileno())
+        except BaseException:
+            remove(temp_path)
+            raise
+
+        # mkstemp creates the file for its owner only. The mode is set when
+        # committing, after the deferred fsync, which needs to open the file
+        # for writing and would fail on a read-only mode
+        entry = (temp_path, file_path, digest, self._get_mode(file_path),
+                 before, after)
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(entry)
+                return True
+
+        self._commit([entry], synced=True)
+        return True
+
+    def has_changed(self, file_path, content, digest=None):
+        """
+        Tells whether ``content`` differs from the current file contents. A
+        digest cached from a previous write is used while the file keeps the
+        same size and modification time, otherwise the file is read back.
+
+        :param file_path: Target file.
+        :param content: Bytes that would be written.
+        :param digest: Precomputed digest of ``content``.
+        :return: True if the file is missing or its content is different.
+        """
+
+        try:
+            file_stat = stat(file_path)
+        except FileNotFoundError:
+            return True
+
+        if file_stat.st_size != len(content):
+            return True
+
+        digest = digest or blake2b(content, digest_size=16).digest()
+        signature = (file_stat.st_size, file_stat.st_mtime_ns)
+
+        cached = self._digests.get(file_path)
+        if cached and cached[0] == signature:
+            return cached[1] != digest
+
+        with open(file_path, 'rb') as stream:
+            current = stream.read()
+
+        current_digest = blake2b(current, digest_size=16).digest()
+        self._digests[file_path] = (signature, current_digest)
+
+        return current_digest != digest
+
+    @contextmanager
+    def batch(self):
+        """
+        Defers the replacement of every file written inside the block until
+        it ends, so that all the data and folder fsync calls are issued once.
+        Nested batches are merged into the outermost one. If a file cannot
+        be replaced, the temporary files of the ones left are removed.
+        """
+
+        with self._lock:
+            outermost = self._pending is None
+            if outermost:
+                self._pending = []
+
+        try:
+            yield self
+        finally:
+            if outermost:
+                with self._lock:
+                    entries, self._pending = self._pending, None
+                self._commit(entries, synced=False)
+
+    # -------------------------------------------------------------------------
+    # Auxiliary methods
+    # -------------------------------------------------------------------------
+
+    def _commit(self, entries, synced):
+        """
+        Replaces the targets of the entries with their temporary files. If
+        any of them fails, the temporary files not committed yet are removed
+        before the error is raised.
+        """
+
+        if not entries:
+            return
+
+        committed = 0
+        folders = set()
+        try:
+            if self._durable and not synced:
+                for temp_path, *_ in entries:
+                    self._fsync_path(temp_path)
+
+            for temp_path, file_path, digest, mode, before, after in entries:
+                chmod(temp_path, mode)
+                if before and path.exists(file_path):
+                    before(file_path)
+
+                replace(temp_path, file_path)
+                committed += 1
+                folders.add(path.dirname(path.abspath(file_path)))
+
+                file_stat = stat(file_path)
+                signature = (file_stat.st_size, file_stat.st_mtime_ns)
+                self._digests[file_path] = (signature, digest)
+
+                if after:
+                    after(file_path)
+        except BaseException:
+            self._discard(entries[committed:])
+            raise
+
+        if self._durable:
+            for folder in folders:
+                self._fsync_folder(folder)
+
+    @staticmethod
+    def _discard(entries):
+        for temp_path, *_ in entries:
+            try:
+                remove(temp_path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _get_mode(file_path):
+        try:
+            return S_IMODE(stat(file_path).st_mode)
+        except FileNotFoundError:
+            return _NEW_FILE_MODE
+
+    @staticmethod
+    def _fsync_path(file_path):
+        with open(file_path, 'rb+') as stream:
+            fsync(stream.fileno())
+
+    @staticmethod
+    def _fsync_folder(folder):
+        # Folders cannot be opened on Windows, where renames are durable
+        try:
+            handle = os_open(folder, O_RDONLY)
+        except OSError:
+            return
+
+        try:
+            fsync(handle)
+        except OSError:
+            pass
+        finally:
+            os_close(handle)
+
+
+_default_writer = FileWriter()
+
+
+def get_writer():
+    """
+    Returns the writer shared by the whole process.
+
+    :return: Instance of FileWriter.
+    """
+
+    return _default_writer
@@ -0,0 +1,84 @@
+import os
+import unittest
+from os import path
+from tempfile import TemporaryDirectory
+
+from teachkit.classes.copier import FileCopier, PART_SUFFIX, \
+    PART_STATE_SUFFIX
+
+CHUNK = 4096
+
+
+class Interrupted(Exception):
+    pass
+
+
+def interrupt_after_first_chunk(copied, total, source):
+    if copied >= CHUNK:
+        raise Interrupted()
+
+
+class FileCopierResumeTest(unittest.TestCase):
+
+    def setUp(self):
+        self._folder = TemporaryDirectory()
+        self.source = path.join(self._folder.name, 'source.bin')
+        self.target = path.join(self._folder.name, 'target.bin')
+
+    def tearDown(self):
+        self._folder.cleanup()
+
+    def _write_source(self, content, mtime):
+        with open(self.source, 'wb') as stream:
+            stream.write(content)
+        os.utime(self.source, (mtime, mtime))
+
+    def _interrupted_copy(self):
+        copier = FileCopier(chunk_size=CHUNK,
+                            progress=interrupt_after_first_chunk)
+        with self.assertRaises(Interrupted):
+            copier.copy_file(self.source, self.target)
+
+        self.assertTrue(path.exists(self.target + PART_SUFFIX))
+
+    def _read_target(self):
+        with open(self.target, 'rb') as stream:
+            return stream.read()
+
+    def test_resume_unchanged_source(self):
+        content = os.urandom(CHUNK * 3)
+        self._write_source(content, 1_000_000)
+        self._interrupted_copy()
+
+        written = FileCopier(chunk_size=CHUNK).copy_file(
+            self.source, self.target)
+
+        self.assertEqual(self._read_target(), content)
+        self.assertLess(written, len(content))
+        self.assertFalse(path.exists(self.target + PART_STATE_SUFFIX))
+
+    def test_restart_when_source_changed(self):
+        self._write_source(b'OLD' * CHUNK, 1_000_000)
+        self._interrupted_copy()
+
+        new_content = b'NEW' * CHUNK
+        self._write_source(new_content, 2_000_000)
+
+        written = FileCopier(chunk_size=CHUNK).copy_file(
+            self.source, self.target)
+
+        self.assertEqual(self._read_target(), new_content)
+        self.assertEqual(written, len(new_content))
+
+    def test_restart_without_source_state(self):
+        self._write_source(b'NEW' * CHUNK, 2_000_000)
+        with open(self.target + PART_SUFFIX, 'wb') as stream:
+            stream.write(b'OLD' * 100)
+
+        FileCopier(chunk_size=CHUNK).copy_file(self.source, self.target)
+
+        self.assertEqual(self._read_target(), b'NEW' * CHUNK)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+import logging
+import os
+import unittest
+from os import path
+from tempfile import TemporaryDirectory
+from time import time
+
+from teachkit.classes.logfiles import CompressingRotatingFileHandler, \
+    LogArchive, PENDING_SUFFIX, WORK_SUFFIX, STALE_WORK_SECONDS
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+
+class Failure(Exception):
+    pass
+
+
+class LogArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self._folder = TemporaryDirectory()
+        self.file_path = path.join(self._folder.name, 'teachkit.log')
+        self.archive = LogArchive(self.file_path, LOG_FORMAT, 50, 1024)
+
+    def tearDown(self):
+        self._folder.cleanup()
+
+    def _files(self, suffix):
+        return [name for name in os.listdir(self._folder.name)
+                if name.endswith(suffix)]
+
+    def _write_rotated(self, suffix, count):
+        file_path = self.archive.reserve()[:-len(PENDING_SUFFIX)] + suffix
+        with open(file_path, 'w', encoding='utf-8') as stream:
+            for number in range(count):
+                stream.write(f'2024-10-01 09:30:12,345 - INFO - '
+                             f'rotated {number}\n')
+        return file_path
+
+    def _messages(self, **conditions):
+        return [entry.text.rsplit(' - ', 1)[-1]
+                for entry in self.archive.query(**conditions)]
+
+    def test_rotate_compress_and_query(self):
+        handler = CompressingRotatingFileHandler(
+            self.file_path, LOG_FORMAT, max_bytes=2048, backup_count=50,
+            block_size=1024)
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+        logger = logging.getLogger(f'{__name__}.rotation')
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        logger.addHandler(handler)
+        try:
+            for number in range(500):
+                level = logging.WARNING if number % 100 == 0 \
+                    else logging.INFO
+                logger.log(level, 'message %s', number)
+        finally:
+            logger.removeHandler(handler)
+            handler.close()
+
+        archive = handler.archive
+        self.assertGreater(len(archive.segments()), 1)
+        self.assertEqual(archive.pending(), [])
+        self.assertEqual(self._files(WORK_SUFFIX), [])
+
+        messages = [entry.text.rsplit(' - ', 1)[-1]
+                    for entry in archive.query()]
+        self.assertEqual(messages, [f'message {n}' for n in range(500)])
+
+        warnings = [entry.text.rsplit(' - ', 1)[-1]
+                    for entry in archive.query(level='warning')]
+        self.assertEqual(warnings, [f'message {n}' for n in range(0, 500, 100)])
+
+    def test_recover_failed_compression(self):
+        self._write_rotated(PENDING_SUFFIX, 20)
+
+        write_block = LogArchive._write_block
+
+        def fail(*args):
+            raise Failure()
+
+        self.archive._write_block = fail
+        with self.assertRaises(Failure):
+            self.archive.compress_pending()
+
+        self.assertEqual(len(self.archive.pending()), 1)
+        self.assertEqual(self._files(WORK_SUFFIX), [])
+        self.assertEqual(self._files('.tmp'), [])
+        self.assertEqual(self.archive.segments(), [])
+        self.assertEqual(len(self._messages()), 20)
+
+        self.archive._write_block = write_block
+        self.archive.compress_pending()
+
+        self.assertEqual(self.archive.pending(), [])
+        self.assertEqual(len(self.archive.segments()), 1)
+        self.assertEqual(self._messages(),
+                         [f'rotated {n}' for n in range(20)])
+
+    def test_recover_stale_work_file(self):
+        work_path = self._write_rotated(WORK_SUFFIX, 10)
+
+        # Still being compressed: read, but not claimed again
+        self.assertEqual(self.archive.pending(), [])
+        self.assertEqual(len(self._messages()), 10)
+
+        claimed = time() - STALE_WORK_SECONDS - 1
+        os.utime(work_path, (claimed, claimed))
+        self.archive.compress_pending()
+
+        self.assertEqual(self._files(WORK_SUFFIX), [])
+        self.assertEqual(len(self.archive.segments()), 1)
+        self.assertEqual(self._messages(),
+                         [f'rotated {n}' for n in range(10)])
+
+    def _leave_work_file(self, pending_path, content):
+        # Left by a process that ended while compressing the file
+        work_path = pending_path[:-len(PENDING_SUFFIX)] + WORK_SUFFIX
+        with open(work_path, 'w', encoding='utf-8') as stream:
+            stream.write(content)
+        claimed = time() - STALE_WORK_SECONDS - 1
+        os.utime(work_path, (claimed, claimed))
+
+    def _index_lines(self):
+        with open(self.archive.index_path, encoding='utf-8') as stream:
+            return stream.readlines()
+
+    def test_drop_work_file_of_published_segment(self):
+        pending_path = self._write_rotated(PENDING_SUFFIX, 10)
+        with open(pending_path, encoding='utf-8') as stream:
+            content = stream.read()
+        self.archive.compress_pending()
+
+        self._leave_work_file(pending_path, content)
+
+        self.assertEqual(len(self._messages()), 10)
+        self.assertEqual(self._files(WORK_SUFFIX), [])
+
+    def test_replace_index_of_unpublished_segment(self):
+        pending_path = self._write_rotated(PENDING_SUFFIX, 10)
+        with open(pending_path, encoding='utf-8') as stream:
+            content = stream.read()
+        self.archive.compress_pending()
+        index = self._index_lines()
+
+        # Indexed, but the process ended before publishing the segment
+        os.remove(self.archive.segments()[0])
+        self._leave_work_file(pending_path, content)
+        self.archive.compress_pending()
+
+        self.assertEqual(self._index_lines(), index)
+        self.assertEqual(self._messages(),
+                         [f'rotated {n}' for n in range(10)])
+
+if __name__ == '__main__':
+    unittest.main()
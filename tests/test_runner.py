@@ -0,0 +1,52 @@
+import unittest
+from tempfile import TemporaryDirectory
+
+from teachkit.classes.runner import ScriptRunner, MERGED
+
+
+class ScriptRunnerMergeTest(unittest.TestCase):
+
+    def setUp(self):
+        self._folder = TemporaryDirectory()
+        self.runner = ScriptRunner(self._folder.name)
+
+    def tearDown(self):
+        self._folder.cleanup()
+
+    def _plan(self, *lines):
+        return self.runner.plan(lines)
+
+    def test_merge_repeated_resource_actions(self):
+        for action in ('add', 'set'):
+            script_lines, operations = self._plan(
+                f'resource {action} physics kinematics 12',
+                f'resource {action} physics kinematics 12',
+            )
+
+            self.assertEqual(len(operations), 1)
+            self.assertEqual(script_lines[1].status, MERGED)
+            self.assertEqual(len(operations[0].lines), 2)
+
+    def test_keep_different_exercises(self):
+        script_lines, operations = self._plan(
+            'resource set physics kinematics 12',
+            'resource set physics kinematics 13',
+        )
+
+        self.assertEqual(len(operations), 2)
+        self.assertNotEqual(script_lines[1].status, MERGED)
+
+    def test_set_waits_for_the_student_it_adds(self):
+        script_lines, operations = self._plan(
+            'student add "Student Number1"',
+            'student set team A --students student_number1',
+            'student get team --students student_number1',
+        )
+
+        self.assertEqual(len(operations), 3)
+        self.assertIn(0, operations[1].depends_on)
+        self.assertIn(1, operations[2].depends_on)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import os
+import unittest
+from io import BytesIO
+from time import perf_counter
+
+from teachkit.classes import snapshot
+from teachkit.classes.snapshot import ContentChunker
+
+CHUNK_SIZE = 16 * 1024
+
+
+def cut_with_loop(chunker, data, eof):
+    numpy = snapshot.numpy
+    snapshot.numpy = None
+    try:
+        return chunker.cut(data, eof)
+    finally:
+        snapshot.numpy = numpy
+
+
+@unittest.skipIf(snapshot.numpy is None, 'NumPy is not installed')
+class ContentChunkerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.chunker = ContentChunker(CHUNK_SIZE)
+
+    def test_same_cuts_as_loop(self):
+        data = bytearray(os.urandom(CHUNK_SIZE * 64))
+        data[CHUNK_SIZE * 8:CHUNK_SIZE * 16] = bytes(CHUNK_SIZE * 8)
+
+        while data:
+            eof = len(data) < self.chunker.max_size
+            length = self.chunker.cut(data, eof)
+            self.assertEqual(length, cut_with_loop(self.chunker, data, eof))
+            del data[:length]
+
+    def test_split_keeps_content(self):
+        data = os.urandom(CHUNK_SIZE * 32)
+        chunks = list(self.chunker.split(BytesIO(data)))
+
+        self.assertEqual(b''.join(chunks), data)
+        self.assertTrue(all(len(chunk) <= self.chunker.max_size
+                            for chunk in chunks))
+
+    def test_throughput(self):
+        data = os.urandom(32 * 1024 * 1024)
+
+        start = perf_counter()
+        for _ in ContentChunker().split(BytesIO(data)):
+            pass
+        elapsed = perf_counter() - start
+
+        # The byte loop chunked about 5 MB/s
+        self.assertGreater(len(data) / elapsed, 20 * 1024 * 1024)
+
+
+if __name__ == '__main__':
+    unittest.main()
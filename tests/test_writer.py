@@ -0,0 +1,89 @@
+import os
+import stat
+import unittest
+from os import path
+from tempfile import TemporaryDirectory
+
+from teachkit.classes.writer import FileWriter
+
+
+class Failure(Exception):
+    pass
+
+
+def fail(file_path):
+    raise Failure(file_path)
+
+
+class FileWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self._folder = TemporaryDirectory()
+        self.folder = self._folder.name
+        self.writer = FileWriter()
+
+    def tearDown(self):
+        for name in os.listdir(self.folder):
+            os.chmod(path.join(self.folder, name), 0o644)
+        self._folder.cleanup()
+
+    def _path(self, name):
+        return path.join(self.folder, name)
+
+    def _read(self, name):
+        with open(self._path(name), 'rb') as stream:
+            return stream.read()
+
+    def _temp_files(self):
+        return [name for name in os.listdir(self.folder)
+                if name.endswith('.tmp')]
+
+    def test_keep_mode_of_read_only_target_in_batch(self):
+        file_path = self._path('key.csv')
+        with open(file_path, 'wb') as stream:
+            stream.write(b'old')
+        os.chmod(file_path, 0o444)
+
+        with self.writer.batch():
+            self.writer.write(file_path, 'new')
+            self.writer.write(self._path('other.csv'), 'other')
+
+        self.assertEqual(self._read('key.csv'), b'new')
+        self.assertEqual(stat.S_IMODE(os.stat(file_path).st_mode), 0o444)
+        self.assertEqual(self._read('other.csv'), b'other')
+        self.assertEqual(self._temp_files(), [])
+
+    def test_skip_unchanged_content(self):
+        file_path = self._path('a.txt')
+
+        self.assertTrue(self.writer.write(file_path, 'same'))
+        self.assertFalse(self.writer.write(file_path, 'same'))
+
+    def test_remove_temp_files_when_batch_fails(self):
+        with open(self._path('b.txt'), 'wb') as stream:
+            stream.write(b'old')
+
+        with self.assertRaises(Failure):
+            with self.writer.batch():
+                self.writer.write(self._path('a.txt'), 'a')
+                self.writer.write(self._path('b.txt'), 'b', before=fail)
+                self.writer.write(self._path('c.txt'), 'c')
+
+        self.assertEqual(self._temp_files(), [])
+        self.assertEqual(self._read('a.txt'), b'a')
+        self.assertEqual(self._read('b.txt'), b'old')
+        self.assertFalse(path.exists(self._path('c.txt')))
+
+    def test_remove_temp_file_when_write_fails(self):
+        with open(self._path('a.txt'), 'wb') as stream:
+            stream.write(b'old')
+
+        with self.assertRaises(Failure):
+            self.writer.write(self._path('a.txt'), 'new', before=fail)
+
+        self.assertEqual(self._temp_files(), [])
+        self.assertEqual(self._read('a.txt'), b'old')
+
+
+if __name__ == '__main__':
+    unittest.main()